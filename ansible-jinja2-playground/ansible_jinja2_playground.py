@@ -1,5 +1,6 @@
 import json
 import os
+import re
 import configparser
 import datetime
 import base64
@@ -7,11 +8,20 @@ import yaml
 import uuid
 import ast
 import time
-
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import threading
+import contextlib
+import concurrent.futures
+import hashlib
+import pickle
+import collections
+import weakref
+from collections.abc import Mapping
+import hmac
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 from jinja2.sandbox import SandboxedEnvironment as Environment
-from jinja2 import StrictUndefined
+from jinja2 import StrictUndefined, meta
 from ansible.plugins.filter.core import FilterModule as CoreFilters
 from ansible.plugins.filter.mathstuff import FilterModule as MathFilters
 from ansible.plugins.filter.urls import FilterModule as UrlFilters
@@ -21,6 +31,19 @@ from ansible.plugins.test.core import TestModule as CoreTests
 from ansible.plugins.test.files import TestModule as FileTests
 from ansible.plugins.test.mathstuff import TestModule as MathTests
 from ansible.plugins.test.uri import TestModule as UriTests
+from playground_metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from playground_profiling import profile_call, sample_server
+from playground_ingest import ingest_ansible_vars
+from playground_blobs import BlobStore
+from playground_forms import FormError, read_form
+from playground_async import AsyncHTTPServer, Broadcaster, event_stream
+from playground_wsgi import WSGIApplication
+from playground_lazyjson import LazyIndex, LazyJSONError, LazyObject
+from playground_memo import FilterMemo
+from playground_renders import RenderFlights, RenderSlots, RenderSuperseded, is_deterministic
+from playground_storage import FileLock, atomic_write
+from playground_inputs import (InputCatalog, InputFileError, RangeNotSatisfiable, STREAM_MIN_BYTES, parse_range,
+                               send_file, utf8_prefix)
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
@@ -28,23 +51,62 @@ SCRIPT_BASE = os.path.splitext(os.path.basename(__file__))[0]
 HTML_FILE_PATH = os.path.join(CURRENT_DIR, SCRIPT_BASE + '.html')
 CONF_PATH = os.path.join(CURRENT_DIR, 'conf', SCRIPT_BASE + '.conf')
 JSON_HISTORY_PATH = os.path.join(CURRENT_DIR, 'conf', SCRIPT_BASE + '_history.json')
+BLOB_DIR = os.path.join(CURRENT_DIR, 'conf', SCRIPT_BASE + '_blobs')
 
 # Load or create configuration
 config = configparser.ConfigParser()
 
+# Held while the configuration file is read and rewritten, across threads and processes
+CONFIG_LOCK = FileLock(CONF_PATH + '.lock')
+
 # Default configuration values
 default_config = {
     'server': {
         'host': '0.0.0.0',
-        'port': '8000'
+        'port': '8000',
+        'max_body_bytes': '67108864',
+        'core': 'threading',
+        'workers': '0'
+    },
+    'history': {
+        'max_entries': '1000',
+        'duplicates': 'consecutive',
+        'blob_min_bytes': '4096',
+        'blob_compression': 'zlib',
+        'record_outputs': 'false'
     },
-    'history': {'max_entries': '1000'},
     'input_files': {
         'directory': 'inputs',
-        'refresh_interval': '30'
+        'refresh_interval': '30',
+        'watch': 'auto',
+        'poll_interval': '2'
     },
     'listener': {
-        'refresh_interval': '5'
+        'refresh_interval': '5',
+        'max_body_bytes': '134217728'
+    },
+    'cache': {
+        'template_entries': '256',
+        'input_entries': '32',
+        'input_max_bytes': '67108864',
+        'blob_entries': '8',
+        'blob_max_bytes': '67108864',
+        'input_file_entries': '64',
+        'input_file_max_bytes': '67108864',
+        'result_entries': '256',
+        'result_max_bytes': '67108864',
+        'variable_digest_entries': '4096',
+        'filter_memo_entries': '4096'
+    },
+    'render': {
+        'lazy_json_min_bytes': '8388608',
+        'host_workers': '4',
+        'max_hosts': '1000',
+        'filter_memo': 'off'
+    },
+    'debug': {
+        'admin_token': '',
+        'profile_max_seconds': '60'
     },
     'user': {
         'theme': 'dark',
@@ -65,7 +127,7 @@ def entries_are_identical(entry1, entry2):
     return False
 
   # Compare all fields except datetime
-  fields_to_compare = ['input', 'expr', 'enable_loop', 'loop_variable']
+  fields_to_compare = ['input', 'input_blob', 'expr', 'enable_loop', 'loop_variable']
 
   for field in fields_to_compare:
     if entry1.get(field) != entry2.get(field):
@@ -74,6 +136,67 @@ def entries_are_identical(entry1, entry2):
   return True
 
 
+def entry_signature(entry):
+  """
+  Digest of the fields compared by entries_are_identical.
+  Inputs are identified by the sha256 of their text, which is also their blob digest.
+  """
+  input_digest = entry.get('input_blob')
+  if not input_digest and 'input' in entry:
+    input_digest = hashlib.sha256(entry['input'].encode('utf-8')).hexdigest()
+  key = [input_digest, entry.get('expr'), entry.get('enable_loop'), entry.get('loop_variable')]
+  return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+
+def upgrade_history_entries(entries, store_blobs=True):
+  """
+  Convert entries of the legacy history format (base64 encoded input/expr)
+  to plain text, moving large inputs to the blob store unless store_blobs
+  is False (the upgrade is then only kept in memory).
+  """
+  upgraded = []
+  for entry in entries:
+    e = entry.copy()
+    for field in ('input', 'expr'):
+      if field in e:
+        try:
+          e[field] = base64.b64decode(e[field]).decode('utf-8')
+        except Exception:
+          pass
+    if store_blobs and len(e.get('input', '')) >= BLOB_MIN_BYTES:
+      e['input_blob'] = BLOB_STORE.put_text(e.pop('input'))
+    upgraded.append(e)
+  return upgraded
+
+
+def decode_history_entries(raw_history):
+  """
+  Prepare stored history entries for the web interface.
+  Inputs stored as blobs are read back from the blob store.
+  """
+  decoded = []
+  for entry in raw_history:
+    e = entry.copy()
+    if 'input_blob' in e:
+      try:
+        e['input'] = BLOB_STORE.get_text(e.pop('input_blob'))
+      except Exception:
+        e['input'] = ''
+    # Recorded outputs are only used by replay_history.py
+    e.pop('output', None)
+    e.pop('output_blob', None)
+    # Handle enable_loop as boolean (no base64 needed) - only if it exists
+    if 'enable_loop' in e:
+      e['enable_loop'] = e.get('enable_loop', False)
+      if isinstance(e['enable_loop'], str):
+        e['enable_loop'] = e['enable_loop'].lower() == 'true'
+    # Keep loop_variable as plain text (no base64 encoding) - only if it exists
+    if 'loop_variable' in e:
+      e['loop_variable'] = e.get('loop_variable', '')
+    decoded.append(e)
+  return decoded
+
+
 def validate_input_directory(directory):
   """
   Validate that input directory is safe and within application structure.
@@ -123,52 +246,87 @@ def validate_input_directory(directory):
   return directory
 
 
-if not os.path.exists(CONF_PATH):
-  # Create new configuration with default values
-  for section, options in default_config.items():
-    config[section] = options
-  # Create conf directory if it doesn't exist
-  os.makedirs(os.path.dirname(CONF_PATH), exist_ok=True)
-  with open(CONF_PATH, 'w', encoding='utf-8') as conf_file:
-    config.write(conf_file)
-else:
-  # Load existing configuration
-  config.read(CONF_PATH)
-
-  # Check for missing sections/options and add them with defaults
-  config_updated = False
-  for section, options in default_config.items():
-    if not config.has_section(section):
-      config.add_section(section)
-      config_updated = True
-    for option, value in options.items():
-      if not config.has_option(section, option):
-        config.set(section, option, value)
-        config_updated = True
+# Version of the configuration file this process last read or wrote, see reload_config
+CONFIG_STAMP = None
 
-  # Validate and sanitize input directory for security
-  if config.has_section('input_files') and config.has_option('input_files', 'directory'):
-    current_dir = config.get('input_files', 'directory')
-    try:
-      safe_dir = validate_input_directory(current_dir)
-      if safe_dir != current_dir:
-        print(f"WARNING: Input directory '{current_dir}' is unsafe. Resetting to safe default: '{safe_dir}'")
-        config.set('input_files', 'directory', safe_dir)
+
+def config_stamp():
+  """Identify the current version of the configuration file, None when it does not exist."""
+  try:
+    st = os.stat(CONF_PATH)
+  except OSError:
+    return None
+  return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def save_config():
+  """Write the configuration atomically, creating the conf directory if needed."""
+  global CONFIG_STAMP
+  with CONFIG_LOCK:
+    atomic_write(CONF_PATH, config.write)
+    CONFIG_STAMP = config_stamp()
+
+
+with CONFIG_LOCK:
+  if not os.path.exists(CONF_PATH):
+    # Create new configuration with default values
+    for section, options in default_config.items():
+      config[section] = options
+    save_config()
+  else:
+    # Load existing configuration
+    config.read(CONF_PATH)
+
+    # Check for missing sections/options and add them with defaults
+    config_updated = False
+    for section, options in default_config.items():
+      if not config.has_section(section):
+        config.add_section(section)
+        config_updated = True
+      for option, value in options.items():
+        if not config.has_option(section, option):
+          config.set(section, option, value)
+          config_updated = True
+
+    # Validate and sanitize input directory for security
+    if config.has_section('input_files') and config.has_option('input_files', 'directory'):
+      current_dir = config.get('input_files', 'directory')
+      try:
+        safe_dir = validate_input_directory(current_dir)
+        if safe_dir != current_dir:
+          print(f"WARNING: Input directory '{current_dir}' is unsafe. Resetting to safe default: '{safe_dir}'")
+          config.set('input_files', 'directory', safe_dir)
+          config_updated = True
+      except ValueError as e:
+        print(f"SECURITY WARNING: {e}")
+        print("Resetting input directory to safe default: 'inputs'")
+        config.set('input_files', 'directory', 'inputs')
         config_updated = True
-    except ValueError as e:
-      print(f"SECURITY WARNING: {e}")
-      print("Resetting input directory to safe default: 'inputs'")
-      config.set('input_files', 'directory', 'inputs')
-      config_updated = True
 
-  # Save updated configuration if anything was added or changed
-  if config_updated:
-    with open(CONF_PATH, 'w', encoding='utf-8') as conf_file:
-      config.write(conf_file)
+    # Save updated configuration if anything was added or changed
+    if config_updated:
+      save_config()
+  CONFIG_STAMP = config_stamp()
 
 # Initial max entries
 MAX_ENTRIES = int(config.get('history', 'max_entries', fallback='1000'))
 
+
+def reload_config():
+  """
+  Read the configuration file again when another process changed it, e.g.
+  a prefork worker that handled /settings. Called before every request so
+  all workers serve the same settings; options documented as read at
+  startup still need a restart.
+  """
+  global CONFIG_STAMP, MAX_ENTRIES
+  if config_stamp() in (CONFIG_STAMP, None):
+    return
+  with CONFIG_LOCK:
+    CONFIG_STAMP = config_stamp()
+    config.read(CONF_PATH)
+  MAX_ENTRIES = int(config.get('history', 'max_entries', fallback='1000'))
+
 # Server configuration
 HOST = config.get('server', 'host', fallback='0.0.0.0')
 PORT = int(config.get('server', 'port', fallback='8000'))
@@ -193,6 +351,978 @@ env.tests.update(FileTests().tests())
 env.tests.update(MathTests().tests())
 env.tests.update(UriTests().tests())
 
+# Endpoints tracked individually in timing statistics and metrics, anything else is 'other'
+KNOWN_ENDPOINTS = {
+    '/', '/history', '/history/size', '/history/maxsize', '/history/clear', '/history/mark_read',
+    '/settings', '/input-files', '/input-file-content', '/render', '/load_ansible_vars', '/timings',
+    '/metrics', '/debug/profile', '/events'
+}
+
+# Configuration sections that are never exposed or changed through /settings
+PROTECTED_SECTIONS = {'debug'}
+
+# Prometheus-style metrics exposed on /metrics
+METRICS = MetricsRegistry()
+HTTP_REQUESTS = METRICS.counter(
+    'playground_http_requests_total', 'HTTP requests handled.', ('endpoint', 'method', 'status'))
+HTTP_REQUEST_SECONDS = METRICS.histogram(
+    'playground_http_request_duration_seconds', 'HTTP request latency in seconds.', ('endpoint',))
+RENDER_ERRORS = METRICS.counter(
+    'playground_render_errors_total', 'Failed renders by stage.', ('stage',))
+CACHE_REQUESTS = METRICS.counter(
+    'playground_cache_requests_total', 'Cache lookups by cache and result.', ('cache', 'result'))
+CACHE_ENTRIES = METRICS.gauge(
+    'playground_cache_entries', 'Entries currently held per cache.', ('cache',))
+HISTORY_ENTRIES = METRICS.gauge(
+    'playground_history_entries', 'Entries in the history file when last read or written.')
+HISTORY_FILE_BYTES = METRICS.gauge(
+    'playground_history_file_bytes', 'Size of the history file in bytes.',
+    collect=lambda: os.path.getsize(JSON_HISTORY_PATH) if os.path.exists(JSON_HISTORY_PATH) else 0)
+HISTORY_WRITE_SECONDS = METRICS.histogram(
+    'playground_history_write_duration_seconds', 'Time spent rewriting the history file.')
+RENDER_OUTCOMES = METRICS.counter(
+    'playground_renders_total',
+    'Renders computed, served from the result cache, coalesced onto an identical running render or superseded.',
+    ('outcome',))
+FILTER_MEMO_CALLS = METRICS.counter(
+    'playground_filter_memo_total',
+    'Calls of memoized filters by result: hit, miss, or skip when the arguments cannot be used as a key.',
+    ('filter', 'result'))
+LISTENER_PUSHES = METRICS.counter(
+    'playground_listener_pushes_total', 'Variable pushes received on /load_ansible_vars.', ('status',))
+METRICS.gauge('playground_start_time_seconds', 'Unix time the server module was loaded.').set(time.time())
+
+
+class _CacheAlias:
+  """Placeholder value of an LRUCache key that is an alias of another key."""
+
+  __slots__ = ('key',)
+
+  def __init__(self, key):
+    self.key = key
+
+
+class LRUCache:
+  """
+  Thread-safe LRU mapping bounded by entry count and, optionally, total size.
+  Lookups are counted in the cache metrics under the given name, unless
+  count_requests is False because the caller counts them itself. A key
+  can be made an alias of another one: it returns the same entry and its
+  size is not counted again.
+  """
+
+  def __init__(self, name, max_entries, max_bytes=0, count_requests=True):
+    self.name = name
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.count_requests = count_requests
+    self._lock = threading.Lock()
+    self._data = collections.OrderedDict()
+    self._bytes = 0
+
+  def get(self, key, count=True):
+    """Value stored under key, or None. count=False leaves the lookup for record() to count."""
+    with self._lock:
+      item = self._resolve(key)
+    if count:
+      self.record(item is not None)
+    return item[0] if item is not None else None
+
+  def record(self, hit):
+    """Count one lookup, e.g. one made of several get(count=False) calls."""
+    if self.count_requests:
+      CACHE_REQUESTS.inc(self.name, 'hit' if hit else 'miss')
+
+  def _resolve(self, key):
+    """Entry of key, following an alias, marked as recently used. Called with the lock held."""
+    item = self._data.get(key)
+    if item is None:
+      return None
+    self._data.move_to_end(key)
+    if type(item[0]) is _CacheAlias:
+      target = self._data.get(item[0].key)
+      if target is None:
+        # The aliased entry was evicted
+        del self._data[key]
+        return None
+      self._data.move_to_end(item[0].key)
+      return target
+    return item
+
+  def alias(self, key, target):
+    """Make key return the entry stored under target, if any, without counting its size again."""
+    if self.max_entries <= 0:
+      return
+    with self._lock:
+      item = self._data.get(target)
+      if item is None:
+        return
+      if type(item[0]) is _CacheAlias:
+        target = item[0].key
+    self.put(key, _CacheAlias(target))
+
+  def put(self, key, value, size=0):
+    if self.max_entries <= 0 or (self.max_bytes and size > self.max_bytes):
+      return
+    with self._lock:
+      old = self._data.pop(key, None)
+      if old is not None:
+        self._bytes -= old[1]
+      self._data[key] = (value, size)
+      self._bytes += size
+      while self._data and (len(self._data) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)):
+        _, (_, evicted_size) = self._data.popitem(last=False)
+        self._bytes -= evicted_size
+      CACHE_ENTRIES.set(len(self._data), self.name)
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+      self._bytes = 0
+      CACHE_ENTRIES.set(0, self.name)
+
+
+TEMPLATE_CACHE = LRUCache('template', config.getint('cache', 'template_entries', fallback=256))
+# Source text of compiled templates, used to map profiler samples to template lines
+TEMPLATE_SOURCES = weakref.WeakKeyDictionary()
+# analyze_template() results of compiled templates
+TEMPLATE_ANALYSIS = weakref.WeakKeyDictionary()
+# Inputs at least this large are parsed lazily when they are a JSON object
+LAZY_JSON_MIN_BYTES = config.getint('render', 'lazy_json_min_bytes', fallback=8 * 1024 * 1024)
+# Output and X-* headers of renders, keyed by template and input digests
+RESULT_CACHE = LRUCache('render_result', config.getint('cache', 'result_entries', fallback=256),
+                        config.getint('cache', 'result_max_bytes', fallback=64 * 1024 * 1024))
+# Digests of top-level input variables, keyed by input and variable name
+VARIABLE_DIGESTS = LRUCache('variable_digest', config.getint('cache', 'variable_digest_entries', fallback=4096))
+INPUT_CACHE = LRUCache('input', config.getint('cache', 'input_entries', fallback=32),
+                       config.getint('cache', 'input_max_bytes', fallback=64 * 1024 * 1024))
+
+# Opt-in memoization of pure filters ([render] filter_memo: off, render or global)
+FILTER_MEMO_ENTRIES = config.getint('cache', 'filter_memo_entries', fallback=4096)
+# Lookups are counted once, per filter, in FILTER_MEMO_CALLS
+FILTER_MEMO = FilterMemo(config.get('render', 'filter_memo', fallback='off'),
+                         LRUCache('filter_memo', FILTER_MEMO_ENTRIES, count_requests=False), FILTER_MEMO_ENTRIES,
+                         FILTER_MEMO_CALLS.inc)
+FILTER_MEMO.install(env.filters)
+
+# History inputs are stored once per content in the blob store and referenced by digest
+BLOB_STORE = BlobStore(
+    BLOB_DIR, config.get('history', 'blob_compression', fallback='zlib'),
+    cache=LRUCache('blob', config.getint('cache', 'blob_entries', fallback=8),
+                   config.getint('cache', 'blob_max_bytes', fallback=64 * 1024 * 1024)))
+BLOB_MIN_BYTES = config.getint('history', 'blob_min_bytes', fallback=4096)
+METRICS.gauge('playground_blob_store_bytes', 'Size of the history blob store on disk in bytes.',
+              collect=lambda: BLOB_STORE.disk_usage())
+
+# Listing and contents of the input files directory, refreshed when the directory changes
+INPUT_CATALOG = InputCatalog(
+    config.get('input_files', 'watch', fallback='auto'),
+    config.getfloat('input_files', 'poll_interval', fallback=2.0),
+    cache=LRUCache('input_file', config.getint('cache', 'input_file_entries', fallback=64),
+                   config.getint('cache', 'input_file_max_bytes', fallback=64 * 1024 * 1024)))
+
+
+def input_directory():
+  """Absolute path of the configured input files directory, '' when none is configured."""
+  input_dir = config.get('input_files', 'directory', fallback='')
+  if input_dir and not os.path.isabs(input_dir):
+    input_dir = os.path.join(PROJECT_ROOT, input_dir)
+  return input_dir
+
+
+def compile_template(source):
+  """Compile a template source, reusing previously compiled templates."""
+  template = TEMPLATE_CACHE.get(source)
+  if template is None:
+    template = env.from_string(source)
+    TEMPLATE_CACHE.put(source, template)
+    TEMPLATE_SOURCES[template] = source
+  return template
+
+
+def admin_token_valid(supplied):
+  """Check a supplied admin token. Admin features are disabled while no token is configured."""
+  token = config.get('debug', 'admin_token', fallback='')
+  return bool(token) and bool(supplied) and hmac.compare_digest(token.encode('utf-8'), supplied.encode('utf-8'))
+
+
+def cached_parse(key, load_text, timer):
+  """
+  Parse the text returned by load_text() as JSON, falling back to YAML.
+  Returns (data, input_format). Parsed inputs are cached under key as pickles
+  so every render still gets its own copy, since templates may mutate the data.
+  JSON objects of at least LAZY_JSON_MIN_BYTES are returned as a LazyObject
+  (a fresh one per call over a cached index) instead.
+  load_text is only called on a cache miss.
+  """
+  cached = INPUT_CACHE.get(key)
+  if cached is not None:
+    with timer.phase('input_cache'):
+      if isinstance(cached[0], LazyIndex):
+        return cached[0].view(), cached[1]
+      return pickle.loads(cached[0]), cached[1]
+
+  text = load_text()
+  # Large JSON objects are only indexed, values are decoded when a template reads them
+  if LAZY_JSON_MIN_BYTES and len(text) >= LAZY_JSON_MIN_BYTES:
+    try:
+      with timer.phase('index_json'):
+        index = LazyIndex(text)
+    except LazyJSONError:
+      # Not a JSON object (YAML, a list, invalid JSON): parsed as usual below
+      index = None
+    if index is not None:
+      INPUT_CACHE.put(key, (index, 'JSON'), len(text))
+      return index.view(), 'JSON'
+  try:
+    with timer.phase('parse_json'):
+      data = json.loads(text)
+    input_format = 'JSON'
+  except json.JSONDecodeError:
+    with timer.phase('parse_yaml'):
+      data = yaml.safe_load(text)
+    input_format = 'YAML'
+    # If yaml.safe_load returns None for empty string, treat as empty dict
+    if data is None:
+      data = {}
+
+  blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+  INPUT_CACHE.put(key, (blob, input_format), len(blob))
+  return data, input_format
+
+
+def text_input_key(text):
+  """Cache key of input text sent with a request: the sha256 of the text."""
+  return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+def parse_input(text, timer, key=None):
+  """Parse input text sent with a request, cached by text_input_key (computed when key is not given)."""
+  return cached_parse(key or text_input_key(text), lambda: text, timer)
+
+
+def read_input_file(entry, timer):
+  """Return the text of a catalog InputFile."""
+  with timer.phase('read_file'):
+    return INPUT_CATALOG.read(entry).decode('utf-8')
+
+
+def parse_input_file(entry, timer):
+  """Parse an input file on the server, cached until its mtime or size changes."""
+  return cached_parse(('file',) + entry.key, lambda: read_input_file(entry, timer), timer)
+
+
+# Blob digests of input file versions already copied to the blob store for history
+INPUT_FILE_BLOBS = LRUCache('input_file_blob', 256)
+
+
+def input_file_blob(entry, timer):
+  """Store an input file in the blob store once per version and return its digest."""
+  digest = INPUT_FILE_BLOBS.get(entry.key)
+  if digest is None or not BLOB_STORE.exists(digest):
+    digest = BLOB_STORE.put_text(read_input_file(entry, timer))
+    INPUT_FILE_BLOBS.put(entry.key, digest)
+  return digest
+
+
+# Renders the hosts of a multi-host render in parallel
+HOST_POOL = concurrent.futures.ThreadPoolExecutor(config.getint('render', 'host_workers', fallback=4) or None,
+                                                  thread_name_prefix='playground-hosts')
+
+# Latest interactive render per browser tab, and renders shared by identical concurrent requests
+RENDER_SLOTS = RenderSlots()
+RENDER_FLIGHTS = RenderFlights()
+
+# Serializes history read-modify-write cycles between request threads and
+# between processes sharing the history file
+HISTORY_LOCK = FileLock(JSON_HISTORY_PATH + '.lock')
+
+# How record_render_history treats an entry already present in history
+DUPLICATE_POLICIES = ('consecutive', 'skip', 'move_to_top')
+
+
+class HistoryIndex:
+  """
+  The entries of the history file as last read or written, with their
+  signatures and signature counts, so duplicate checks are a dictionary
+  lookup and updates do not parse the file again. Indexing a new list of
+  entries only hashes the entries not indexed yet and adjusts the counts
+  by the entries added and removed; the file is read again only when its
+  stamp shows another process wrote it. Entries handed out by entries()
+  are shared: replace them instead of changing them in place.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._entries = []
+    # id(entry) -> signature of the indexed entries, which the index keeps alive
+    self._signatures = {}
+    self._counts = collections.Counter()
+    self._stamp = None
+
+  def entries(self, stamp):
+    """A copy of the indexed entry list when stamp is the indexed version of the file, else None."""
+    with self._lock:
+      if stamp is None or stamp != self._stamp:
+        return None
+      return list(self._entries)
+
+  def update(self, hist, stamp):
+    """Index hist as version stamp of the history file."""
+    with self._lock:
+      signatures = {}
+      for e in hist:
+        key = id(e)
+        if key in self._signatures:
+          signatures[key] = self._signatures[key]
+        elif key not in signatures and isinstance(e, dict):
+          signatures[key] = entry_signature(e)
+          self._counts[signatures[key]] += 1
+      for key, signature in self._signatures.items():
+        if key not in signatures:
+          self._counts[signature] -= 1
+          if self._counts[signature] <= 0:
+            del self._counts[signature]
+      self._entries = list(hist)
+      self._signatures = signatures
+      self._stamp = stamp
+
+  def without(self, hist, signature):
+    """hist without the indexed entries that have this signature."""
+    with self._lock:
+      return [e for e in hist if self._signatures.get(id(e)) != signature]
+
+  def __contains__(self, signature):
+    with self._lock:
+      return self._counts.get(signature, 0) > 0
+
+
+HISTORY_INDEX = HistoryIndex()
+# Random revision written at the start of the history file on every save
+HISTORY_REVISION = re.compile(rb'"revision":"([0-9a-f]+)"')
+
+
+def history_stamp():
+  """
+  Identify the current version of the history file, None when it does not
+  exist. The revision at the start of the file tells two versions apart
+  even when a reused inode ends up with the same size and mtime.
+  """
+  try:
+    with open(JSON_HISTORY_PATH, 'rb') as hf:
+      st = os.fstat(hf.fileno())
+      head = hf.read(128)
+  except OSError:
+    return None
+  match = HISTORY_REVISION.search(head)
+  return (st.st_ino, st.st_size, st.st_mtime_ns, match.group(1) if match else None)
+
+
+# Version of the history file layout: {"format": 2, "entries": [...]} with plain text
+# input/expr, written as compact JSON. Version 1 files are a bare list with base64 fields.
+HISTORY_FORMAT = 2
+
+
+def history_blob_refs(hist):
+  """Count how many history entries reference each blob, as input or output."""
+  return collections.Counter(e[field] for e in hist if isinstance(e, dict)
+                             for field in ('input_blob', 'output_blob') if e.get(field))
+
+
+def read_history_file(store_blobs=True):
+  """
+  Read history entries from disk. Returns (entries, legacy) where legacy is
+  True when the file still uses the old format and should be rewritten.
+  Returns ([], False) when the file does not exist. With store_blobs False
+  legacy entries keep large inputs inline instead of writing them to the
+  blob store, for tools that must not change anything on disk.
+  """
+  if not os.path.exists(JSON_HISTORY_PATH):
+    return [], False
+  with open(JSON_HISTORY_PATH, 'r', encoding='utf-8') as hf:
+    data = json.load(hf)
+  # Legacy files are a plain list of entries with base64 encoded input/expr
+  if isinstance(data, list):
+    return upgrade_history_entries(data, store_blobs), True
+  if data.get('format') != HISTORY_FORMAT:
+    raise ValueError(f"Unsupported history format: {data.get('format')}")
+  return data['entries'], False
+
+
+def load_history(for_update=False):
+  """
+  Load history entries from disk, returning [] when missing or unreadable.
+  With for_update, read errors are raised instead so a damaged file is
+  never replaced by an empty history; call it while holding HISTORY_LOCK.
+  """
+  try:
+    stamp = history_stamp()
+    hist = HISTORY_INDEX.entries(stamp)
+    if hist is not None:
+      return hist
+    hist, legacy = read_history_file()
+    if legacy:
+      with HISTORY_LOCK:
+        # Read again under the lock so a concurrent update is not overwritten
+        hist, legacy = read_history_file()
+        if legacy:
+          save_history(hist)
+          return hist
+  except Exception:
+    if for_update:
+      raise
+    # Unreadable history says nothing about blob references, leave them alone
+    HISTORY_ENTRIES.set(0)
+    return []
+  HISTORY_ENTRIES.set(len(hist))
+  BLOB_STORE.track(history_blob_refs(hist))
+  HISTORY_INDEX.update(hist, stamp)
+  return hist
+
+
+def save_history(hist):
+  """Write history entries to disk atomically, creating the conf directory if needed."""
+  start = time.perf_counter()
+  document = {'format': HISTORY_FORMAT, 'revision': uuid.uuid4().hex, 'entries': hist}
+  with HISTORY_LOCK:
+    atomic_write(JSON_HISTORY_PATH, lambda hf: json.dump(document, hf, ensure_ascii=False, separators=(',', ':')))
+    stamp = history_stamp()
+  HISTORY_WRITE_SECONDS.observe(time.perf_counter() - start)
+  HISTORY_ENTRIES.set(len(hist))
+  HISTORY_INDEX.update(hist, stamp)
+  # Drop blobs that trimmed or cleared entries were the last to reference
+  BLOB_STORE.track(history_blob_refs(hist))
+
+
+def collect_orphan_blobs():
+  """Delete blobs no history entry references, e.g. after the history was edited offline."""
+  try:
+    hist, _ = read_history_file()
+  except Exception:
+    return 0
+  return BLOB_STORE.sweep(history_blob_refs(hist))
+
+
+class RequestTimer:
+  """
+  Collects named phase durations for a single request.
+  Durations of repeated phases (e.g. render inside a loop) are accumulated.
+  """
+
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.phases = {}
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    begin = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - begin
+
+  def total(self):
+    return time.perf_counter() - self.start
+
+  def server_timing(self):
+    """Format phases as a Server-Timing header value (durations in ms)."""
+    items = [f'{name};dur={duration * 1000:.3f}' for name, duration in self.phases.items()]
+    items.append(f'total;dur={self.total() * 1000:.3f}')
+    return ', '.join(items)
+
+
+class TimingStats:
+  """Thread-safe in-process aggregation of request phase timings per endpoint."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._stats = {}
+
+  def record(self, endpoint, timer):
+    phases = dict(timer.phases)
+    phases['total'] = timer.total()
+    with self._lock:
+      endpoint_stats = self._stats.setdefault(endpoint, {})
+      for name, duration in phases.items():
+        stat = endpoint_stats.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        stat['count'] += 1
+        stat['total'] += duration
+        if duration > stat['max']:
+          stat['max'] = duration
+
+  def snapshot(self):
+    """Return aggregated timings as {endpoint: {phase: {count, total_ms, avg_ms, max_ms}}}."""
+    with self._lock:
+      return {
+          endpoint: {
+              name: {
+                  'count': stat['count'],
+                  'total_ms': round(stat['total'] * 1000, 3),
+                  'avg_ms': round(stat['total'] * 1000 / stat['count'], 3),
+                  'max_ms': round(stat['max'] * 1000, 3)
+              } for name, stat in phases.items()
+          } for endpoint, phases in self._stats.items()
+      }
+
+  def reset(self):
+    with self._lock:
+      self._stats = {}
+
+
+TIMING_STATS = TimingStats()
+
+
+def generate_from_mapping(template, mapping):
+  """Template.generate for a context mapping that must not be copied into a dict, e.g. a LazyObject."""
+  context = template.new_context(collections.ChainMap(mapping, template.globals), shared=True)
+  try:
+    yield from template.root_render_func(context)
+  except Exception:
+    yield template.environment.handle_exception()
+
+
+def render_chunks(template, context, check=None):
+  """Render template, calling check() between output chunks so a superseded render can stop early."""
+  if isinstance(context, dict):
+    if check is None:
+      return template.render(**context)
+    chunks = template.generate(**context)
+  else:
+    chunks = generate_from_mapping(template, context)
+  parts = []
+  for chunk in chunks:
+    if check:
+      check()
+    parts.append(chunk)
+  return ''.join(parts)
+
+
+def render_context(input_data, **variables):
+  """
+  Template context: the top-level input variables plus variables. Lazily
+  parsed inputs are layered under variables instead of copied, so only
+  the values a template reads are decoded; render_template has already
+  turned them into a dict when the template reads data itself.
+  """
+  if isinstance(input_data, dict):
+    context = input_data.copy()
+    context.update(variables)
+    return context
+  return collections.ChainMap(variables, input_data)
+
+
+def materialize_input(data, expr, enable_loop, loop_variable, timer):
+  """
+  Decode a lazily parsed input into a dict when the render references
+  data itself: filters such as combine or to_nice_yaml and attribute
+  lookups must see the same dict as with a small input. Renders that only
+  read top-level variables keep the lazy mapping.
+  """
+  try:
+    reads_data = 'data' in render_variables(expr, enable_loop, loop_variable)[1]
+  except Exception:
+    reads_data = True
+  if not reads_data:
+    return data
+  with timer.phase('materialize'):
+    return dict(data)
+
+
+@FILTER_MEMO.render_scope()
+def render_template(expr, data, input_format, enable_loop=False, loop_variable='', timer=None, check=None):
+  """
+  Render expr against parsed input data, optionally simulating a loop.
+  Returns (output, headers) where headers are the X-* response headers.
+  Raises on template or loop evaluation errors. check, when given, is
+  called at checkpoints and raises to abandon the render.
+  """
+  timer = timer or RequestTimer()
+  if check:
+    check()
+  with timer.phase('compile'):
+    template = compile_template(expr)
+  if isinstance(data, LazyObject):
+    data = materialize_input(data, expr, enable_loop, loop_variable, timer)
+  elif not isinstance(data, dict):
+    raise ValueError(f'Input must be an object/mapping, got {type(data).__name__}')
+
+  # Handle loop simulation
+  if enable_loop and loop_variable:
+    # Try to evaluate loop_variable as a Jinja2 expression first
+    with timer.phase('loop_eval'):
+      try:
+        # If loop_variable contains Jinja2 expressions (filters, etc.), evaluate it
+        if '|' in loop_variable or '(' in loop_variable or '[' in loop_variable:
+          # Create context for evaluating the loop variable expression
+          # Include both individual variables and data object access
+          context = render_context(data, data=data)
+
+          # Evaluate as Jinja2 expression
+          loop_template = compile_template('{{ ' + loop_variable + ' }}')
+          loop_result = render_chunks(loop_template, context)
+
+          # Try to parse the result as Python literal (for lists, dicts, etc.)
+          try:
+            loop_data = ast.literal_eval(loop_result)
+          except (ValueError, SyntaxError):
+            # If literal_eval fails, try JSON parsing
+            try:
+              loop_data = json.loads(loop_result)
+            except json.JSONDecodeError:
+              raise ValueError(f"Loop variable expression '{loop_variable}' did not evaluate to a valid list/array")
+        else:
+          # Navigate to the loop variable in the data (original behavior for simple paths)
+          loop_data = data
+          parts = loop_variable.split('.')
+
+          # Handle special case where first part is 'data' (refers to root)
+          if parts[0] == 'data':
+            # Skip 'data' prefix and start from the actual data
+            parts = parts[1:]
+
+          # Navigate through the remaining path
+          for part in parts:
+            if isinstance(loop_data, Mapping) and part in loop_data:
+              loop_data = loop_data[part]
+            else:
+              raise ValueError(f"Loop variable '{part}' not found in input data")
+
+      except Exception as e:
+        raise ValueError(f"Error evaluating loop variable '{loop_variable}': {str(e)}")
+
+    if not isinstance(loop_data, list):
+      raise ValueError(f"Loop variable '{loop_variable}' must evaluate to an array/list, got {type(loop_data).__name__}")
+
+    # Process each item in the loop
+    results = []
+    for item in loop_data:
+      # Create context with the original data plus the current item
+      # Also provide access to original data
+      loop_context = render_context(data, item=item, data=data)
+
+      # Render template for this iteration
+      with timer.phase('render'):
+        iteration_output = render_chunks(template, loop_context, check)
+
+      # Try to parse as JSON, otherwise keep as string
+      with timer.phase('output_parse'):
+        try:
+          parsed_iteration = json.loads(iteration_output)
+          results.append(parsed_iteration)
+        except BaseException:
+          results.append(iteration_output)
+
+    # Format final output as JSON array
+    with timer.phase('output_parse'):
+      output = json.dumps(results, indent=2)
+    actual_type = type(results).__name__  # This will be 'list'
+    headers = {
+        'X-Result-Type': 'json',
+        'X-Input-Format': input_format,
+        'X-Loop-Enabled': 'true',
+        'X-Actual-Type': actual_type}
+  else:
+    # Normal processing without loop - provide access to both individual vars and data object
+    context = render_context(data, data=data)
+    with timer.phase('render'):
+      output = render_chunks(template, context, check)
+
+    # The actual type is always string for Jinja2 template output
+    # But we detect the content type for formatting purposes
+    actual_type = 'str'  # Jinja2 always returns strings
+
+    with timer.phase('output_parse'):
+      # Try to parse and format as JSON if possible, otherwise keep as string
+      try:
+        parsed_out = json.loads(output)
+        output = json.dumps(parsed_out, indent=2)
+        headers = {'X-Result-Type': 'json', 'X-Input-Format': input_format, 'X-Actual-Type': actual_type}
+      except BaseException:
+        try:
+          # Try to safely evaluate as Python literal (dict, list, etc.)
+          python_obj = ast.literal_eval(output)
+          output = json.dumps(python_obj, indent=2)
+          headers = {'X-Result-Type': 'json', 'X-Input-Format': input_format, 'X-Actual-Type': actual_type}
+        except BaseException:
+          # If all parsing attempts fail, treat as string
+          headers = {'X-Result-Type': 'string', 'X-Input-Format': input_format, 'X-Actual-Type': actual_type}
+
+  return output, headers
+
+
+def analyze_template(source):
+  """
+  Return (deterministic, variables) for a template source: whether it is
+  free of random and time dependent filters, and the top-level names it
+  reads from the context. Raises on syntax errors.
+  """
+  template = compile_template(source)
+  analysis = TEMPLATE_ANALYSIS.get(template)
+  if analysis is None:
+    ast = env.parse(source)
+    analysis = TEMPLATE_ANALYSIS[template] = (is_deterministic(ast), frozenset(meta.find_undeclared_variables(ast)))
+  return analysis
+
+
+def render_variables(expr, enable_loop, loop_variable):
+  """
+  Return (deterministic, variables) for a render: whether expr and the
+  loop variable are free of random and time dependent filters, and the
+  top-level names they read. Raises on syntax errors.
+  """
+  sources = [expr]
+  variables = set()
+  looping = enable_loop and loop_variable
+  if looping and ('|' in loop_variable or '(' in loop_variable or '[' in loop_variable):
+    sources.append('{{ ' + loop_variable + ' }}')
+  elif looping:
+    # A path like servers.web or data.servers.web, see render_template
+    parts = loop_variable.split('.')
+    if parts[0] == 'data':
+      parts = parts[1:]
+    variables.add(parts[0] if parts else 'data')
+  deterministic = True
+  for source in sources:
+    source_deterministic, names = analyze_template(source)
+    deterministic = deterministic and source_deterministic
+    variables |= names
+  if looping:
+    # item comes from the loop variable, already accounted for
+    variables.discard('item')
+  return deterministic, frozenset(variables)
+
+
+def render_dependencies(expr, enable_loop, loop_variable):
+  """
+  Return (cacheable, variables) for a render: whether its output can be
+  served from RESULT_CACHE, and the top-level input variables it depends
+  on (None when it may read the whole input through data).
+  """
+  try:
+    deterministic, variables = render_variables(expr, enable_loop, loop_variable)
+  except Exception:
+    # Syntax errors are reported by the render itself
+    return False, None
+  if not deterministic:
+    return False, None
+  if 'data' in variables:
+    return True, None
+  return True, variables
+
+
+def render_digest(expr, enable_loop, loop_variable):
+  return hashlib.sha256(json.dumps([expr, enable_loop, loop_variable]).encode('utf-8')).digest()
+
+
+def render_result_key(expr, input_key, enable_loop, loop_variable):
+  """RESULT_CACHE key of a render for this exact input, None when its output is not reproducible."""
+  if RESULT_CACHE.max_entries <= 0 or not render_dependencies(expr, enable_loop, loop_variable)[0]:
+    return None
+  return (render_digest(expr, enable_loop, loop_variable), input_key)
+
+
+def variable_digest(input_key, data, name):
+  """Digest of one top-level variable of a parsed input, b'' when it is not defined."""
+  digest = VARIABLE_DIGESTS.get((input_key, name))
+  if digest is None:
+    digest = hashlib.sha256(pickle.dumps(data[name], pickle.HIGHEST_PROTOCOL)).digest() if name in data else b''
+    VARIABLE_DIGESTS.put((input_key, name), digest)
+  return digest
+
+
+def render_dependency_key(expr, input_key, data, input_format, enable_loop, loop_variable):
+  """
+  RESULT_CACHE key of a render built from the digests of only the input
+  variables it reads, so inputs that differ elsewhere share the result.
+  None when the render is not cacheable or may read the whole input.
+  """
+  if RESULT_CACHE.max_entries <= 0 or not isinstance(data, Mapping):
+    return None
+  cacheable, variables = render_dependencies(expr, enable_loop, loop_variable)
+  if not cacheable or variables is None:
+    return None
+  digests = tuple((name, variable_digest(input_key, data, name)) for name in sorted(variables))
+  return (render_digest(expr, enable_loop, loop_variable), input_format, digests)
+
+
+def cached_render(result_key, dependency_key, expr, data, input_format, enable_loop, loop_variable, timer, check):
+  """
+  render_template, storing the result in RESULT_CACHE under result_key,
+  with dependency_key (when not None) as an alias of the same entry.
+  """
+  result = render_template(expr, data, input_format, enable_loop, loop_variable, timer, check)
+  if result_key is not None:
+    RESULT_CACHE.put(result_key, result, len(result[0]))
+    if dependency_key is not None:
+      RESULT_CACHE.alias(dependency_key, result_key)
+  return result
+
+
+def host_inputs(hist, entry_selectors, file_selectors):
+  """
+  Resolve the hosts of a multi-host render to [(source, input_key, load_text)].
+  entry_selectors are history entry ids or indexes ('listener' selects every
+  listener push), file_selectors input file names ('*' selects all of them).
+  Raises InputFileError for unknown entries and files.
+  """
+  hosts = []
+  by_id = {entry['id']: (i, entry) for i, entry in enumerate(hist) if entry.get('id')}
+  selected = []
+  for selector in entry_selectors:
+    if selector == 'listener':
+      selected.extend((i, entry) for i, entry in enumerate(hist) if entry.get('source') == 'listener')
+    elif selector in by_id:
+      selected.append(by_id[selector])
+    elif selector.lstrip('-').isdigit() and -len(hist) <= int(selector) < len(hist):
+      index = int(selector) % len(hist)
+      selected.append((index, hist[index]))
+    else:
+      raise InputFileError(404, f'History entry not found: {selector}')
+  seen = set()
+  for index, entry in selected:
+    if index in seen:
+      continue
+    seen.add(index)
+    source = f"history:{entry.get('id') or index}"
+    if entry.get('input_blob'):
+      digest = entry['input_blob']
+      hosts.append((source, ('blob', digest), lambda digest=digest: BLOB_STORE.get_text(digest)))
+    else:
+      text = entry.get('input', '')
+      hosts.append((source, text_input_key(text), lambda text=text: text))
+
+  if file_selectors:
+    input_dir = input_directory()
+    if not input_dir:
+      raise InputFileError(404, 'Input directory not configured')
+    names = []
+    for selector in file_selectors:
+      names.extend(INPUT_CATALOG.files(input_dir) if selector == '*' else [selector])
+    for name in names:
+      file_entry = INPUT_CATALOG.lookup(input_dir, name)
+      hosts.append((f'file:{name}', ('file',) + file_entry.key,
+                    lambda file_entry=file_entry: INPUT_CATALOG.read(file_entry).decode('utf-8')))
+  return hosts
+
+
+def render_host(host, expr, enable_loop, loop_variable):
+  """
+  Render expr against one host of a multi-host render, through the same
+  input and result caches as /render. Returns the host's result as a dict.
+  """
+  source, input_key, load_text = host
+  timer = RequestTimer()
+  result = {'host': source, 'source': source}
+  try:
+    data, input_format = cached_parse(input_key, load_text, timer)
+  except Exception as e:
+    RENDER_ERRORS.inc('input')
+    result.update(status='error', error=f'Input parsing error: {e}')
+    return result
+  # Listener pushes carry hostvars, name the host after its inventory hostname
+  hostname = data.get('inventory_hostname') if isinstance(data, Mapping) else None
+  if isinstance(hostname, str) and hostname:
+    result['host'] = hostname
+
+  try:
+    with timer.phase('compile'):
+      result_key = render_result_key(expr, input_key, enable_loop, loop_variable)
+    dependency_key = render_dependency_key(expr, input_key, data, input_format, enable_loop, loop_variable)
+    cached = None
+    if result_key is not None:
+      cached = RESULT_CACHE.get(result_key, count=False)
+      if cached is None and dependency_key is not None:
+        cached = RESULT_CACHE.get(dependency_key, count=False)
+      RESULT_CACHE.record(cached is not None)
+    if cached is not None:
+      RENDER_OUTCOMES.inc('cached')
+      output, headers = cached
+    else:
+      output, headers = cached_render(result_key, dependency_key, expr, data, input_format, enable_loop,
+                                      loop_variable, timer, None)
+      RENDER_OUTCOMES.inc('computed')
+    result.update(status='ok', output=output, result_type=headers.get('X-Result-Type', 'string'))
+  except Exception as e:
+    RENDER_ERRORS.inc('template')
+    result.update(status='error', error=f'Jinja expression error: {e}')
+  result['ms'] = round(timer.total() * 1000, 3)
+  return result
+
+
+def render_hosts(hosts, expr, enable_loop, loop_variable):
+  """
+  Render expr against every host on HOST_POOL. Returns the per-host results
+  in request order and the hosts grouped by identical output (or error),
+  largest group first.
+  """
+  results = list(HOST_POOL.map(lambda host: render_host(host, expr, enable_loop, loop_variable), hosts))
+  groups = {}
+  for result in results:
+    key = (result['status'], result.get('output', result.get('error')))
+    groups.setdefault(key, []).append(result['host'])
+  grouped = [{'status': status, ('output' if status == 'ok' else 'error'): value, 'hosts': names}
+             for (status, value), names in groups.items()]
+  grouped.sort(key=lambda group: -len(group['hosts']))
+  return results, grouped
+
+
+def record_render_history(json_text, expr, enable_loop, loop_variable, input_blob=None, output=None):
+  """
+  Record a render in history.
+  input_blob is the digest of an input already in the blob store, used
+  instead of json_text. output is the rendered result, kept (when [history]
+  record_outputs is on) as the baseline replay_history.py compares against.
+  Only saves if input is not empty. Entries already in history are handled
+  according to the [history] duplicates policy:
+  consecutive skips a repeat of the previous entry, skip ignores any entry
+  already in history and move_to_top removes the older copy before appending.
+  """
+  try:
+    # Check if input is not empty (after stripping whitespace)
+    if input_blob or json_text.strip():
+      ts = datetime.datetime.utcnow().isoformat() + 'Z'
+      entry = {
+          'datetime': ts,
+          'expr': expr,
+          'enable_loop': enable_loop,
+          'loop_variable': loop_variable
+      }
+      # Large inputs go to the blob store, repeated renders of one input share it
+      if input_blob:
+        entry['input_blob'] = input_blob
+      elif len(json_text) >= BLOB_MIN_BYTES:
+        entry['input_blob'] = BLOB_STORE.put_text(json_text)
+      else:
+        entry['input'] = json_text
+      if output is not None and config.getboolean('history', 'record_outputs', fallback=False):
+        if len(output) >= BLOB_MIN_BYTES:
+          entry['output_blob'] = BLOB_STORE.put_text(output)
+        else:
+          entry['output'] = output
+
+      policy = config.get('history', 'duplicates', fallback='consecutive')
+      if policy not in DUPLICATE_POLICIES:
+        policy = 'consecutive'
+      signature = entry_signature(entry)
+
+      with HISTORY_LOCK:
+        # Load existing history
+        hist = load_history(for_update=True)
+
+        if signature in HISTORY_INDEX:
+          if policy == 'skip':
+            return
+          if policy == 'consecutive' and hist and entries_are_identical(entry, hist[-1]):
+            return
+          if policy == 'move_to_top':
+            hist = HISTORY_INDEX.without(hist, signature)
+
+        hist.append(entry)
+        hist = hist[-MAX_ENTRIES:]
+        save_history(hist)
+  except Exception:
+    pass
+
 
 class JinjaHandler(BaseHTTPRequestHandler):
   def _send_headers(self, status=200, content_type='text/html', extra_headers=None):
@@ -201,53 +1331,100 @@ class JinjaHandler(BaseHTTPRequestHandler):
     self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
     self.send_header('Pragma', 'no-cache')
     self.send_header('Expires', '0')
+    timer = getattr(self, 'timer', None)
+    if timer:
+      self.send_header('Server-Timing', timer.server_timing())
     if extra_headers:
       for key, value in extra_headers.items():
         self.send_header(key, value)
     self.end_headers()
 
+  def send_response(self, code, message=None):
+    self.status_code = code
+    super().send_response(code, message)
+
   def do_GET(self):
+    self.timer = RequestTimer()
+    reload_config()
+    try:
+      self.handle_get()
+    finally:
+      self.record_request()
+
+  def do_POST(self):
+    self.timer = RequestTimer()
+    reload_config()
+    try:
+      self.handle_post()
+    finally:
+      self.record_request()
+
+  def is_admin(self):
+    """
+    Check the admin token sent in the X-Admin-Token header. It is never read
+    from the query string or form, where it would end up in logs and history.
+    """
+    return admin_token_valid(self.headers.get('X-Admin-Token', ''))
+
+  def record_request(self):
+    """Record timing statistics and metrics for the finished request."""
+    endpoint = urlparse(self.path).path
+    if endpoint not in KNOWN_ENDPOINTS:
+      endpoint = 'other'
+    TIMING_STATS.record(endpoint, self.timer)
+    HTTP_REQUESTS.inc(endpoint, self.command, str(getattr(self, 'status_code', 0)))
+    HTTP_REQUEST_SECONDS.observe(self.timer.total(), endpoint)
+
+  def handle_get(self):
     parsed = urlparse(self.path)
     path = parsed.path
     params = parse_qs(parsed.query)
 
     if path == '/history':
+      with self.timer.phase('history_read'):
+        raw_history = load_history()
+      with self.timer.phase('decode'):
+        decoded = decode_history_entries(raw_history)
+      with self.timer.phase('serialize'):
+        body = json.dumps(decoded, indent=2).encode('utf-8')
+      self._send_headers(200, 'application/json')
+      self.wfile.write(body)
+      return
+
+    if path == '/timings':
+      if params.get('reset', [''])[0] == 'true':
+        TIMING_STATS.reset()
       self._send_headers(200, 'application/json')
+      self.wfile.write(json.dumps(TIMING_STATS.snapshot(), indent=2).encode('utf-8'))
+      return
+
+    if path == '/debug/profile':
+      if not self.is_admin():
+        self._send_headers(403, 'application/json')
+        self.wfile.write(json.dumps({'error': 'Profiling requires a valid admin token'}).encode('utf-8'))
+        return
       try:
-        with open(JSON_HISTORY_PATH, 'r', encoding='utf-8') as hist_file:
-          raw_history = json.load(hist_file)
-      except Exception:
-        raw_history = []
-      decoded = []
-      for entry in raw_history:
-        e = entry.copy()
-        try:
-          e['input'] = base64.b64decode(e.get('input', '')).decode('utf-8')
-        except Exception:
-          pass
-        try:
-          e['expr'] = base64.b64decode(e.get('expr', '')).decode('utf-8')
-        except Exception:
-          pass
-        # Handle enable_loop as boolean (no base64 needed) - only if it exists
-        if 'enable_loop' in e:
-          e['enable_loop'] = e.get('enable_loop', False)
-          if isinstance(e['enable_loop'], str):
-            e['enable_loop'] = e['enable_loop'].lower() == 'true'
-        # Keep loop_variable as plain text (no base64 encoding) - only if it exists
-        if 'loop_variable' in e:
-          e['loop_variable'] = e.get('loop_variable', '')
-        decoded.append(e)
-      self.wfile.write(json.dumps(decoded, indent=2).encode('utf-8'))
+        seconds = float(params.get('seconds', ['5'])[0])
+        interval_ms = float(params.get('interval_ms', ['5'])[0])
+      except ValueError:
+        self._send_headers(400, 'application/json')
+        self.wfile.write(json.dumps({'error': 'seconds and interval_ms must be numbers'}).encode('utf-8'))
+        return
+      max_seconds = config.getfloat('debug', 'profile_max_seconds', fallback=60.0)
+      seconds = max(0.1, min(seconds, max_seconds))
+      report = sample_server(seconds, max(interval_ms, 1.0) / 1000, TEMPLATE_SOURCES)
+      self._send_headers(200, 'application/json')
+      self.wfile.write(json.dumps(report, indent=2).encode('utf-8'))
+      return
+
+    if path == '/metrics':
+      self._send_headers(200, METRICS_CONTENT_TYPE)
+      self.wfile.write(METRICS.render().encode('utf-8'))
       return
 
     if path == '/history/size':
       self._send_headers(200, 'application/json')
-      try:
-        with open(JSON_HISTORY_PATH, 'r', encoding='utf-8') as f:
-          hist = json.load(f)
-      except Exception:
-        hist = []
+      hist = load_history()
       self.wfile.write(json.dumps({'size': len(hist)}).encode('utf-8'))
       return
 
@@ -260,35 +1437,17 @@ class JinjaHandler(BaseHTTPRequestHandler):
       self._send_headers(200, 'application/json')
       section = params.get('section', [None])[0]
       if section:
-        data = dict(config[section]) if config.has_section(section) else {}
+        data = dict(config[section]) if config.has_section(section) and section not in PROTECTED_SECTIONS else {}
       else:
-        data = {s: dict(config[s]) for s in config.sections()}
+        data = {s: dict(config[s]) for s in config.sections() if s not in PROTECTED_SECTIONS}
       self.wfile.write(json.dumps(data, indent=2).encode('utf-8'))
       return
 
     if path == '/input-files':
       self._send_headers(200, 'application/json')
       try:
-        input_dir = config.get('input_files', 'directory', fallback='')
-        if not input_dir:
-          self.wfile.write(json.dumps([]).encode('utf-8'))
-          return
-
-        # Convert relative path to absolute if needed
-        if not os.path.isabs(input_dir):
-          input_dir = os.path.join(PROJECT_ROOT, input_dir)
-
-        if not os.path.exists(input_dir) or not os.path.isdir(input_dir):
-          self.wfile.write(json.dumps([]).encode('utf-8'))
-          return
-
-        files = []
-        for filename in os.listdir(input_dir):
-          filepath = os.path.join(input_dir, filename)
-          if os.path.isfile(filepath):
-            files.append(filename)
-
-        files.sort()
+        input_dir = input_directory()
+        files = INPUT_CATALOG.files(input_dir) if input_dir else []
         self.wfile.write(json.dumps(files).encode('utf-8'))
       except Exception:
         self.wfile.write(json.dumps([]).encode('utf-8'))
@@ -301,45 +1460,54 @@ class JinjaHandler(BaseHTTPRequestHandler):
         return
 
       try:
-        input_dir = config.get('input_files', 'directory', fallback='')
+        input_dir = input_directory()
         if not input_dir:
           self.send_error(404, 'Input directory not configured')
           return
 
-        # Convert relative path to absolute if needed
-        if not os.path.isabs(input_dir):
-          input_dir = os.path.join(PROJECT_ROOT, input_dir)
-
-        # Security check - prevent path traversal attacks
-        # Remove any path separators and ensure filename is safe
-        safe_filename = os.path.basename(filename)
-        if safe_filename != filename or '..' in filename or '/' in filename or '\\' in filename:
-          self.send_error(403, 'Access denied - invalid filename')
-          return
-
-        filepath = os.path.join(input_dir, safe_filename)
-
-        # Additional security check - ensure resolved path is within directory
-        try:
-          real_input_dir = os.path.realpath(input_dir)
-          real_filepath = os.path.realpath(filepath)
-          if not real_filepath.startswith(real_input_dir + os.sep):
-            self.send_error(403, 'Access denied - path traversal detected')
+        # Only files listed by the catalog are served, see InputCatalog.lookup
+        entry = INPUT_CATALOG.lookup(input_dir, filename)
+        headers = {'Accept-Ranges': 'bytes', 'X-File-Size': str(entry.size)}
+        status = 200
+        start, end = 0, entry.size
+        preview_kb = params.get('preview_kb', [None])[0]
+        if preview_kb is not None:
+          # First N KB only, cut at a character boundary
+          try:
+            end = min(entry.size, max(0, int(preview_kb)) * 1024)
+          except ValueError:
+            self.send_error(400, 'preview_kb must be an integer')
             return
-        except Exception:
-          self.send_error(403, 'Access denied - path resolution error')
-          return
-
-        if not os.path.exists(filepath) or not os.path.isfile(filepath):
-          self.send_error(404, 'File not found')
-          return
-
-        with open(filepath, 'r', encoding='utf-8') as f:
-          content = f.read()
-
-        self._send_headers(200, 'text/plain')
-        self.wfile.write(content.encode('utf-8'))
+          headers['X-Preview'] = 'true' if end < entry.size else 'false'
+        else:
+          byte_range = parse_range(self.headers.get('Range'), entry.size)
+          if byte_range:
+            start, end = byte_range
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end - 1}/{entry.size}'
+
+        if preview_kb is not None or entry.size < STREAM_MIN_BYTES:
+          with self.timer.phase('read_file'):
+            body = INPUT_CATALOG.read_range(entry, start, end)
+          if preview_kb is not None:
+            body = utf8_prefix(body)
+          headers['Content-Length'] = str(len(body))
+          self._send_headers(status, 'text/plain', headers)
+          self.wfile.write(body)
+        else:
+          # Large files go from the page cache to the socket without passing through Python
+          headers['Content-Length'] = str(end - start)
+          self._send_headers(status, 'text/plain', headers)
+          with self.timer.phase('send_file'):
+            send_file(self.wfile, entry.path, start, end)
         self.wfile.flush()
+      except InputFileError as e:
+        self.send_error(e.status, str(e))
+      except RangeNotSatisfiable:
+        self.send_response(416)
+        self.send_header('Content-Range', f'bytes */{entry.size}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
       except Exception as e:
         self.send_error(500, f'Error reading file: {e}')
       return
@@ -351,7 +1519,7 @@ class JinjaHandler(BaseHTTPRequestHandler):
     self._send_headers()
     self.wfile.write(HTML_PAGE.encode('utf-8'))
 
-  def do_POST(self):
+  def handle_post(self):
     global MAX_ENTRIES
     parsed = urlparse(self.path)
     path = parsed.path
@@ -361,33 +1529,42 @@ class JinjaHandler(BaseHTTPRequestHandler):
       self.handle_load_ansible_vars()
       return
 
-    length = int(self.headers.get('Content-Length', 0))
-    post_data = self.rfile.read(length)
-    params = parse_qs(post_data.decode())
+    # Form, JSON and multipart bodies all end up as {name: [values]}. Only /render
+    # refuses other content types, the other endpoints read them as forms as they always did.
+    try:
+      with self.timer.phase('read_body'):
+        params = read_form(self.rfile, self.headers, config.getint('server', 'max_body_bytes', fallback=0),
+                           lenient=path != '/render')
+    except FormError as e:
+      # The body may be partly unread, the connection cannot be reused
+      self.close_connection = True
+      self._send_headers(e.status, 'text/plain')
+      self.wfile.write(str(e).encode('utf-8'))
+      return
 
     if path == '/history/clear':
       count = params.get('count', [None])[0]
       try:
-        with open(JSON_HISTORY_PATH, 'r', encoding='utf-8') as f:
-          hist = json.load(f)
-      except Exception:
-        hist = []
-      original = len(hist)
-      if count is None:
-        hist = []
-        cleared = original
-      else:
-        try:
-          n = int(count)
-          cleared = min(n, original)
-          hist = hist[cleared:]
-        except Exception:
-          hist = []
-          cleared = original
-      # Create conf directory if it doesn't exist
-      os.makedirs(os.path.dirname(JSON_HISTORY_PATH), exist_ok=True)
-      with open(JSON_HISTORY_PATH, 'w', encoding='utf-8') as f:
-        json.dump(hist, f, indent=2)
+        with HISTORY_LOCK:
+          # Clearing everything must also work when the file is damaged
+          hist = load_history(for_update=count is not None)
+          original = len(hist)
+          if count is None:
+            hist = []
+            cleared = original
+          else:
+            try:
+              n = int(count)
+              cleared = min(n, original)
+              hist = hist[cleared:]
+            except Exception:
+              hist = []
+              cleared = original
+          save_history(hist)
+      except Exception as e:
+        self._send_headers(500, 'application/json')
+        self.wfile.write(json.dumps({'error': f'Failed to update history: {e}'}).encode('utf-8'))
+        return
       self._send_headers(200, 'application/json')
       self.wfile.write(json.dumps({'cleared': cleared, 'size': len(hist)}).encode('utf-8'))
       return
@@ -398,35 +1575,39 @@ class JinjaHandler(BaseHTTPRequestHandler):
         self._send_headers(400, 'application/json')
         self.wfile.write(json.dumps({'error': 'Missing section parameter'}).encode('utf-8'))
         return
-      if not config.has_section(section):
-        config[section] = {}
-
-      # Apply security validation for input_files directory changes
-      for k, v in params.items():
-        if k == 'section':
-          continue
-
-        # Security check for input directory
-        if section == 'input_files' and k == 'directory':
-          try:
-            safe_directory = validate_input_directory(v[0])
-            config[section][k] = safe_directory
-            if safe_directory != v[0]:
-              print(f"SECURITY: Input directory '{v[0]}' was sanitized to '{safe_directory}'")
-          except ValueError as e:
-            self._send_headers(400, 'application/json')
-            self.wfile.write(json.dumps({
-                'error': f'Security validation failed: {str(e)}',
-                'rejected_value': v[0]
-            }).encode('utf-8'))
-            return
-        else:
-          config[section][k] = v[0]
+      if section in PROTECTED_SECTIONS:
+        self._send_headers(403, 'application/json')
+        self.wfile.write(json.dumps({'error': f'Section {section} can only be changed in the configuration file'}).encode('utf-8'))
+        return
+      with CONFIG_LOCK:
+        # Pick up changes other processes made since this one read the file
+        config.read(CONF_PATH)
+        if not config.has_section(section):
+          config[section] = {}
+
+        # Apply security validation for input_files directory changes
+        for k, v in params.items():
+          if k == 'section':
+            continue
+
+          # Security check for input directory
+          if section == 'input_files' and k == 'directory':
+            try:
+              safe_directory = validate_input_directory(v[0])
+              config[section][k] = safe_directory
+              if safe_directory != v[0]:
+                print(f"SECURITY: Input directory '{v[0]}' was sanitized to '{safe_directory}'")
+            except ValueError as e:
+              self._send_headers(400, 'application/json')
+              self.wfile.write(json.dumps({
+                  'error': f'Security validation failed: {str(e)}',
+                  'rejected_value': v[0]
+              }).encode('utf-8'))
+              return
+          else:
+            config[section][k] = v[0]
 
-      # Create conf directory if it doesn't exist
-      os.makedirs(os.path.dirname(CONF_PATH), exist_ok=True)
-      with open(CONF_PATH, 'w', encoding='utf-8') as cf:
-        config.write(cf)
+        save_config()
       # update max entries if history section changed
       if section == 'history' and 'max_entries' in config['history']:
         try:
@@ -444,31 +1625,28 @@ class JinjaHandler(BaseHTTPRequestHandler):
         self.wfile.write(json.dumps({'error': 'Missing id parameter'}).encode('utf-8'))
         return
 
-      try:
-        with open(JSON_HISTORY_PATH, 'r', encoding='utf-8') as f:
-          hist = json.load(f)
-      except Exception:
-        hist = []
+      with HISTORY_LOCK:
+        hist = load_history()
+
+        # Find entry by ID and remove listener source
+        entry_found = False
+        for i, entry in enumerate(hist):
+          if entry.get('id') == entry_id:
+            if entry.get('source') == 'listener':
+              # Change to manual to indicate it was read (a copy, entries are shared with HISTORY_INDEX)
+              hist[i] = dict(entry, source='manual')
+            entry_found = True
+            break
 
-      # Find entry by ID and remove listener source
-      entry_found = False
-      for entry in hist:
-        if entry.get('id') == entry_id:
-          if entry.get('source') == 'listener':
-            entry['source'] = 'manual'  # Change to manual to indicate it was read
-          entry_found = True
-          break
+        # Save updated history
+        if entry_found:
+          save_history(hist)
 
       if not entry_found:
         self._send_headers(404, 'application/json')
         self.wfile.write(json.dumps({'error': 'Entry not found'}).encode('utf-8'))
         return
 
-      # Save updated history
-      os.makedirs(os.path.dirname(JSON_HISTORY_PATH), exist_ok=True)
-      with open(JSON_HISTORY_PATH, 'w', encoding='utf-8') as f:
-        json.dump(hist, f, indent=2)
-
       self._send_headers(200, 'application/json')
       self.wfile.write(json.dumps({'status': 'success', 'id': entry_id}).encode('utf-8'))
       return
@@ -480,175 +1658,159 @@ class JinjaHandler(BaseHTTPRequestHandler):
 
     json_text = params.get('input', [''])[0] or params.get('json', [''])[0]
     expr = params.get('expr', [''])[0]
+    # Name of a file in the input files directory to render against instead of input
+    input_file = params.get('input_file', [''])[0]
 
     # Loop parameters
     enable_loop = params.get('enable_loop', [''])[0] == 'true'
     loop_variable = params.get('loop_variable', [''])[0]
 
+    # One host per history entry or input file, see render_hosts
+    if params.get('host_entry') or params.get('host_file'):
+      self.handle_render_hosts(params, expr, enable_loop, loop_variable)
+      return
+
+    # Profiling is only available to requests carrying the admin token
+    profile = params.get('profile', [''])[0] == 'true'
+    if profile and not self.is_admin():
+      self._send_headers(403, 'application/json')
+      self.wfile.write(json.dumps({'error': 'Profiling requires a valid admin token'}).encode('utf-8'))
+      return
+
     # Try to parse as JSON first, then YAML if JSON fails
+    file_entry = None
     try:
-      data = json.loads(json_text)
-      input_format = 'JSON'
-    except json.JSONDecodeError:
-      try:
-        data = yaml.safe_load(json_text)
-        input_format = 'YAML'
-        # If yaml.safe_load returns None for empty string, treat as empty dict
-        if data is None:
-          data = {}
-      except yaml.YAMLError as e:
-        self._send_headers(400, 'text/plain')
-        self.wfile.write(f'Input parsing error (tried JSON and YAML): {e}'.encode())
-        return
-      except Exception as e:
-        self._send_headers(400, 'text/plain')
-        self.wfile.write(f'Input parsing error: {e}'.encode())
-        return
+      if input_file:
+        input_dir = input_directory()
+        if not input_dir:
+          raise InputFileError(404, 'Input directory not configured')
+        file_entry = INPUT_CATALOG.lookup(input_dir, input_file)
+        input_key = ('file',) + file_entry.key
+      else:
+        input_key = text_input_key(json_text)
+      # Repeated renders of deterministic templates are answered without even parsing the input.
+      # Building the key compiles the template, so it is timed as the compile phase.
+      with self.timer.phase('compile'):
+        result_key = None if profile else render_result_key(expr, input_key, enable_loop, loop_variable)
+      # A render counts as one cache lookup even when a dependency key is tried as well
+      cached = RESULT_CACHE.get(result_key, count=False) if result_key else None
+      if cached is None and file_entry is not None:
+        data, input_format = parse_input_file(file_entry, self.timer)
+      elif cached is None:
+        data, input_format = parse_input(json_text, self.timer, input_key)
+    except InputFileError as e:
+      RENDER_ERRORS.inc('input')
+      self._send_headers(e.status, 'text/plain')
+      self.wfile.write(f'Input file error: {e}'.encode())
+      return
+    except yaml.YAMLError as e:
+      RENDER_ERRORS.inc('input')
+      self._send_headers(400, 'text/plain')
+      self.wfile.write(f'Input parsing error (tried JSON and YAML): {e}'.encode())
+      return
+    except Exception as e:
+      RENDER_ERRORS.inc('input')
+      self._send_headers(400, 'text/plain')
+      self.wfile.write(f'Input parsing error: {e}'.encode())
+      return
 
+    # A newer render from the same browser tab supersedes this one
     try:
-      template = env.from_string(expr)
-
-      # Handle loop simulation
-      if enable_loop and loop_variable:
-        # Try to evaluate loop_variable as a Jinja2 expression first
-        try:
-          # If loop_variable contains Jinja2 expressions (filters, etc.), evaluate it
-          if '|' in loop_variable or '(' in loop_variable or '[' in loop_variable:
-            # Create context for evaluating the loop variable expression
-            # Include both individual variables and data object access
-            context = data.copy()
-            context['data'] = data
-
-            # Evaluate as Jinja2 expression
-            loop_template = env.from_string('{{ ' + loop_variable + ' }}')
-            loop_result = loop_template.render(**context)
-
-            # Try to parse the result as Python literal (for lists, dicts, etc.)
-            try:
-              loop_data = ast.literal_eval(loop_result)
-            except (ValueError, SyntaxError):
-              # If literal_eval fails, try JSON parsing
-              try:
-                loop_data = json.loads(loop_result)
-              except json.JSONDecodeError:
-                raise ValueError(f"Loop variable expression '{loop_variable}' did not evaluate to a valid list/array")
-          else:
-            # Navigate to the loop variable in the data (original behavior for simple paths)
-            loop_data = data
-            parts = loop_variable.split('.')
-
-            # Handle special case where first part is 'data' (refers to root)
-            if parts[0] == 'data':
-              # Skip 'data' prefix and start from the actual data
-              parts = parts[1:]
-
-            # Navigate through the remaining path
-            for part in parts:
-              if isinstance(loop_data, dict) and part in loop_data:
-                loop_data = loop_data[part]
-              else:
-                raise ValueError(f"Loop variable '{part}' not found in input data")
-
-        except Exception as e:
-          raise ValueError(f"Error evaluating loop variable '{loop_variable}': {str(e)}")
-
-        if not isinstance(loop_data, list):
-          raise ValueError(f"Loop variable '{loop_variable}' must evaluate to an array/list, got {type(loop_data).__name__}")
-
-        # Process each item in the loop
-        results = []
-        for item in loop_data:
-          # Create context with the original data plus the current item
-          loop_context = data.copy()
-          loop_context['item'] = item
-          loop_context['data'] = data  # Also provide access to original data
-
-          # Render template for this iteration
-          iteration_output = template.render(**loop_context)
-
-          # Try to parse as JSON, otherwise keep as string
-          try:
-            parsed_iteration = json.loads(iteration_output)
-            results.append(parsed_iteration)
-          except BaseException:
-            results.append(iteration_output)
-
-        # Format final output as JSON array
-        output = json.dumps(results, indent=2)
-        actual_type = type(results).__name__  # This will be 'list'
-        headers = {
-            'X-Result-Type': 'json',
-            'X-Input-Format': input_format,
-            'X-Loop-Enabled': 'true',
-            'X-Actual-Type': actual_type}
+      render_seq = int(params.get('render_seq', ['0'])[0])
+    except ValueError:
+      render_seq = 0
+    ticket = RENDER_SLOTS.claim(params.get('client_id', [''])[0], render_seq)
+    try:
+      # Inputs that only differ in variables the template does not read share results
+      dependency_key = None
+      if cached is None and result_key is not None:
+        dependency_key = render_dependency_key(expr, input_key, data, input_format, enable_loop, loop_variable)
+        cached = RESULT_CACHE.get(dependency_key, count=False) if dependency_key else None
+        if cached is not None:
+          # Repeats of this exact input can now skip parsing too
+          RESULT_CACHE.alias(result_key, dependency_key)
+      if result_key is not None:
+        RESULT_CACHE.record(cached is not None)
+
+      if profile:
+        (output, headers), report = profile_call(
+            lambda: render_template(expr, data, input_format, enable_loop, loop_variable, self.timer),
+            TEMPLATE_SOURCES, sort=params.get('profile_sort', ['cumulative'])[0])
+      elif cached is not None:
+        output, headers = cached[0], dict(cached[1], **{'X-Render-Cache': 'hit'})
+        RENDER_OUTCOMES.inc('cached')
       else:
-        # Normal processing without loop - provide access to both individual vars and data object
-        context = data.copy()
-        context['data'] = data
-        output = template.render(**context)
-
-        # The actual type is always string for Jinja2 template output
-        # But we detect the content type for formatting purposes
-        actual_type = 'str'  # Jinja2 always returns strings
-
-        # Try to parse and format as JSON if possible, otherwise keep as string
-        try:
-          parsed_out = json.loads(output)
-          output = json.dumps(parsed_out, indent=2)
-          headers = {'X-Result-Type': 'json', 'X-Input-Format': input_format, 'X-Actual-Type': actual_type}
-        except BaseException:
-          try:
-            # Try to safely evaluate as Python literal (dict, list, etc.)
-            python_obj = ast.literal_eval(output)
-            output = json.dumps(python_obj, indent=2)
-            headers = {'X-Result-Type': 'json', 'X-Input-Format': input_format, 'X-Actual-Type': actual_type}
-          except BaseException:
-            # If all parsing attempts fail, treat as string
-            headers = {'X-Result-Type': 'string', 'X-Input-Format': input_format, 'X-Actual-Type': actual_type}
-
-      # Record - only save to history if input is not empty and not identical to previous entry
-      try:
-        # Check if input is not empty (after stripping whitespace)
-        if json_text.strip():
-          ts = datetime.datetime.utcnow().isoformat() + 'Z'
-          entry = {
-              'datetime': ts,
-              'input': base64.b64encode(json_text.encode('utf-8')).decode('ascii'),
-              'expr': base64.b64encode(expr.encode('utf-8')).decode('ascii'),
-              'enable_loop': enable_loop,
-              'loop_variable': loop_variable
-          }
-
-          # Load existing history
-          try:
-            with open(JSON_HISTORY_PATH, 'r', encoding='utf-8') as hf:
-              hist = json.load(hf)
-          except Exception:
-            hist = []
+        # Identical renders running at the same time share one computation
+        (output, headers), shared = RENDER_FLIGHTS.run(
+            (expr, input_key, enable_loop, loop_variable), ticket,
+            lambda check: cached_render(result_key, dependency_key, expr, data, input_format, enable_loop,
+                                        loop_variable, self.timer, check))
+        if shared:
+          RENDER_OUTCOMES.inc('coalesced')
+          headers = dict(headers, **{'X-Render-Shared': 'true'})
+        else:
+          RENDER_OUTCOMES.inc('computed')
+
+      # Like record_render_history, a failure to record must not fail the render
+      with self.timer.phase('history'), contextlib.suppress(Exception):
+        if file_entry is None:
+          record_render_history(json_text, expr, enable_loop, loop_variable, output=output)
+        elif file_entry.size < BLOB_MIN_BYTES:
+          record_render_history(read_input_file(file_entry, self.timer), expr, enable_loop, loop_variable,
+                                output=output)
+        else:
+          record_render_history('', expr, enable_loop, loop_variable, input_file_blob(file_entry, self.timer),
+                                output)
 
-          # Check if this entry is identical to the last one (excluding datetime)
-          should_save = True
-          if hist:
-            last_entry = hist[-1]
-            if entries_are_identical(entry, last_entry):
-              should_save = False
-
-          # Only save if the entry is different from the previous one
-          if should_save:
-            hist.append(entry)
-            hist = hist[-MAX_ENTRIES:]
-            # Create conf directory if it doesn't exist
-            os.makedirs(os.path.dirname(JSON_HISTORY_PATH), exist_ok=True)
-            with open(JSON_HISTORY_PATH, 'w', encoding='utf-8') as hf:
-              json.dump(hist, hf, indent=2)
-      except Exception:
-        pass
+      if profile:
+        self._send_headers(200, 'application/json', headers)
+        self.wfile.write(json.dumps({'output': output, 'profile': report}, indent=2).encode('utf-8'))
+        return
 
       self._send_headers(200, 'text/plain', headers)
       self.wfile.write(output.encode())
+    except RenderSuperseded as e:
+      RENDER_OUTCOMES.inc('superseded')
+      self._send_headers(409, 'text/plain')
+      self.wfile.write(str(e).encode())
     except Exception as e:
+      RENDER_ERRORS.inc('template')
       self._send_headers(400, 'text/plain')
       self.wfile.write(f'Jinja expression error: {e}'.encode())
+    finally:
+      RENDER_SLOTS.release(ticket)
+
+  def handle_render_hosts(self, params, expr, enable_loop, loop_variable):
+    """Render one expression against many hosts and answer with per-host and grouped results."""
+    try:
+      with self.timer.phase('history_read'):
+        hist = load_history() if params.get('host_entry') else []
+      with self.timer.phase('resolve_hosts'):
+        hosts = host_inputs(hist, params.get('host_entry', []), params.get('host_file', []))
+    except InputFileError as e:
+      RENDER_ERRORS.inc('input')
+      self._send_headers(e.status, 'application/json')
+      self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+      return
+    max_hosts = config.getint('render', 'max_hosts', fallback=1000)
+    if max_hosts and len(hosts) > max_hosts:
+      self._send_headers(413, 'application/json')
+      self.wfile.write(json.dumps({'error': f'{len(hosts)} hosts exceed the limit of {max_hosts}'}).encode('utf-8'))
+      return
+
+    with self.timer.phase('render_hosts'):
+      results, groups = render_hosts(hosts, expr, enable_loop, loop_variable)
+    response = {
+        'hosts': results,
+        'groups': groups,
+        'summary': {
+            'hosts': len(results),
+            'distinct_outputs': sum(1 for group in groups if group['status'] == 'ok'),
+            'errors': sum(1 for result in results if result['status'] != 'ok')
+        }
+    }
+    self._send_headers(200, 'application/json')
+    self.wfile.write(json.dumps(response, indent=2).encode('utf-8'))
 
   def handle_load_ansible_vars(self):
     """Handle loading variables from Ansible module."""
@@ -668,65 +1830,68 @@ class JinjaHandler(BaseHTTPRequestHandler):
             'variables_count': 0,
             'listener_enabled': False
         }
+        LISTENER_PUSHES.inc('discarded')
         self._send_headers(200, 'application/json')
         self.wfile.write(json.dumps(response, indent=2).encode())
         return
 
-      content_length = int(self.headers['Content-Length'])
-      post_data = self.rfile.read(content_length)
-      data = json.loads(post_data.decode('utf-8'))
-
-      # Extract base64 encoded variables from module
-      variables_b64 = data.get('variables_b64', '')
-      summary = data.get('summary', {})
-
-      # Decode to verify it's valid
       try:
-        variables_json = base64.b64decode(variables_b64).decode('utf-8')
-        variables = json.loads(variables_json)
-      except Exception as e:
-        raise ValueError(f"Invalid base64 variables data: {e}")
+        content_length = int(self.headers['Content-Length'])
+      except (TypeError, ValueError):
+        self.send_error(411, "Content-Length required")
+        return
+      max_body = config.getint('listener', 'max_body_bytes', fallback=128 * 1024 * 1024)
+      if max_body and content_length > max_body:
+        LISTENER_PUSHES.inc('too_large')
+        self.close_connection = True
+        self._send_headers(413, 'application/json')
+        self.wfile.write(json.dumps({
+            'status': 'error',
+            'message': f'Request body of {content_length} bytes exceeds the {max_body} byte limit'
+        }).encode())
+        return
+
+      # Decode, validate and count the variables while reading the body,
+      # storing them once as a blob instead of inline in the history file
+      with self.timer.phase('ingest'):
+        envelope, digest, _, variables_count = ingest_ansible_vars(self.rfile, content_length, BLOB_STORE)
+        summary = envelope.get('summary', {})
 
       # Create history entry
       # Don't set default values for listener entries to preserve existing content
       entry = {
           'id': str(uuid.uuid4()),
           'datetime': datetime.datetime.now().isoformat() + 'Z',
-          'input': variables_b64,
-          'expr': base64.b64encode(''.encode()).decode(),  # Empty expr to preserve current content
+          'input_blob': digest,
+          'expr': '',  # Empty expr to preserve current content
           # Don't set enable_loop and loop_variable to preserve current loop settings
           'source': 'listener',
           'summary': summary
       }
 
       # Save to history
-      try:
-        with open(JSON_HISTORY_PATH, 'r', encoding='utf-8') as hf:
-          hist = json.load(hf)
-      except Exception:
-        hist = []
-
-      hist.append(entry)
-      hist = hist[-MAX_ENTRIES:]
-
-      os.makedirs(os.path.dirname(JSON_HISTORY_PATH), exist_ok=True)
-      with open(JSON_HISTORY_PATH, 'w', encoding='utf-8') as hf:
-        json.dump(hist, hf, indent=2)
+      with self.timer.phase('history'), HISTORY_LOCK:
+        hist = load_history(for_update=True)
+        hist.append(entry)
+        hist = hist[-MAX_ENTRIES:]
+        save_history(hist)
 
       # Return success response
       response = {
           'status': 'success',
           'message': 'Variables loaded from Ansible module',
-          'variables_count': len(variables),
+          'variables_count': variables_count,
           'summary': summary,
           'entry_id': len(hist) - 1,
           'listener_enabled': True
       }
 
+      LISTENER_PUSHES.inc('accepted')
       self._send_headers(200, 'application/json')
       self.wfile.write(json.dumps(response, indent=2).encode())
 
     except Exception as e:
+      LISTENER_PUSHES.inc('error')
       self._send_headers(500, 'application/json')
       error_response = {
           'status': 'error',
@@ -735,6 +1900,37 @@ class JinjaHandler(BaseHTTPRequestHandler):
       self.wfile.write(json.dumps(error_response).encode())
 
 
+# History file changes, pushed to /events subscribers by the asyncio server core
+HISTORY_EVENTS = Broadcaster(history_stamp, 1.0)
+
+
+def history_event_stream():
+  """Server-sent 'history' events, sent whenever the history file changes."""
+  return event_stream(HISTORY_EVENTS, 'history', lambda stamp: json.dumps({'size': stamp[1] if stamp else 0}))
+
+
+# WSGI callable for production servers, e.g. gunicorn --preload -w 4 ansible_jinja2_playground:application
+application = WSGIApplication(JinjaHandler)
+
+
+def serve():
+  """
+  Serve JinjaHandler with the core selected by [server] core: 'threading'
+  (a thread per connection) or 'asyncio' (event loop with a worker pool,
+  plus the /events stream).
+  """
+  core = config.get('server', 'core', fallback='threading')
+  if core == 'asyncio':
+    workers = config.getint('server', 'workers', fallback=0) or None
+    AsyncHTTPServer(JinjaHandler, HOST, PORT, workers, streams={'/events': history_event_stream}).serve_forever()
+    return
+  if core != 'threading':
+    print(f"WARNING: Unknown server core '{core}', using threading")
+  ThreadingHTTPServer((HOST, PORT), JinjaHandler).serve_forever()
+
+
 if __name__ == '__main__':
+  if collect_orphan_blobs():
+    print("Removed unreferenced history blobs")
   print(f"Server started at http://{HOST}:{PORT}")
-  HTTPServer((HOST, PORT), JinjaHandler).serve_forever()
+  serve()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for Ansible filters and tests inside ansible_jinja2_playground.
+
+This script:
+1. Discovers filters and tests with AnsibleFilterScanner
+2. Times each one in the playground's sandboxed environment over
+   representative inputs (scanner test case, compiled and rendered each
+   time, then strings, lists and dicts from 10 up to 10k elements)
+3. Reports ops/sec and latency percentiles and saves them as JSON
+4. Compares two saved runs to spot regressions after upgrading ansible-core
+
+Usage:
+  python ansible-jinja2-playground/benchmark_ansible_filters.py
+  python ansible-jinja2-playground/benchmark_ansible_filters.py --only to_json,unique
+  python ansible-jinja2-playground/benchmark_ansible_filters.py --compare old.json new.json
+"""
+
+import collections
+import json
+import os
+import platform
+import sys
+import time
+import datetime
+from collections.abc import Iterator
+from typing import Any, Callable, Dict, List, Optional
+
+import jinja2
+
+from scan_ansible_filters import AnsibleFilterScanner
+
+# Importing the playground gives us the exact environment used by /render
+from ansible_jinja2_playground import FILTER_MEMO, env
+
+DEFAULT_SIZES = [10, 1000, 10000]
+DEFAULT_ITERATIONS = 200
+DEFAULT_MAX_TIME = 0.5
+DEFAULT_THRESHOLD = 25.0
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+  """Returns the nearest-rank percentile of an already sorted sample list."""
+  if not sorted_samples:
+    return 0.0
+  rank = int(round(pct / 100.0 * (len(sorted_samples) - 1)))
+  return sorted_samples[max(0, min(rank, len(sorted_samples) - 1))]
+
+
+def consume(result: Any) -> Any:
+  """Runs lazy results (zip, product, generators) to the end so their work is timed too."""
+  if isinstance(result, Iterator):
+    collections.deque(result, maxlen=0)
+  return result
+
+
+def build_inputs(sizes: List[int]) -> Dict[str, Any]:
+  """Builds the representative input data, keyed by workload name."""
+  inputs = {'str_small': 'foo bar'}
+  for size in sizes:
+    inputs[f'str_{size}'] = ('abc 123 ' * (size // 8 + 1))[:size]
+    inputs[f'list_{size}'] = list(range(size))
+    inputs[f'dict_{size}'] = {f'key{i}': i for i in range(size)}
+  return inputs
+
+
+class AnsibleFilterBenchmark:
+  """Times every registered filter and test over several input sizes."""
+
+  def __init__(self, sizes: Optional[List[int]] = None,
+               iterations: int = DEFAULT_ITERATIONS,
+               max_time: float = DEFAULT_MAX_TIME):
+    self.sizes = sizes or DEFAULT_SIZES
+    self.iterations = iterations
+    self.max_time = max_time
+    self.scanner = AnsibleFilterScanner()
+    self.inputs = build_inputs(self.sizes)
+    # For filters and tests taking the template context (map, select, unique...)
+    self.context = env.from_string('').new_context()
+    # Repeated calls with the same input would only time memo lookups
+    FILTER_MEMO.disable(env.filters)
+    self.results = {
+        'ansible_version': self.scanner.results['ansible_version'],
+        'jinja2_version': jinja2.__version__,
+        'python_version': platform.python_version(),
+        'created': datetime.datetime.utcnow().isoformat() + 'Z',
+        'config': {
+            'sizes': self.sizes,
+            'iterations': iterations,
+            'max_time': max_time
+        },
+        'filters': {},
+        'tests': {}
+    }
+
+  def time_call(self, func: Callable[[], Any]) -> Dict[str, Any]:
+    """Calls func repeatedly and returns timing statistics."""
+    samples = []
+    try:
+      func()
+      deadline = time.perf_counter() + self.max_time
+      while len(samples) < self.iterations:
+        start = time.perf_counter()
+        func()
+        end = time.perf_counter()
+        samples.append(end - start)
+        if end > deadline:
+          break
+    except Exception as e:
+      return {'status': 'error', 'error': str(e)[:200]}
+
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    return {
+        'status': 'ok',
+        'samples': len(samples),
+        'ops_per_sec': (1.0 / mean) if mean > 0 else 0.0,
+        'mean_us': mean * 1e6,
+        'p50_us': percentile(samples, 50) * 1e6,
+        'p95_us': percentile(samples, 95) * 1e6,
+        'p99_us': percentile(samples, 99) * 1e6,
+        'max_us': samples[-1] * 1e6
+    }
+
+  def benchmark_one(self, name: str, kind: str, test_case: Optional[str]) -> Dict[str, Any]:
+    """Benchmarks a single filter or test over every workload."""
+    registry = env.filters if kind == 'filter' else env.tests
+    if name not in registry:
+      return {'registered': False, 'workloads': {}}
+    call = env.call_filter if kind == 'filter' else env.call_test
+
+    workloads = {}
+    if test_case:
+      # Test cases only use literals, so Jinja calls the filter or test while
+      # folding constants at compile time and a template compiled once would
+      # render a constant. This workload times compile + render, unlike
+      # /render, which reuses compiled templates.
+      workloads['case_compile'] = self.time_call(lambda: env.from_string(test_case).render())
+
+    # Inputs are passed to the filter or test directly, so the time spent
+    # turning large results into output text is not measured
+    for workload, value in self.inputs.items():
+      workloads[workload] = self.time_call(lambda: consume(call(name, value, context=self.context)))
+
+    return {'registered': True, 'workloads': workloads}
+
+  def run(self, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Discovers filters and tests and benchmarks all of them."""
+    test_cases = self.scanner.generate_test_cases()
+    all_filters = self.scanner.discover_all_filters()
+    all_tests = self.scanner.discover_all_tests()
+
+    print("\n⏱️  BENCHMARKING FILTERS AND TESTS...")
+    for kind, discovered, bucket in (('filter', all_filters, 'filters'), ('test', all_tests, 'tests')):
+      for module_name, members in discovered.items():
+        for name in sorted(members):
+          if only and name not in only:
+            continue
+          result = self.benchmark_one(name, kind, test_cases.get(name))
+          result['module'] = module_name
+          self.results[bucket][name] = result
+          self.print_result(kind, name, result)
+
+    return self.results
+
+  def print_result(self, kind: str, name: str, result: Dict[str, Any]):
+    """Prints a one-line summary for a benchmarked filter or test."""
+    if not result['registered']:
+      print(f"⚠️  {kind} {name}: not registered in the playground environment")
+      return
+    ok = {w: r for w, r in result['workloads'].items() if r['status'] == 'ok'}
+    if not ok:
+      print(f"❌ {kind} {name}: no workload accepted")
+      return
+    parts = [f"{w}={r['ops_per_sec']:.0f}/s" for w, r in ok.items()]
+    print(f"✅ {kind} {name}: " + ', '.join(parts))
+
+  def save_results(self, filename: str):
+    """Saves complete benchmark results to a JSON file."""
+    with open(filename, 'w', encoding='utf-8') as f:
+      json.dump(self.results, f, indent=2, ensure_ascii=False)
+    print(f"💾 Results saved to: {filename}")
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any],
+                    threshold: float = DEFAULT_THRESHOLD) -> Dict[str, List[Dict[str, Any]]]:
+  """
+  Compares two benchmark runs by median latency.
+  Returns regressions and improvements beyond threshold percent.
+  """
+  diff = {'regressions': [], 'improvements': [], 'missing': []}
+  for bucket in ('filters', 'tests'):
+    for name, base_result in baseline.get(bucket, {}).items():
+      cur_result = current.get(bucket, {}).get(name)
+      for workload, base in base_result.get('workloads', {}).items():
+        if base.get('status') != 'ok':
+          continue
+        cur = (cur_result or {}).get('workloads', {}).get(workload)
+        if not cur or cur.get('status') != 'ok':
+          diff['missing'].append({'name': name, 'type': bucket[:-1], 'workload': workload})
+          continue
+        if base['p50_us'] <= 0:
+          continue
+        change = (cur['p50_us'] - base['p50_us']) / base['p50_us'] * 100.0
+        row = {
+            'name': name,
+            'type': bucket[:-1],
+            'workload': workload,
+            'baseline_p50_us': base['p50_us'],
+            'current_p50_us': cur['p50_us'],
+            'change_pct': change
+        }
+        if change > threshold:
+          diff['regressions'].append(row)
+        elif change < -threshold:
+          diff['improvements'].append(row)
+
+  diff['regressions'].sort(key=lambda r: -r['change_pct'])
+  diff['improvements'].sort(key=lambda r: r['change_pct'])
+  return diff
+
+
+def print_comparison(baseline: Dict[str, Any], current: Dict[str, Any],
+                     diff: Dict[str, List[Dict[str, Any]]], threshold: float):
+  """Prints the comparison between two benchmark runs."""
+  print(f"📊 Baseline: ansible {baseline.get('ansible_version')} ({baseline.get('created')})")
+  print(f"📊 Current:  ansible {current.get('ansible_version')} ({current.get('created')})")
+  print(f"📏 Threshold: {threshold:.1f}% on median latency")
+
+  for title, rows in (('🐢 REGRESSIONS', diff['regressions']), ('🚀 IMPROVEMENTS', diff['improvements'])):
+    print(f"\n{title} ({len(rows)}):")
+    for row in rows:
+      print(f"  {row['type']} {row['name']} [{row['workload']}]: "
+            f"{row['baseline_p50_us']:.1f}us -> {row['current_p50_us']:.1f}us ({row['change_pct']:+.1f}%)")
+
+  if diff['missing']:
+    print(f"\n⚠️  NO LONGER WORKING ({len(diff['missing'])}):")
+    for row in diff['missing']:
+      print(f"  {row['type']} {row['name']} [{row['workload']}]")
+
+
+def main():
+  """Main function of the script."""
+  import argparse
+
+  parser = argparse.ArgumentParser(
+      description='Filter/test microbenchmark for ansible_jinja2_playground')
+  parser.add_argument('--output', default='ansible_filter_benchmark.json',
+                      help='JSON output file (default: ansible_filter_benchmark.json)')
+  parser.add_argument('--only', default='',
+                      help='Comma separated list of filter/test names to benchmark')
+  parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                      help='Comma separated input sizes (default: 10,1000,10000)')
+  parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS,
+                      help=f'Maximum samples per workload (default: {DEFAULT_ITERATIONS})')
+  parser.add_argument('--max-time', type=float, default=DEFAULT_MAX_TIME,
+                      help=f'Maximum seconds spent per workload (default: {DEFAULT_MAX_TIME})')
+  parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                      help='Compare two saved benchmark runs instead of benchmarking')
+  parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                      help=f'Percent change reported as regression (default: {DEFAULT_THRESHOLD})')
+  parser.add_argument('--fail-on-regression', action='store_true',
+                      help='Exit with status 1 when the comparison finds regressions')
+
+  args = parser.parse_args()
+
+  try:
+    if args.compare:
+      with open(args.compare[0], 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+      with open(args.compare[1], 'r', encoding='utf-8') as f:
+        current = json.load(f)
+      diff = compare_results(baseline, current, args.threshold)
+      print_comparison(baseline, current, diff, args.threshold)
+      if args.fail_on_regression and diff['regressions']:
+        return 1
+      return 0
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    only = [n.strip() for n in args.only.split(',') if n.strip()] or None
+    benchmark = AnsibleFilterBenchmark(sizes, args.iterations, args.max_time)
+    benchmark.run(only)
+    benchmark.save_results(os.path.abspath(args.output))
+
+  except KeyboardInterrupt:
+    print("\n\n⚠️  Benchmark interrupted by user")
+    return 1
+  except Exception as e:
+    print(f"\n\n❌ Error during benchmark: {e}")
+    return 1
+
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Ansible Jinja2 Playground - Command-line renderer
+Renders a template without the HTTP server, with the same environment as
+the playground: Ansible filters and tests, StrictUndefined and the loop
+simulation of the web interface.
+
+Each input file (or stdin) is parsed as JSON or YAML and rendered once.
+With --ndjson every line of the inputs is a JSON object rendered on its
+own and written as one JSON line, so inputs of any size are streamed
+through one compiled template; --jobs spreads the records over several
+processes while keeping their order.
+
+Usage:
+  python ansible-jinja2-playground/cli.py '{{ ansible_hostname | upper }}' facts.json
+  python ansible-jinja2-playground/cli.py -t template.j2 --loop users vars.yaml
+  cat hosts.ndjson | python ansible-jinja2-playground/cli.py --ndjson --jobs 8 '{{ name }}: {{ ip | ipaddr }}'
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import json
+import os
+import sys
+from collections.abc import Mapping
+from typing import Iterator, List, Optional, Tuple
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+# stdout carries the rendered output, keep anything printed while loading the playground off it
+with contextlib.redirect_stdout(sys.stderr):
+  import ansible_jinja2_playground as playground  # noqa: E402
+
+# A record is (source, text): source names it in error messages (file name or file:line)
+Record = Tuple[str, str]
+
+
+def render_text(expr: str, loop_variable: str, text: str, timer) -> str:
+  """Parse input text as JSON or YAML and render expr against it like the /render endpoint."""
+  data, input_format = playground.parse_input(text, timer)
+  if not isinstance(data, Mapping):
+    raise ValueError(f'Input must be an object/mapping, got {type(data).__name__}')
+  output, _ = playground.render_template(expr, data, input_format, bool(loop_variable), loop_variable, timer)
+  return output
+
+
+def render_record(expr: str, loop_variable: str, text: str, timer) -> str:
+  """Render expr against one NDJSON record and return the output as a single JSON line."""
+  data = json.loads(text)
+  if not isinstance(data, dict):
+    raise ValueError(f'Record must be a JSON object, got {type(data).__name__}')
+  output, headers = playground.render_template(expr, data, 'JSON', bool(loop_variable), loop_variable, timer)
+  if headers['X-Result-Type'] == 'json':
+    return json.dumps(json.loads(output), ensure_ascii=False, separators=(',', ':'))
+  return json.dumps(output, ensure_ascii=False)
+
+
+def render_batch(expr: str, loop_variable: str, ndjson: bool,
+                 records: List[Record]) -> List[Tuple[str, Optional[str], Optional[str]]]:
+  """
+  Render a batch of records. Runs in a worker process with --jobs.
+  Returns (source, output, error) per record; the template is compiled once per process.
+  """
+  render = render_record if ndjson else render_text
+  timer = playground.RequestTimer()
+  results = []
+  for source, text in records:
+    try:
+      results.append((source, render(expr, loop_variable, text, timer), None))
+    except Exception as e:
+      results.append((source, None, f'{type(e).__name__}: {e}'))
+  return results
+
+
+@contextlib.contextmanager
+def open_input(path: str):
+  """Open an input file, '-' being stdin."""
+  if path == '-':
+    yield sys.stdin
+  else:
+    with open(path, 'r', encoding='utf-8') as f:
+      yield f
+
+
+def read_batches(paths: List[str], ndjson: bool, batch_size: int) -> Iterator[List[Record]]:
+  """Yield batches of records: one per file, or batch_size NDJSON lines at a time across files."""
+  batch: List[Record] = []
+  for path in paths:
+    name = 'stdin' if path == '-' else path
+    with open_input(path) as f:
+      if not ndjson:
+        yield [(name, f.read())]
+        continue
+      for lineno, line in enumerate(f, 1):
+        if line.strip():
+          batch.append((f'{name}:{lineno}', line))
+          if len(batch) >= batch_size:
+            yield batch
+            batch = []
+  if batch:
+    yield batch
+
+
+def run_batches(batches: Iterator[List[Record]], expr: str, loop_variable: str, ndjson: bool,
+                jobs: int) -> Iterator[List[Tuple[str, Optional[str], Optional[str]]]]:
+  """
+  Render batches in order. With jobs > 1 they are rendered by a process pool
+  with at most a few batches per worker in flight, so memory stays bounded
+  however long the input is.
+  """
+  if jobs <= 1:
+    for batch in batches:
+      yield render_batch(expr, loop_variable, ndjson, batch)
+    return
+  with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+    pending: collections.deque = collections.deque()
+    for batch in batches:
+      pending.append(pool.submit(render_batch, expr, loop_variable, ndjson, batch))
+      if len(pending) >= jobs * 4:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+
+
+def main():
+  """Main function of the script."""
+  parser = argparse.ArgumentParser(
+      description='Render an Ansible Jinja2 template against JSON/YAML files, stdin or NDJSON records')
+  parser.add_argument('expr', nargs='?', help='Template to render (or use --template-file)')
+  parser.add_argument('inputs', nargs='*', default=['-'],
+                      help="Input files, '-' for stdin (default: stdin)")
+  parser.add_argument('-t', '--template-file', help='Read the template from this file')
+  parser.add_argument('--loop', default='', metavar='VARIABLE',
+                      help="Render once per item of this list (path like 'users' or an expression), "
+                           "the item being 'item'")
+  parser.add_argument('--ndjson', action='store_true',
+                      help='Each input line is a JSON object rendered on its own; outputs are written as JSON lines')
+  parser.add_argument('-j', '--jobs', type=int, default=1,
+                      help='Worker processes (default: 1, 0 for the number of CPUs)')
+  parser.add_argument('--batch-size', type=int, default=256,
+                      help='NDJSON records sent to a worker at a time (default: 256)')
+  parser.add_argument('-o', '--output', default='-', help="Output file (default: '-' for stdout)")
+  parser.add_argument('--fail-fast', action='store_true', help='Stop at the first render error')
+  args = parser.parse_args()
+
+  if args.template_file:
+    if args.expr is not None:
+      # With a template file every positional argument is an input
+      args.inputs = [args.expr] + (args.inputs if args.inputs != ['-'] else [])
+    with open(args.template_file, 'r', encoding='utf-8') as f:
+      expr = f.read()
+  elif args.expr is None:
+    parser.error('a template (expr or --template-file) is required')
+  else:
+    expr = args.expr
+  jobs = args.jobs or os.cpu_count() or 1
+
+  try:
+    # Report syntax errors once instead of once per record
+    playground.compile_template(expr)
+  except Exception as e:
+    print(f"❌ Template error: {e}", file=sys.stderr)
+    return 1
+
+  failed = 0
+  out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+  try:
+    batches = read_batches(args.inputs, args.ndjson, max(1, args.batch_size))
+    for results in run_batches(batches, expr, args.loop, args.ndjson, jobs):
+      for source, output, error in results:
+        if error is not None:
+          failed += 1
+          print(f"❌ {source}: {error}", file=sys.stderr)
+          if args.fail_fast:
+            return 1
+        else:
+          out.write(output + '\n')
+  except (OSError, UnicodeDecodeError) as e:
+    print(f"❌ Error: {e}", file=sys.stderr)
+    return 1
+  except KeyboardInterrupt:
+    return 130
+  finally:
+    if out is not sys.stdout:
+      out.close()
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
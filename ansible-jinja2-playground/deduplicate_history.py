@@ -4,16 +4,42 @@ History Deduplication Script for Ansible Jinja2 Playground
 
 This script removes duplicate entries from the history file while preserving
 the most recent occurrence of each unique entry.
+
+With --stream the file is read incrementally in two passes and only a
+fixed-size digest is kept per unique entry, so histories of any size can
+be cleaned without loading them into memory.
+
+The file is read and rewritten under the same .lock file the server
+holds while it writes the history, so renders recorded meanwhile are
+not lost.
 """
 
 import json
 import base64
+import codecs
+import hashlib
 import os
 import sys
 import argparse
+import tempfile
+import time
+import uuid
 from datetime import datetime
 import shutil
 
+from playground_storage import FileLock
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Number of validation issues printed in streaming mode
+MAX_REPORTED_ISSUES = 20
+
+# Bytes at the start of the file compared to notice another writer, like the server's history_stamp
+STAMP_HEAD_BYTES = 128
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+
 
 def decode_base64_field(encoded_data):
   """Decode base64 field safely"""
@@ -23,22 +49,24 @@ def decode_base64_field(encoded_data):
     return encoded_data  # Return as-is if decoding fails
 
 
-def create_entry_signature(entry):
-  """Create a unique signature for a history entry"""
-  # Decode the base64 fields to compare actual content
-  input_content = decode_base64_field(entry.get('input', ''))
-  expr_content = decode_base64_field(entry.get('expr', ''))
+def create_entry_signature(entry, encoded=True):
+  """
+  Create a unique signature (16 byte digest) for a history entry, matching
+  entries like the server's entry_signature: inputs are identified by the
+  sha256 of their text, which is also the digest of their blob.
+  """
+  # Decode the base64 fields of legacy files to compare actual content
+  decode = decode_base64_field if encoded else (lambda value: value)
+  input_digest = entry.get('input_blob')
+  if not input_digest and 'input' in entry:
+    input_digest = hashlib.sha256(decode(entry['input']).encode('utf-8')).hexdigest()
+  expr = decode(entry['expr']) if 'expr' in entry else None
 
   # Create signature based on content and loop settings
-  signature = {
-      'input': input_content.strip(),
-      'expr': expr_content.strip(),
-      'enable_loop': entry.get('enable_loop', False),
-      'loop_variable': entry.get('loop_variable', '').strip()
-  }
+  signature = [input_digest, expr, entry.get('enable_loop'), entry.get('loop_variable')]
 
-  # Convert to string for hashing
-  return str(sorted(signature.items()))
+  # Only a digest is kept, never a copy of the content
+  return hashlib.blake2b(json.dumps(signature).encode('utf-8'), digest_size=16).digest()
 
 
 def parse_datetime(datetime_str):
@@ -53,13 +81,14 @@ def parse_datetime(datetime_str):
     return datetime.min
 
 
-def deduplicate_history(history_data, keep_strategy='newest'):
+def deduplicate_history(history_data, keep_strategy='newest', encoded=True):
   """
   Remove duplicate entries from history
 
   Args:
       history_data: List of history entries
       keep_strategy: 'newest' or 'oldest' - which duplicate to keep
+      encoded: True for legacy files storing input/expr as base64
 
   Returns:
       Deduplicated history list
@@ -70,7 +99,7 @@ def deduplicate_history(history_data, keep_strategy='newest'):
   print(f"📊 Processing {len(history_data)} history entries...")
 
   for entry in history_data:
-    signature = create_entry_signature(entry)
+    signature = create_entry_signature(entry, encoded)
     entry_datetime = parse_datetime(entry.get('datetime', ''))
 
     if signature not in seen_signatures:
@@ -125,27 +154,315 @@ def backup_history_file(file_path):
     return None
 
 
+def validate_entry(i, entry):
+  """Validate the structure of a single history entry"""
+  required_fields = ['datetime', 'expr']
+  issues = []
+
+  if not isinstance(entry, dict):
+    return [f"Entry {i}: Not a dictionary"]
+
+  for field in required_fields:
+    if field not in entry:
+      issues.append(f"Entry {i}: Missing required field '{field}'")
+  if 'input' not in entry and 'input_blob' not in entry:
+    issues.append(f"Entry {i}: Missing required field 'input' (or 'input_blob')")
+
+  # Check datetime format
+  try:
+    parse_datetime(entry.get('datetime', ''))
+  except Exception:
+    issues.append(f"Entry {i}: Invalid datetime format")
+
+  return issues
+
+
 def validate_history_structure(history_data):
   """Validate the structure of history entries"""
-  required_fields = ['datetime', 'input', 'expr']
   issues = []
-
   for i, entry in enumerate(history_data):
-    if not isinstance(entry, dict):
-      issues.append(f"Entry {i}: Not a dictionary")
-      continue
+    issues.extend(validate_entry(i, entry))
+  return issues
 
-    for field in required_fields:
-      if field not in entry:
-        issues.append(f"Entry {i}: Missing required field '{field}'")
 
-    # Check datetime format
-    try:
-      parse_datetime(entry.get('datetime', ''))
-    except Exception:
-      issues.append(f"Entry {i}: Invalid datetime format")
+class HistoryStreamReader:
+  """
+  Incremental reader for history files.
+  Iterating yields one entry at a time from a legacy JSON array, a
+  {"format": N, "entries": [...]} object or JSON Lines, so memory is
+  bounded by the largest entry. After the first entry has been read,
+  layout is 'list', 'wrapper' or 'jsonl' and history_format holds the
+  wrapper format number.
+  """
 
-  return issues
+  def __init__(self, path, chunk_size=STREAM_CHUNK_SIZE):
+    self.path = path
+    self.chunk_size = chunk_size
+    self.layout = None
+    self.history_format = None
+    self.bytes_read = 0
+    self.entries_read = 0
+
+  def __iter__(self):
+    with open(self.path, 'rb') as f:
+      self._file = f
+      self._utf8 = codecs.getincrementaldecoder('utf-8')()
+      self._buf = ''
+      self._pos = 0
+      self._mark = None
+      self._eof = False
+      for entry in self._entries():
+        self.entries_read += 1
+        yield entry
+
+  def _error(self, message):
+    raise ValueError(f"Invalid history file: {message}")
+
+  def _fill(self, target=0):
+    """
+    Read at least one more chunk, and keep reading until target characters
+    are buffered past the current position. Returns False at end of file.
+    """
+    if self._eof:
+      return False
+    keep = self._pos if self._mark is None else min(self._mark, self._pos)
+    parts = [self._buf[keep:]]
+    buffered = len(self._buf) - self._pos
+    while True:
+      data = self._file.read(self.chunk_size)
+      self.bytes_read += len(data)
+      text = self._utf8.decode(data, final=not data)
+      parts.append(text)
+      buffered += len(text)
+      if not data:
+        self._eof = True
+        break
+      if buffered >= target:
+        break
+    self._buf = ''.join(parts)
+    self._pos -= keep
+    if self._mark is not None:
+      self._mark -= keep
+    return True
+
+  def _peek(self):
+    """Skip whitespace and return the next character, or '' at end of file."""
+    while True:
+      while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+        self._pos += 1
+      if self._pos < len(self._buf):
+        return self._buf[self._pos]
+      if not self._fill():
+        return ''
+
+  def _expect(self, chars):
+    char = self._peek()
+    if char not in chars:
+      self._error(f"expected one of {chars!r}, found {char or 'end of file'!r}")
+    self._pos += 1
+    return char
+
+  def _value(self):
+    """Decode the next JSON value, reading more data until it is complete."""
+    self._peek()
+    while True:
+      try:
+        value, end = _DECODER.raw_decode(self._buf, self._pos)
+      except json.JSONDecodeError as e:
+        # Grow the buffer geometrically so a huge entry is not rescanned once per chunk
+        if not self._fill(2 * (len(self._buf) - self._pos)):
+          self._error(e)
+        continue
+      # A number at the end of the buffer may continue in the next chunk
+      if end == len(self._buf) and not self._eof:
+        self._fill()
+        continue
+      self._pos = end
+      return value
+
+  def _array(self):
+    self._expect('[')
+    if self._peek() == ']':
+      self._pos += 1
+      return
+    while True:
+      yield self._value()
+      if self._expect(',]') == ']':
+        return
+
+  def _entries(self):
+    char = self._peek()
+    if char == '[':
+      self.layout = 'list'
+      yield from self._array()
+      self._end()
+      return
+    if char != '{':
+      self._error("should contain a JSON array, a {\"format\", \"entries\"} object or JSON Lines")
+
+    # Tell the wrapper object from the first line of a JSON Lines file by its first key
+    self._mark = self._pos
+    self._pos += 1
+    first_key = self._value() if self._peek() == '"' else None
+    start, self._mark = self._mark, None
+    if first_key not in ('format', 'entries'):
+      self.layout = 'jsonl'
+      self._pos = start
+      while self._peek():
+        yield self._value()
+      return
+
+    self.layout = 'wrapper'
+    key = first_key
+    while True:
+      self._expect(':')
+      if key == 'entries':
+        yield from self._array()
+      elif key == 'format':
+        self.history_format = self._value()
+      else:
+        self._value()
+      if self._expect(',}') == '}':
+        break
+      key = self._value()
+    self._end()
+
+  def _end(self):
+    if self._peek():
+      self._error("unexpected data after the end of the document")
+
+
+def file_stamp(file_path):
+  """Identify the current version of a file: inode, size, mtime and its first bytes."""
+  st = os.stat(file_path)
+  with open(file_path, 'rb') as f:
+    head = f.read(STAMP_HEAD_BYTES)
+  return (st.st_ino, st.st_size, st.st_mtime_ns, head)
+
+
+def confirm(lock, file_path, question):
+  """
+  Ask a y/N question with the history lock released, so the server is not
+  blocked while waiting for the answer. Returns False for no, and when the
+  file changed meanwhile since what was read from it is out of date.
+  """
+  stamp = file_stamp(file_path)
+  lock.release()
+  try:
+    response = input(question)
+  finally:
+    lock.acquire()
+  if response.lower() != 'y':
+    return False
+  if file_stamp(file_path) != stamp:
+    print("❌ Error: The history file changed while waiting, run the deduplication again")
+    return False
+  return True
+
+
+def write_history_file(file_path, entries, layout='list', history_format=None):
+  """
+  Write entries (any iterable) to file_path in the given layout.
+  The data goes to a temporary file in the same directory which replaces
+  the original only once it is complete and flushed to disk. The wrapper
+  gets a new revision so the server notices the rewrite.
+  Returns the number of entries written.
+  """
+  directory = os.path.dirname(os.path.abspath(file_path))
+  fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(file_path) + '.')
+  count = 0
+  try:
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+      if layout == 'wrapper':
+        header = {'format': history_format, 'revision': uuid.uuid4().hex}
+        f.write(json.dumps(header, separators=(',', ':'))[:-1] + ',"entries":[')
+      elif layout == 'list':
+        f.write('[')
+      for entry in entries:
+        if layout == 'list':
+          # Same output as json.dump(..., indent=2) of the whole list
+          f.write((',\n  ' if count else '\n  ') + json.dumps(entry, indent=2, ensure_ascii=False).replace('\n', '\n  '))
+        elif layout == 'wrapper':
+          f.write((',' if count else '') + json.dumps(entry, ensure_ascii=False, separators=(',', ':')))
+        else:
+          f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+        count += 1
+      if layout == 'wrapper':
+        f.write(']}')
+      elif layout == 'list':
+        f.write('\n]' if count else ']')
+      f.flush()
+      os.fsync(f.fileno())
+    if os.path.exists(file_path):
+      shutil.copymode(file_path, tmp_path)
+    os.replace(tmp_path, file_path)
+  except BaseException:
+    if os.path.exists(tmp_path):
+      os.unlink(tmp_path)
+    raise
+  return count
+
+
+def report_throughput(label, entries, size, elapsed):
+  """Print entries and bytes processed per second"""
+  elapsed = max(elapsed, 1e-9)
+  print(f"⏱️  {label}: {entries} entries, {size / 1048576:.1f} MB in {elapsed:.2f}s "
+        f"({entries / elapsed:.0f} entries/s, {size / 1048576 / elapsed:.1f} MB/s)")
+
+
+def scan_history_stream(file_path, keep_strategy='newest', chunk_size=STREAM_CHUNK_SIZE):
+  """
+  First streaming pass: validate every entry and pick the one to keep for each signature.
+
+  Returns:
+      (reader, keep, duplicates, issue_count) where keep maps each
+      signature digest to (index, datetime) of the entry that survives
+  """
+  reader = HistoryStreamReader(file_path, chunk_size)
+  keep = {}
+  duplicates = 0
+  issue_count = 0
+  started = time.perf_counter()
+
+  for index, entry in enumerate(reader):
+    issues = validate_entry(index, entry)
+    for issue in issues:
+      if issue_count < MAX_REPORTED_ISSUES:
+        print(f"   - {issue}")
+      issue_count += 1
+    if not isinstance(entry, dict):
+      continue
+
+    signature = create_entry_signature(entry, reader.layout == 'list')
+    entry_datetime = parse_datetime(entry.get('datetime', ''))
+    existing = keep.get(signature)
+    if existing is not None:
+      duplicates += 1
+    if existing is None:
+      keep[signature] = (index, entry_datetime)
+    elif keep_strategy == 'newest' and entry_datetime > existing[1]:
+      keep[signature] = (index, entry_datetime)
+    elif keep_strategy == 'oldest' and entry_datetime < existing[1]:
+      keep[signature] = (index, entry_datetime)
+
+  if issue_count > MAX_REPORTED_ISSUES:
+    print(f"   ... and {issue_count - MAX_REPORTED_ISSUES} more")
+  report_throughput('Scan', reader.entries_read, reader.bytes_read, time.perf_counter() - started)
+  return reader, keep, duplicates, issue_count
+
+
+def stream_kept_entries(file_path, keep, chunk_size=STREAM_CHUNK_SIZE, stats=None):
+  """Second streaming pass: yield the entries selected by scan_history_stream"""
+  reader = HistoryStreamReader(file_path, chunk_size)
+  for index, entry in enumerate(reader):
+    if not isinstance(entry, dict):
+      yield entry
+      continue
+    if keep[create_entry_signature(entry, reader.layout == 'list')][0] == index:
+      yield entry
+  if stats is not None:
+    stats['entries'] = reader.entries_read
+    stats['bytes'] = reader.bytes_read
 
 
 def main():
@@ -179,6 +496,17 @@ def main():
       action='store_true',
       help='Only validate file structure without deduplication'
   )
+  parser.add_argument(
+      '--stream',
+      action='store_true',
+      help='Process the file incrementally with bounded memory (for very large histories)'
+  )
+  parser.add_argument(
+      '--chunk-size',
+      type=int,
+      default=STREAM_CHUNK_SIZE,
+      help=f'Read size in bytes for --stream (default: {STREAM_CHUNK_SIZE})'
+  )
 
   args = parser.parse_args()
 
@@ -196,6 +524,16 @@ def main():
     print(f"❌ Error: History file not found: {args.history_file}")
     return 1
 
+  # Hold the server's history lock from the first read to the rewrite
+  lock = FileLock(args.history_file + '.lock')
+  with lock:
+    if args.stream:
+      return stream_main(args, lock)
+    return memory_main(args, lock)
+
+
+def memory_main(args, lock):
+  """Deduplicate with the whole history loaded in memory"""
   # Load history data
   try:
     with open(args.history_file, 'r', encoding='utf-8') as f:
@@ -207,8 +545,14 @@ def main():
     print(f"❌ Error: Failed to read history file: {e}")
     return 1
 
-  if not isinstance(history_data, list):
-    print("❌ Error: History file should contain a JSON array")
+  # Current files wrap plain text entries as {"format": N, "entries": [...]},
+  # legacy files are a bare list with base64 encoded input/expr
+  history_format = None
+  if isinstance(history_data, dict) and isinstance(history_data.get('entries'), list):
+    history_format = history_data.get('format')
+    history_data = history_data['entries']
+  elif not isinstance(history_data, list):
+    print("❌ Error: History file should contain a JSON array or a {\"format\", \"entries\"} object")
     return 1
 
   # Validate structure
@@ -223,8 +567,7 @@ def main():
     if args.validate_only:
       return 1
 
-    response = input("\nContinue despite validation issues? (y/N): ")
-    if response.lower() != 'y':
+    if not confirm(lock, args.history_file, "\nContinue despite validation issues? (y/N): "):
       return 1
   else:
     print("✅ File structure is valid")
@@ -233,7 +576,7 @@ def main():
     return 0
 
   # Deduplicate
-  deduplicated_history = deduplicate_history(history_data, args.keep)
+  deduplicated_history = deduplicate_history(history_data, args.keep, history_format is None)
 
   if len(deduplicated_history) == len(history_data):
     print("🎉 No duplicates found - file is already clean!")
@@ -248,14 +591,13 @@ def main():
   if not args.no_backup:
     backup_path = backup_history_file(args.history_file)
     if not backup_path:
-      response = input("Failed to create backup. Continue anyway? (y/N): ")
-      if response.lower() != 'y':
+      if not confirm(lock, args.history_file, "Failed to create backup. Continue anyway? (y/N): "):
         return 1
 
   # Write deduplicated history
   try:
-    with open(args.history_file, 'w', encoding='utf-8') as f:
-      json.dump(deduplicated_history, f, indent=2, ensure_ascii=False)
+    write_history_file(args.history_file, deduplicated_history,
+                       'list' if history_format is None else 'wrapper', history_format)
 
     print("\n✅ Successfully deduplicated history file")
     print(f"📊 Original entries: {len(history_data)}")
@@ -269,5 +611,65 @@ def main():
   return 0
 
 
+def stream_main(args, lock):
+  """Deduplicate in two streaming passes: scan and select, then rewrite"""
+  print(f"\n🔍 Scanning {os.path.getsize(args.history_file) / 1048576:.1f} MB in streaming mode...")
+  try:
+    reader, keep, duplicates, issue_count = scan_history_stream(args.history_file, args.keep, args.chunk_size)
+  except (ValueError, UnicodeDecodeError) as e:
+    print(f"❌ Error: {e}")
+    return 1
+  except Exception as e:
+    print(f"❌ Error: Failed to read history file: {e}")
+    return 1
+
+  if issue_count:
+    print(f"⚠️  {issue_count} validation issues found")
+    if args.validate_only:
+      return 1
+    if not confirm(lock, args.history_file, "\nContinue despite validation issues? (y/N): "):
+      return 1
+  else:
+    print(f"✅ File structure is valid ({reader.layout} layout)")
+
+  if args.validate_only:
+    return 0
+
+  total = reader.entries_read
+  print(f"📊 {total} entries, {len(keep)} unique")
+
+  if not duplicates:
+    print("🎉 No duplicates found - file is already clean!")
+    return 0
+
+  if args.dry_run:
+    print("\n🔍 DRY RUN - No changes made")
+    print(f"Would remove {duplicates} duplicates")
+    return 0
+
+  if not args.no_backup:
+    backup_path = backup_history_file(args.history_file)
+    if not backup_path:
+      if not confirm(lock, args.history_file, "Failed to create backup. Continue anyway? (y/N): "):
+        return 1
+
+  stats = {}
+  started = time.perf_counter()
+  try:
+    written = write_history_file(args.history_file,
+                                 stream_kept_entries(args.history_file, keep, args.chunk_size, stats),
+                                 reader.layout, reader.history_format)
+  except Exception as e:
+    print(f"❌ Error: Failed to write deduplicated history: {e}")
+    return 1
+  report_throughput('Rewrite', stats['entries'], stats['bytes'], time.perf_counter() - started)
+
+  print("\n✅ Successfully deduplicated history file")
+  print(f"📊 Original entries: {total}")
+  print(f"📊 Final entries: {written}")
+  print(f"🗑️  Removed: {total - written} duplicates")
+  return 0
+
+
 if __name__ == '__main__':
   sys.exit(main())
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+End-to-end HTTP load test for ansible_jinja2_playground.
+
+This script:
+1. Starts the playground server locally on a free port (or targets --url)
+2. Replays a weighted mix of realistic requests (small and large renders,
+   loop mode, /history polling and /load_ansible_vars pushes) at the
+   requested concurrency
+   Each render input carries the request's sequence number and the template
+   reads it, so every render request is rendered instead of being answered
+   from the server's result cache
+3. Reports throughput, p50/p95/p99 latency and error rate per scenario
+4. Optionally fails when latency or error thresholds are exceeded, so it can
+   gate regressions in CI
+
+When the server is started locally, history is written to a temporary
+directory and the API listener is enabled in memory only, so the real
+configuration and history files are never touched.
+
+Usage:
+  python ansible-jinja2-playground/load_test.py --concurrency 8 --duration 30
+  python ansible-jinja2-playground/load_test.py --url http://localhost:8000 --requests 2000
+"""
+
+import base64
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# A request body, or a function building it from the request sequence number
+Body = Union[None, bytes, Callable[[int], bytes]]
+Scenario = Tuple[str, str, Body, Dict[str, str]]
+# Stands for the sequence number in render bodies, left as is by urlencode
+REQUEST_PLACEHOLDER = '__REQUEST__'
+
+DEFAULT_MIX = 'render_small=50,render_large=10,render_loop=15,history_poll=20,load_vars=5'
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+  """Returns the nearest-rank percentile of an already sorted sample list."""
+  if not sorted_samples:
+    return 0.0
+  rank = int(round(pct / 100.0 * (len(sorted_samples) - 1)))
+  return sorted_samples[max(0, min(rank, len(sorted_samples) - 1))]
+
+
+def build_hostvars(hosts: int) -> Dict[str, Any]:
+  """Builds a hostvars-like document with the given number of hosts."""
+  return {
+      'hostvars': {
+          f'host{i:04d}.example.com': {
+              'ansible_host': f'10.0.{i // 256}.{i % 256}',
+              'ansible_distribution': 'RedHat',
+              'ansible_interfaces': ['lo', 'eth0', 'eth1'],
+              'packages': [{'name': f'pkg{j}', 'version': f'1.{j}'} for j in range(10)]
+          } for i in range(hosts)
+      },
+      'groups': {'all': [f'host{i:04d}.example.com' for i in range(hosts)]}
+  }
+
+
+def render_body(variables: Dict[str, Any], expr: str, loop_variable: str = '') -> Callable[[int], bytes]:
+  """
+  Returns a function building the /render form for request number n: the
+  input gets a 'request' variable set to n, which expr should read.
+  """
+  text = json.dumps(variables)[:-1] + f', "request": {REQUEST_PLACEHOLDER}}}'
+  head, tail = urlencode({
+      'json': text,
+      'expr': expr,
+      'enable_loop': 'true' if loop_variable else 'false',
+      'loop_variable': loop_variable
+  }).encode().split(REQUEST_PLACEHOLDER.encode())
+  return lambda n: head + str(n).encode() + tail
+
+
+def build_scenarios(large_hosts: int) -> Dict[str, Scenario]:
+  """Returns scenario name -> (method, path, body, headers)."""
+  form = {'Content-Type': 'application/x-www-form-urlencoded'}
+  variables = json.dumps(build_hostvars(max(1, large_hosts // 4)))
+
+  return {
+      'render_small': ('POST', '/render', render_body(
+          {'name': 'web01', 'ports': [80, 443], 'enabled': True},
+          '{{ name | upper }} listens on {{ ports | join(",") }} (request {{ request }})'), form),
+      'render_large': ('POST', '/render', render_body(
+          build_hostvars(large_hosts),
+          '{{ hostvars | dict2items | map(attribute="value.ansible_host") | list | to_json }} {{ request }}'), form),
+      'render_loop': ('POST', '/render', render_body(
+          {'servers': [{'name': f'web{i:02d}', 'ip': f'10.0.1.{i}'} for i in range(50)]},
+          '{"host": "{{ item.name }}", "ip": "{{ item.ip }}", "request": {{ request }}}', 'servers'), form),
+      'history_poll': ('GET', '/history', None, {}),
+      'load_vars': ('POST', '/load_ansible_vars', json.dumps({
+          'variables_b64': base64.b64encode(variables.encode('utf-8')).decode('ascii'),
+          'summary': {'hostvars': max(1, large_hosts // 4)}
+      }).encode(), {'Content-Type': 'application/json'})
+  }
+
+
+def parse_mix(mix: str) -> List[Tuple[str, int]]:
+  """Parses 'name=weight,name=weight' into a list of (name, weight)."""
+  weights = []
+  for part in mix.split(','):
+    if not part.strip():
+      continue
+    name, _, weight = part.partition('=')
+    weights.append((name.strip(), int(weight or 1)))
+  return weights
+
+
+def start_local_server(history_dir: str) -> Tuple[Any, str]:
+  """Starts the playground in a background thread and returns (server, base_url)."""
+  from http.server import ThreadingHTTPServer
+  import ansible_jinja2_playground as playground
+
+  # Keep the real history and configuration files untouched
+  playground.JSON_HISTORY_PATH = os.path.join(history_dir, 'history.json')
+  playground.HISTORY_LOCK.lock_path = playground.JSON_HISTORY_PATH + '.lock'
+  playground.BLOB_STORE.directory = os.path.join(history_dir, 'blobs')
+  playground.config.set('user', 'api-listener-enabled', 'true')
+
+  class QuietHandler(playground.JinjaHandler):
+    def log_message(self, format, *args):
+      pass
+
+  server = ThreadingHTTPServer(('127.0.0.1', 0), QuietHandler)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+class LoadTester:
+  """Replays a weighted request mix against the server with N worker threads."""
+
+  def __init__(self, base_url: str, scenarios: Dict[str, Scenario],
+               mix: List[Tuple[str, int]], concurrency: int = 4, timeout: float = 30.0, seed: int = 0):
+    unknown = [name for name, _ in mix if name not in scenarios]
+    if unknown:
+      raise ValueError(f"Unknown scenarios in mix: {', '.join(unknown)} (known: {', '.join(scenarios)})")
+    self.base_url = base_url.rstrip('/')
+    self.scenarios = scenarios
+    self.mix = mix
+    self.concurrency = concurrency
+    self.timeout = timeout
+    self.seed = seed
+    self.lock = threading.Lock()
+    self.samples = {name: [] for name, _ in mix}
+    self.errors = {name: 0 for name, _ in mix}
+    self.error_messages = {}
+    self.issued = 0
+
+  def send(self, name: str, seq: int = 0) -> Tuple[float, Optional[str]]:
+    """Sends request number seq of the scenario and returns (latency, error)."""
+    method, path, body, headers = self.scenarios[name]
+    if callable(body):
+      body = body(seq)
+    request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+    start = time.perf_counter()
+    try:
+      with urllib.request.urlopen(request, timeout=self.timeout) as response:
+        response.read()
+      return time.perf_counter() - start, None
+    except urllib.error.HTTPError as e:
+      return time.perf_counter() - start, f'HTTP {e.code}'
+    except Exception as e:
+      return time.perf_counter() - start, type(e).__name__
+
+  def worker(self, index: int, deadline: Optional[float], max_requests: Optional[int]):
+    """Worker loop issuing requests until the deadline or request budget is reached."""
+    rng = random.Random(self.seed + index)
+    names = [name for name, _ in self.mix]
+    weights = [weight for _, weight in self.mix]
+    while True:
+      if deadline is not None and time.perf_counter() >= deadline:
+        return
+      with self.lock:
+        if max_requests is not None and self.issued >= max_requests:
+          return
+        self.issued += 1
+        seq = self.issued
+      name = rng.choices(names, weights)[0]
+      latency, error = self.send(name, seq)
+      with self.lock:
+        self.samples[name].append(latency)
+        if error:
+          self.errors[name] += 1
+          self.error_messages[error] = self.error_messages.get(error, 0) + 1
+
+  def run(self, duration: Optional[float] = None, max_requests: Optional[int] = None) -> Dict[str, Any]:
+    """Runs the load test and returns the report."""
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+    threads = [threading.Thread(target=self.worker, args=(i, deadline, max_requests), daemon=True)
+               for i in range(self.concurrency)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    return self.report(time.perf_counter() - start)
+
+  def report(self, elapsed: float) -> Dict[str, Any]:
+    """Builds per-scenario and overall statistics."""
+    def stats(samples: List[float], errors: int) -> Dict[str, Any]:
+      ordered = sorted(samples)
+      return {
+          'requests': len(ordered),
+          'errors': errors,
+          'error_rate': (errors / len(ordered)) if ordered else 0.0,
+          'throughput_rps': len(ordered) / elapsed if elapsed > 0 else 0.0,
+          'p50_ms': percentile(ordered, 50) * 1000,
+          'p95_ms': percentile(ordered, 95) * 1000,
+          'p99_ms': percentile(ordered, 99) * 1000,
+          'max_ms': (ordered[-1] * 1000) if ordered else 0.0
+      }
+
+    all_samples = [s for samples in self.samples.values() for s in samples]
+    return {
+        'base_url': self.base_url,
+        'concurrency': self.concurrency,
+        'elapsed_s': elapsed,
+        'overall': stats(all_samples, sum(self.errors.values())),
+        'scenarios': {name: stats(self.samples[name], self.errors[name]) for name, _ in self.mix},
+        'error_messages': self.error_messages
+    }
+
+
+def print_report(report: Dict[str, Any]):
+  """Prints the load test report as a table."""
+  print(f"\n📊 LOAD TEST REPORT ({report['base_url']}, concurrency {report['concurrency']}, "
+        f"{report['elapsed_s']:.1f}s)")
+  print(f"{'scenario':<14} {'requests':>9} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} "
+        f"{'errors':>8}")
+  rows = list(report['scenarios'].items()) + [('TOTAL', report['overall'])]
+  for name, s in rows:
+    print(f"{name:<14} {s['requests']:>9} {s['throughput_rps']:>9.1f} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} "
+          f"{s['p99_ms']:>9.1f} {s['max_ms']:>9.1f} {s['error_rate'] * 100:>7.1f}%")
+  if report['error_messages']:
+    print("\n❌ Errors:")
+    for message, count in sorted(report['error_messages'].items(), key=lambda kv: -kv[1]):
+      print(f"   {message}: {count}")
+
+
+def main():
+  """Main function of the script."""
+  import argparse
+
+  parser = argparse.ArgumentParser(description='HTTP load test for ansible_jinja2_playground')
+  parser.add_argument('--url', default='',
+                      help='Base URL of a running server (default: start a local server)')
+  parser.add_argument('--concurrency', type=int, default=4,
+                      help='Number of concurrent clients (default: 4)')
+  parser.add_argument('--duration', type=float, default=10.0,
+                      help='Test duration in seconds (default: 10, ignored with --requests)')
+  parser.add_argument('--requests', type=int, default=0,
+                      help='Total number of requests to send instead of a fixed duration')
+  parser.add_argument('--mix', default=DEFAULT_MIX,
+                      help=f'Weighted scenario mix (default: {DEFAULT_MIX})')
+  parser.add_argument('--large-hosts', type=int, default=200,
+                      help='Number of hosts in the large hostvars input (default: 200)')
+  parser.add_argument('--timeout', type=float, default=30.0,
+                      help='Per-request timeout in seconds (default: 30)')
+  parser.add_argument('--seed', type=int, default=0,
+                      help='Random seed for the request mix (default: 0)')
+  parser.add_argument('--output', default='',
+                      help='Save the report as JSON to this file')
+  parser.add_argument('--max-p95-ms', type=float, default=0.0,
+                      help='Fail when overall p95 latency exceeds this value')
+  parser.add_argument('--max-error-rate', type=float, default=-1.0,
+                      help='Fail when overall error rate (0-1) exceeds this value')
+
+  args = parser.parse_args()
+
+  server = None
+  history_dir = None
+  try:
+    base_url = args.url
+    if not base_url:
+      history_dir = tempfile.TemporaryDirectory(prefix='ajp-loadtest-')
+      server, base_url = start_local_server(history_dir.name)
+      print(f"🚀 Local server started at {base_url}")
+
+    scenarios = build_scenarios(args.large_hosts)
+    tester = LoadTester(base_url, scenarios, parse_mix(args.mix), args.concurrency, args.timeout, args.seed)
+    print(f"🔥 Running with concurrency {args.concurrency}...")
+    if args.requests:
+      report = tester.run(max_requests=args.requests)
+    else:
+      report = tester.run(duration=args.duration)
+    print_report(report)
+
+    if args.output:
+      with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+      print(f"💾 Report saved to: {args.output}")
+
+    failed = False
+    if args.max_p95_ms and report['overall']['p95_ms'] > args.max_p95_ms:
+      print(f"❌ p95 latency {report['overall']['p95_ms']:.1f}ms exceeds {args.max_p95_ms}ms")
+      failed = True
+    if args.max_error_rate >= 0 and report['overall']['error_rate'] > args.max_error_rate:
+      print(f"❌ Error rate {report['overall']['error_rate']:.3f} exceeds {args.max_error_rate}")
+      failed = True
+    return 1 if failed else 0
+
+  except KeyboardInterrupt:
+    print("\n\n⚠️  Load test interrupted by user")
+    return 1
+  except Exception as e:
+    print(f"\n\n❌ Error during load test: {e}")
+    return 1
+  finally:
+    if server:
+      server.shutdown()
+      server.server_close()
+    if history_dir:
+      history_dir.cleanup()
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+asyncio serving core for BaseHTTPRequestHandler subclasses.
+
+Connections are accepted and their request heads read on the event loop,
+so idle and slow clients cost a few kilobytes instead of a thread each.
+Every request is then handed to the unchanged handler class on a thread
+pool: its rfile and wfile are file adapters over the asyncio streams, so
+bodies are still read and written incrementally with backpressure and
+the handler keeps the exact endpoint contract it has under http.server.
+
+Paths registered in streams are served on the event loop itself as
+server-sent events, which suits thousands of long-lived connections.
+"""
+
+import asyncio
+import concurrent.futures
+import email.utils
+import http.client
+import io
+import sys
+import time
+
+from playground_wsgi import bind_handler, run_handler
+
+MAX_HEAD_BYTES = 64 * 1024
+HEAD_TIMEOUT = 30
+
+
+class StreamReaderFile(io.RawIOBase):
+  """Blocking, readable file over an asyncio StreamReader, for use from a worker thread."""
+
+  def __init__(self, reader, loop):
+    self._reader = reader
+    self._loop = loop
+
+  def readable(self):
+    return True
+
+  def read(self, size=-1):
+    if size is None or size < 0:
+      coro = self._reader.read()
+    else:
+      coro = self._reader.read(size)
+    return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+  def readinto(self, buffer):
+    data = self.read(len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+
+class StreamWriterFile(io.RawIOBase):
+  """
+  Blocking, writable file over an asyncio StreamWriter, for use from a
+  worker thread. Each write waits for the transport to drain.
+  """
+
+  def __init__(self, writer, loop):
+    self._writer = writer
+    self._loop = loop
+
+  def writable(self):
+    return True
+
+  async def _write(self, data):
+    self._writer.write(data)
+    await self._writer.drain()
+
+  def write(self, data):
+    data = bytes(data)
+    if data:
+      asyncio.run_coroutine_threadsafe(self._write(data), self._loop).result()
+    return len(data)
+
+
+class Broadcaster:
+  """
+  Calls poll() every interval seconds on the event loop, in a single task
+  shared by all subscribers, and wakes them when its result changes.
+  """
+
+  def __init__(self, poll, interval=1.0):
+    self.poll = poll
+    self.interval = interval
+    self.version = 0
+    self.value = None
+    self._changed = None
+    self._task = None
+
+  def start(self):
+    """Start polling on the running loop, once."""
+    if self._task is None:
+      self._changed = asyncio.Event()
+      self.value = self.poll()
+      self._task = asyncio.get_running_loop().create_task(self._run())
+
+  async def _run(self):
+    while True:
+      await asyncio.sleep(self.interval)
+      try:
+        value = self.poll()
+      except Exception:
+        continue
+      if value != self.value:
+        self.value = value
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+  async def wait(self, version, timeout):
+    """Wait until the version differs from version. Returns False on timeout."""
+    self.start()
+    if self.version != version:
+      return True
+    try:
+      await asyncio.wait_for(self._changed.wait(), timeout)
+    except asyncio.TimeoutError:
+      return False
+    return True
+
+
+async def event_stream(broadcaster, event, data=str, heartbeat=15.0):
+  """
+  Server-sent events: one event named event with data(value) each time the
+  broadcaster's value changes, and a comment line as heartbeat meanwhile.
+  """
+  yield b'retry: 5000\n\n'
+  broadcaster.start()
+  while True:
+    version = broadcaster.version
+    yield f'event: {event}\ndata: {data(broadcaster.value)}\n\n'.encode('utf-8')
+    while not await broadcaster.wait(version, heartbeat):
+      yield b': ping\n\n'
+
+
+class AsyncHTTPServer:
+  """
+  HTTP/1.0 server running handler_class on an asyncio event loop.
+  streams maps a GET path to a callable returning an async iterator of
+  server-sent event bytes.
+  """
+
+  def __init__(self, handler_class, host, port, max_workers=None, streams=None):
+    self.handler_class = handler_class
+    self.server_address = (host, port)
+    self.streams = streams or {}
+    self.executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix='playground-worker')
+    self.open_streams = 0
+
+  def serve_forever(self):
+    asyncio.run(self.serve())
+
+  async def serve(self):
+    server = await asyncio.start_server(self._connection, *self.server_address, limit=MAX_HEAD_BYTES)
+    async with server:
+      await server.serve_forever()
+
+  async def _connection(self, reader, writer):
+    try:
+      try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HEAD_TIMEOUT)
+      except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return
+      except asyncio.LimitOverrunError:
+        writer.write(self._simple_response(431, 'Request Header Fields Too Large'))
+        return
+
+      request_line, _, header_block = head.partition(b'\r\n')
+      parts = request_line.decode('latin-1').split()
+      if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        writer.write(self._simple_response(400, 'Bad Request'))
+        return
+      command, path, version = parts
+      headers = http.client.parse_headers(io.BytesIO(header_block))
+      peer = writer.get_extra_info('peername') or ('', 0)
+
+      route = path.split('?', 1)[0]
+      if command == 'GET' and route in self.streams:
+        await self._stream(writer, self.streams[route]())
+        return
+
+      loop = asyncio.get_running_loop()
+      await loop.run_in_executor(self.executor, self._dispatch, loop, reader, writer,
+                                 command, path, version, headers, peer)
+      await writer.drain()
+    except ConnectionError:
+      pass
+    finally:
+      writer.close()
+      try:
+        await writer.wait_closed()
+      except ConnectionError:
+        pass
+
+  async def _stream(self, writer, events):
+    writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                 b'Date: ' + email.utils.formatdate(time.time(), usegmt=True).encode() + b'\r\n\r\n')
+    self.open_streams += 1
+    try:
+      async for chunk in events:
+        writer.write(chunk)
+        await writer.drain()
+    finally:
+      self.open_streams -= 1
+      await events.aclose()
+
+  def _dispatch(self, loop, reader, writer, command, path, version, headers, peer):
+    """Run one request through the handler class on a worker thread."""
+    handler = bind_handler(self.handler_class, self, peer[:2], StreamReaderFile(reader, loop),
+                           StreamWriterFile(writer, loop), command, path, version, headers)
+    try:
+      run_handler(handler)
+    except ConnectionError:
+      pass
+    except Exception:
+      print(f'Error handling {command} {path}:', file=sys.stderr)
+      sys.excepthook(*sys.exc_info())
+
+  @staticmethod
+  def _simple_response(status, reason):
+    body = f'{status} {reason}\n'.encode()
+    return (f'HTTP/1.0 {status} {reason}\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n').encode() + body
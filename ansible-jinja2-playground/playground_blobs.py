@@ -0,0 +1,228 @@
+"""
+Content-addressed blob store for history inputs.
+
+Inputs are stored once per distinct content, keyed by the sha256 of their
+UTF-8 text, optionally compressed with zlib or zstd (when the zstandard
+package is installed). History entries only keep the digest. Reference
+counts are taken from the history each time it is loaded or saved, and a
+blob is deleted once no entry references it and it has not been written
+or touched for a short grace period.
+"""
+
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+  import zstandard
+except ImportError:  # optional dependency
+  zstandard = None
+
+CHUNK_SIZE = 64 * 1024
+
+# File suffix per compression codec
+SUFFIXES = {'none': '.json', 'zlib': '.json.zz', 'zstd': '.json.zst'}
+
+# Temporary files written while a blob is being created
+TEMP_PREFIX = '.ingest-'
+
+
+def _compressor(codec, level):
+  if codec == 'zlib':
+    return zlib.compressobj(level)
+  if codec == 'zstd':
+    return zstandard.ZstdCompressor(level=level).compressobj()
+  return None
+
+
+def _decompress(codec, data):
+  if codec == 'zlib':
+    return zlib.decompress(data)
+  if codec == 'zstd':
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+  return data
+
+
+def is_digest(value):
+  """Check that value looks like a hex sha256 digest."""
+  return isinstance(value, str) and len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+class BlobStore:
+  """
+  Directory of immutable blobs named <sha256><suffix>.
+  cache is an optional object with get(key) and put(key, value, size)
+  used to keep recently read blobs in memory.
+  """
+
+  def __init__(self, directory, compression='zlib', level=6, cache=None, grace_seconds=300):
+    if compression == 'zstd' and zstandard is None:
+      print("WARNING: zstandard is not installed, history blobs will use zlib compression")
+      compression = 'zlib'
+    if compression not in SUFFIXES:
+      print(f"WARNING: Unknown blob compression '{compression}', using zlib")
+      compression = 'zlib'
+    self.directory = directory
+    self.compression = compression
+    self.level = level
+    self.cache = cache
+    # Blobs touched this recently are never collected, they may be about to be referenced
+    self.grace_seconds = grace_seconds
+    self._lock = threading.Lock()
+    self._refs = None
+    self._released = set()
+
+  def _path(self, digest, codec):
+    return os.path.join(self.directory, digest + SUFFIXES[codec])
+
+  def find(self, digest):
+    """Return (path, codec) of a stored blob, or (None, None)."""
+    if not is_digest(digest):
+      raise ValueError(f"Invalid blob digest: {digest}")
+    for codec in [self.compression] + [c for c in SUFFIXES if c != self.compression]:
+      path = self._path(digest, codec)
+      if os.path.exists(path):
+        return path, codec
+    return None, None
+
+  def exists(self, digest):
+    return self.find(digest)[0] is not None
+
+  def temp_file(self):
+    """Create a temporary file in the store directory. Returns (fd, path)."""
+    os.makedirs(self.directory, exist_ok=True)
+    return tempfile.mkstemp(dir=self.directory, prefix=TEMP_PREFIX)
+
+  def adopt(self, tmp_path, digest):
+    """
+    Move a temporary file holding the raw text of digest into the store,
+    compressing it on the way. Existing blobs are kept and only touched.
+    """
+    try:
+      path, _ = self.find(digest)
+      if path:
+        os.utime(path)
+        return digest
+
+      compressor = _compressor(self.compression, self.level)
+      if compressor is None:
+        os.replace(tmp_path, self._path(digest, 'none'))
+        return digest
+
+      fd, packed_path = self.temp_file()
+      try:
+        with open(tmp_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+          for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            dst.write(compressor.compress(chunk))
+          dst.write(compressor.flush())
+        os.replace(packed_path, self._path(digest, self.compression))
+      except BaseException:
+        os.unlink(packed_path)
+        raise
+      return digest
+    finally:
+      if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+
+  def put_text(self, text):
+    """Store text and return its digest."""
+    data = text.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    fd, tmp_path = self.temp_file()
+    with os.fdopen(fd, 'wb') as tmp:
+      tmp.write(data)
+    return self.adopt(tmp_path, digest)
+
+  def get_text(self, digest):
+    """Return the text of a blob. Raises FileNotFoundError when it is missing."""
+    if self.cache is not None:
+      text = self.cache.get(digest)
+      if text is not None:
+        return text
+    path, codec = self.find(digest)
+    if path is None:
+      raise FileNotFoundError(f"Blob {digest} not found")
+    with open(path, 'rb') as bf:
+      text = _decompress(codec, bf.read()).decode('utf-8')
+    if self.cache is not None:
+      self.cache.put(digest, text, len(text))
+    return text
+
+  def _collect(self, digest):
+    """
+    Delete an unreferenced blob. Returns False while it is still within the
+    grace period, True once it is gone.
+    """
+    path, _ = self.find(digest)
+    if path is None:
+      return True
+    try:
+      if time.time() - os.path.getmtime(path) < self.grace_seconds:
+        return False
+      os.unlink(path)
+    except FileNotFoundError:
+      pass
+    return True
+
+  def track(self, refs):
+    """
+    Replace the reference counts with refs ({digest: count}) and delete
+    blobs that were referenced before but no longer are. Blobs still in
+    their grace period are retried on later calls.
+    Returns the number of blobs removed.
+    """
+    refs = collections.Counter(refs)
+    with self._lock:
+      previous = self._refs
+      self._refs = refs
+      candidates = set(self._released)
+      if previous is not None:
+        candidates.update(previous)
+      candidates = {digest for digest in candidates if digest not in refs}
+      self._released = set()
+
+    removed = 0
+    pending = set()
+    for digest in candidates:
+      if self._collect(digest):
+        removed += 1
+      else:
+        pending.add(digest)
+    if pending:
+      with self._lock:
+        self._released.update(pending)
+    return removed
+
+  def sweep(self, refs):
+    """Delete every unreferenced blob and stale temporary file. Returns the number removed."""
+    removed = 0
+    if not os.path.isdir(self.directory):
+      return removed
+    now = time.time()
+    for name in os.listdir(self.directory):
+      path = os.path.join(self.directory, name)
+      digest = name.split('.', 1)[0]
+      try:
+        if now - os.path.getmtime(path) < self.grace_seconds:
+          continue
+        if name.startswith(TEMP_PREFIX) or (is_digest(digest) and digest not in refs):
+          os.unlink(path)
+          removed += 1
+      except FileNotFoundError:
+        continue
+    return removed
+
+  def disk_usage(self):
+    """Total size of the stored blobs in bytes."""
+    if not os.path.isdir(self.directory):
+      return 0
+    total = 0
+    with os.scandir(self.directory) as entries:
+      for entry in entries:
+        if entry.is_file():
+          total += entry.stat().st_size
+    return total
@@ -0,0 +1,213 @@
+"""
+Request body parsing for the form style POST endpoints.
+
+Bodies may be application/x-www-form-urlencoded (what the web interface
+sends), application/json or multipart/form-data. JSON and multipart
+bodies carry large inputs without percent-encoding; multipart bodies are
+split into fields while they are read, so the raw body is never buffered
+as a whole. Every parser returns the parse_qs shape ({name: [value, ...]})
+so handlers do not care how the request was encoded.
+"""
+
+import email.message
+import email.utils
+import json
+from urllib.parse import parse_qs
+
+from playground_ingest import read_body
+
+# Part headers larger than this are rejected
+MAX_PART_HEADER_BYTES = 16 * 1024
+
+
+class FormError(Exception):
+  """Unusable request body, carrying the HTTP status to answer with."""
+
+  def __init__(self, status, message):
+    super().__init__(message)
+    self.status = status
+
+
+def parse_header(value):
+  """Split a header like Content-Type into (value, {param: value}) with RFC 2231/quoting rules."""
+  msg = email.message.Message()
+  msg['content-type'] = value or ''
+  params = msg.get_params() or []
+  main = params[0][0].lower() if params else ''
+  return main, {k.lower(): email.utils.collapse_rfc2231_value(v) for k, v in params[1:]}
+
+
+def _form_value(value):
+  """Convert a JSON value to the string a form field would carry."""
+  if isinstance(value, str):
+    return value
+  if isinstance(value, bool):
+    return 'true' if value else 'false'
+  if value is None:
+    return ''
+  # Numbers, and inputs given as JSON objects or arrays instead of text
+  return json.dumps(value)
+
+
+def read_json_form(stream, length):
+  """Read a JSON object body. Array values become repeated fields."""
+  buf = bytearray()
+  for chunk in read_body(stream, length):
+    buf += chunk
+  try:
+    data = json.loads(bytes(buf))
+  except ValueError as e:
+    raise FormError(400, f'Invalid JSON body: {e}')
+  if not isinstance(data, dict):
+    raise FormError(400, 'JSON body must be an object')
+  params = {}
+  for key, value in data.items():
+    values = value if isinstance(value, list) and key not in ('input', 'json') else [value]
+    params[key] = [_form_value(v) for v in values]
+  return params
+
+
+class MultipartParser:
+  """
+  Incremental multipart/form-data parser. feed() takes body chunks of any
+  size; only the current part and a delimiter-sized tail are buffered.
+  """
+
+  def __init__(self, boundary):
+    self.fields = {}
+    self._delimiter = b'\r\n--' + boundary
+    # The first boundary is not preceded by CRLF, pretend it is
+    self._buf = bytearray(b'\r\n')
+    self._state = 'preamble'
+    self._name = None
+    self._charset = 'utf-8'
+    self._data = []
+
+  def feed(self, data):
+    self._buf += data
+    while self._step():
+      pass
+
+  def close(self):
+    if self._state != 'done':
+      raise FormError(400, 'Truncated multipart body')
+
+  def _step(self):
+    """Advance the state machine once. Returns False when more data is needed."""
+    buf = self._buf
+    if self._state in ('preamble', 'body'):
+      index = buf.find(self._delimiter)
+      if index < 0:
+        # Keep a tail that could be the start of a delimiter split across chunks
+        keep = len(self._delimiter) - 1
+        if len(buf) > keep:
+          if self._state == 'body':
+            self._data.append(bytes(buf[:-keep]))
+          del buf[:-keep]
+        return False
+      if self._state == 'body':
+        self._data.append(bytes(buf[:index]))
+        self._finish_part()
+      del buf[:index + len(self._delimiter)]
+      self._state = 'boundary'
+      return True
+
+    if self._state == 'boundary':
+      if len(buf) < 2:
+        return False
+      if buf[:2] == b'--':
+        self._state = 'done'
+        return False
+      end = buf.find(b'\r\n')
+      if end < 0:
+        if len(buf) > MAX_PART_HEADER_BYTES:
+          raise FormError(400, 'Malformed multipart boundary')
+        return False
+      del buf[:end + 2]
+      self._state = 'headers'
+      return True
+
+    if self._state == 'headers':
+      if buf[:2] == b'\r\n':
+        end, headers = 0, b''
+      else:
+        end = buf.find(b'\r\n\r\n')
+        if end < 0:
+          if len(buf) > MAX_PART_HEADER_BYTES:
+            raise FormError(400, 'Multipart part headers too large')
+          return False
+        headers = bytes(buf[:end])
+        end += 2
+      del buf[:end + 2]
+      self._start_part(headers.decode('utf-8', 'replace'))
+      self._state = 'body'
+      return True
+
+    # done: ignore the epilogue
+    buf.clear()
+    return False
+
+  def _start_part(self, headers):
+    self._name = None
+    self._charset = 'utf-8'
+    self._data = []
+    for line in headers.split('\r\n'):
+      key, _, value = line.partition(':')
+      key = key.strip().lower()
+      if key == 'content-disposition':
+        _, params = parse_header(value)
+        self._name = params.get('name')
+      elif key == 'content-type':
+        _, params = parse_header(value)
+        self._charset = params.get('charset', 'utf-8')
+
+  def _finish_part(self):
+    if self._name is None:
+      return
+    try:
+      value = b''.join(self._data).decode(self._charset)
+    except (LookupError, UnicodeDecodeError) as e:
+      raise FormError(400, f'Cannot decode multipart field {self._name}: {e}')
+    self.fields.setdefault(self._name, []).append(value)
+    self._data = []
+
+
+def read_multipart_form(stream, length, boundary):
+  """Read a multipart/form-data body part by part."""
+  parser = MultipartParser(boundary.encode('latin-1'))
+  for chunk in read_body(stream, length):
+    parser.feed(chunk)
+  parser.close()
+  return parser.fields
+
+
+def read_form(stream, headers, max_bytes=0, lenient=False):
+  """
+  Read and parse a request body according to its Content-Type.
+  Returns {name: [value, ...]}. Raises FormError for bodies over max_bytes
+  (when set), unsupported content types and malformed bodies. With
+  lenient, bodies of other content types are parsed as urlencoded forms
+  instead of refused, like every endpoint did before JSON and multipart.
+  """
+  try:
+    length = int(headers.get('Content-Length', 0))
+  except ValueError:
+    raise FormError(400, 'Invalid Content-Length')
+  if max_bytes and length > max_bytes:
+    raise FormError(413, f'Request body of {length} bytes exceeds the {max_bytes} byte limit')
+
+  content_type, params = parse_header(headers.get('Content-Type'))
+  try:
+    if content_type == 'application/json':
+      return read_json_form(stream, length)
+    if content_type == 'multipart/form-data':
+      if not params.get('boundary'):
+        raise FormError(400, 'Missing multipart boundary')
+      return read_multipart_form(stream, length, params['boundary'])
+    if lenient or content_type in ('', 'application/x-www-form-urlencoded'):
+      body = b''.join(read_body(stream, length))
+      return parse_qs(body.decode('utf-8'))
+  except ValueError as e:
+    # Truncated bodies and undecodable form data
+    raise FormError(400, str(e))
+  raise FormError(415, f'Unsupported Content-Type: {content_type}')
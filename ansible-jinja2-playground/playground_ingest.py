@@ -0,0 +1,336 @@
+"""
+Streaming ingestion of /load_ansible_vars pushes.
+
+A push is a small JSON envelope around one large base64 string
+(variables_b64). ingest_ansible_vars() reads the request body in chunks,
+keeps the envelope, and decodes the base64 text as it arrives. The decoded
+variables are parsed one member at a time with JsonObjectStream, counted,
+hashed, and written straight to a file that is handed to the blob store.
+The whole payload is never held in memory.
+"""
+
+import binascii
+import codecs
+import hashlib
+import json
+import os
+import re
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Characters that change the scanner state outside and inside strings
+_STRUCTURAL = re.compile(rb'[{}\[\]",:]')
+_STRING_SPECIAL = re.compile(rb'["\\]')
+_LITERAL = re.compile(rb'(?:true|false|null|-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)\Z')
+_ESCAPABLE = frozenset(b'"\\/bfnrtu')
+_WHITESPACE = b' \t\r\n'
+_TEXT_WHITESPACE = re.compile(r'[ \t\r\n]*')
+_BASE64_JUNK = re.compile(rb'[^A-Za-z0-9+/=]')
+
+# Scanner states
+_VALUE, _VALUE_OR_CLOSE, _KEY, _KEY_OR_CLOSE, _COLON, _MEMBER, _AFTER, _DONE = range(8)
+
+_DECODER = json.JSONDecoder()
+
+
+class JsonStreamScanner:
+  """
+  Incremental validator for a JSON document whose root is an object.
+  Tracks nesting, strings and literals without building Python objects.
+  When capture_key is given, the string value of that root key is returned
+  separately from the rest of the text, however long it is.
+  """
+
+  def __init__(self, capture_key=None):
+    self.capture_key = capture_key.encode('utf-8') if capture_key else None
+    self.captured = False
+    self.offset = 0
+    self._stack = []
+    self._state = _VALUE
+    self._in_string = False
+    self._escape = False
+    self._capturing = False
+    self._key = None
+    self._last_key = None
+    self._bare = b''
+    self._done = False
+
+  def _error(self, message, pos=0):
+    raise ValueError(f'Invalid JSON at byte {self.offset + pos}: {message}')
+
+  def feed(self, chunk):
+    """Scan the next chunk. Returns (kept, captured) bytes."""
+    kept = bytearray()
+    captured = bytearray()
+    pos = 0
+    size = len(chunk)
+    while pos < size:
+      if self._in_string:
+        if self._escape:
+          if chunk[pos] not in _ESCAPABLE:
+            self._error('invalid escape sequence', pos)
+          self._escape = False
+          self._string_data(chunk[pos:pos + 1], kept, captured)
+          pos += 1
+          continue
+        match = _STRING_SPECIAL.search(chunk, pos)
+        end = match.start() if match else size
+        self._string_data(chunk[pos:end], kept, captured)
+        if match is None:
+          break
+        if chunk[end] == 0x5c:
+          self._escape = True
+          self._string_data(b'\\', kept, captured)
+        else:
+          self._end_string()
+          kept += b'"'
+        pos = end + 1
+        continue
+
+      match = _STRUCTURAL.search(chunk, pos)
+      end = match.start() if match else size
+      if end > pos:
+        self._bare += chunk[pos:end]
+        kept += chunk[pos:end]
+      if match is None:
+        break
+      self._flush_bare(end)
+      self._structural(chunk[end], end)
+      kept.append(chunk[end])
+      pos = end + 1
+
+    self.offset += size
+    return bytes(kept), bytes(captured)
+
+  def close(self):
+    """Check that the document is complete."""
+    self._flush_bare(0)
+    if self._in_string or self._stack or not self._done:
+      self._error('unexpected end of document')
+
+  def _string_data(self, data, kept, captured):
+    if self._capturing:
+      captured += data
+    else:
+      kept += data
+    if self._key is not None:
+      self._key += data
+
+  def _end_string(self):
+    self._in_string = False
+    if self._key is not None:
+      self._last_key = bytes(self._key)
+      self._key = None
+    self._capturing = False
+
+  def _flush_bare(self, pos):
+    """Validate literal text (numbers, true, false, null) seen between structural characters."""
+    bare = self._bare.strip(_WHITESPACE)
+    self._bare = b''
+    if not bare:
+      return
+    if self._state not in (_VALUE, _VALUE_OR_CLOSE) or not self._stack or not _LITERAL.match(bare):
+      self._error(f'unexpected {bare[:20]!r}', pos)
+    self._state = _AFTER
+
+  def _structural(self, char, pos):
+    state = self._state
+    container = self._stack[-1] if self._stack else None
+
+    if char == 0x22:  # "
+      if state in (_KEY, _KEY_OR_CLOSE):
+        if len(self._stack) == 1 and self.capture_key is not None:
+          self._key = bytearray()
+        self._state = _COLON
+      elif state in (_VALUE, _VALUE_OR_CLOSE) and container is not None:
+        if (self.capture_key is not None and len(self._stack) == 1 and self._last_key == self.capture_key):
+          self._capturing = True
+          self.captured = True
+        self._state = _AFTER
+      else:
+        self._error('unexpected string', pos)
+      self._in_string = True
+    elif char in (0x7b, 0x5b):  # { [
+      if state not in (_VALUE, _VALUE_OR_CLOSE) or self._done:
+        self._error(f'unexpected {chr(char)!r}', pos)
+      if container is None and char != 0x7b:
+        self._error('root must be an object', pos)
+      self._stack.append(char)
+      self._state = _KEY_OR_CLOSE if char == 0x7b else _VALUE_OR_CLOSE
+    elif char in (0x7d, 0x5d):  # } ]
+      expected = 0x7b if char == 0x7d else 0x5b
+      allowed = _KEY_OR_CLOSE if char == 0x7d else _VALUE_OR_CLOSE
+      if container != expected or state not in (_AFTER, allowed):
+        self._error(f'unexpected {chr(char)!r}', pos)
+      self._stack.pop()
+      self._state = _AFTER
+      if not self._stack:
+        self._done = True
+    elif char == 0x3a:  # :
+      if state != _COLON:
+        self._error("unexpected ':'", pos)
+      self._state = _VALUE
+    elif char == 0x2c:  # ,
+      if state != _AFTER or container is None:
+        self._error("unexpected ','", pos)
+      self._state = _KEY if container == 0x7b else _VALUE
+
+
+class JsonObjectStream:
+  """
+  Incremental parser for a JSON object arriving as text chunks.
+  Each member value is decoded by the json C scanner and dropped right away,
+  so memory is bounded by the largest member instead of the whole document.
+  A member split across chunks is retried once the buffered text has doubled.
+  """
+
+  def __init__(self):
+    self.key_count = 0
+    self.offset = 0
+    self._state = _VALUE
+    self._chunks = []
+    self._buffered = 0
+    self._retry_at = 0
+
+  def feed(self, text):
+    self._chunks.append(text)
+    self._buffered += len(text)
+    if self._buffered >= self._retry_at:
+      self._parse(False)
+
+  def close(self):
+    """Parse what is left and check that the object is complete."""
+    self._parse(True)
+    if self._state != _DONE:
+      raise ValueError(f'Invalid JSON at char {self.offset}: unexpected end of document')
+
+  def _parse(self, final):
+    buf = ''.join(self._chunks)
+    size = len(buf)
+    pos = 0
+    self._retry_at = 0
+    while True:
+      pos = _TEXT_WHITESPACE.match(buf, pos).end()
+      if pos == size:
+        break
+      char = buf[pos]
+      state = self._state
+      if state == _VALUE and char == '{':
+        self._state = _KEY_OR_CLOSE
+        pos += 1
+      elif state in (_KEY, _KEY_OR_CLOSE) and char == '"' or state == _MEMBER:
+        try:
+          _, end = _DECODER.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+          # A truncated member fails at the end of the buffer or inside an open string
+          if final or not (e.msg.startswith('Unterminated string') or e.pos >= size - 8):
+            raise ValueError(f'Invalid JSON at char {self.offset + e.pos}: {e.msg}')
+          self._retry_at = 2 * (size - pos)
+          break
+        if state == _MEMBER and not final:
+          # A number is only complete once the delimiter after it has arrived
+          after = _TEXT_WHITESPACE.match(buf, end).end()
+          if after == size or (buf[after] not in ',}' and after >= size - 8):
+            self._retry_at = size - pos + 1
+            break
+        if state == _MEMBER:
+          self.key_count += 1
+          self._state = _AFTER
+        else:
+          self._state = _COLON
+        pos = end
+      elif state in (_KEY_OR_CLOSE, _AFTER) and char == '}':
+        self._state = _DONE
+        pos += 1
+      elif state == _COLON and char == ':':
+        self._state = _MEMBER
+        pos += 1
+      elif state == _AFTER and char == ',':
+        self._state = _KEY
+        pos += 1
+      else:
+        message = 'root must be an object' if state == _VALUE else f'unexpected {char!r}'
+        raise ValueError(f'Invalid JSON at char {self.offset + pos}: {message}')
+
+    rest = buf[pos:]
+    self._chunks = [rest] if rest else []
+    self._buffered = len(rest)
+    self.offset += pos
+
+
+class Base64StreamDecoder:
+  """Decode base64 text that arrives in arbitrarily split chunks."""
+
+  def __init__(self):
+    self._pending = b''
+
+  def feed(self, data):
+    # Like base64.b64decode, ignore characters outside the alphabet (e.g. JSON escaped slashes)
+    data = self._pending + _BASE64_JUNK.sub(b'', data)
+    cut = len(data) - len(data) % 4
+    self._pending = data[cut:]
+    return binascii.a2b_base64(data[:cut]) if cut else b''
+
+  def close(self):
+    if self._pending:
+      raise ValueError('Invalid base64 variables data: truncated input')
+
+
+def read_body(stream, length, chunk_size=READ_CHUNK_SIZE):
+  """Yield exactly length bytes from stream in chunks."""
+  remaining = length
+  while remaining > 0:
+    chunk = stream.read(min(chunk_size, remaining))
+    if not chunk:
+      raise ValueError(f'Request body truncated ({length - remaining} of {length} bytes received)')
+    remaining -= len(chunk)
+    yield chunk
+
+
+def ingest_ansible_vars(stream, length, blob_store, field='variables_b64', chunk_size=READ_CHUNK_SIZE):
+  """
+  Stream a /load_ansible_vars body of the given length into blob_store.
+  The decoded variables are stored under their sha256; identical pushes share one blob.
+  Returns (envelope, digest, size, variables_count) where envelope is the request
+  object with the base64 field emptied.
+  """
+  envelope_scanner = JsonStreamScanner(field)
+  decoder = Base64StreamDecoder()
+  utf8 = codecs.getincrementaldecoder('utf-8')()
+  variables = JsonObjectStream()
+  digest = hashlib.sha256()
+  envelope = bytearray()
+  size = 0
+
+  fd, tmp_path = blob_store.temp_file()
+  try:
+    with os.fdopen(fd, 'wb') as blob:
+      for chunk in read_body(stream, length, chunk_size):
+        kept, captured = envelope_scanner.feed(chunk)
+        envelope += kept
+        if not captured:
+          continue
+        decoded = decoder.feed(captured)
+        try:
+          variables.feed(utf8.decode(decoded))
+        except ValueError as e:
+          raise ValueError(f'Invalid base64 variables data: {e}')
+        digest.update(decoded)
+        blob.write(decoded)
+        size += len(decoded)
+
+      envelope_scanner.close()
+      if not envelope_scanner.captured:
+        raise ValueError(f'Missing {field} in request body')
+      decoder.close()
+      try:
+        variables.feed(utf8.decode(b'', final=True))
+        variables.close()
+      except ValueError as e:
+        raise ValueError(f'Invalid base64 variables data: {e}')
+  except BaseException:
+    os.unlink(tmp_path)
+    raise
+
+  hexdigest = blob_store.adopt(tmp_path, digest.hexdigest())
+  return json.loads(envelope.decode('utf-8')), hexdigest, size, variables.key_count
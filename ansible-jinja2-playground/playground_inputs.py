@@ -0,0 +1,372 @@
+"""
+Catalog of the input files directory.
+
+The listing is scanned once and kept in memory until the directory
+changes. Changes are detected with inotify where the platform provides it
+(Linux, through libc, no extra dependency) and by polling the directory
+mtime otherwise. Small files are cached keyed by path, mtime and size,
+so they are read from disk again only after they were modified; large
+files are sent straight from the page cache with os.sendfile (or an mmap
+where sendfile is not possible), whole or as a byte range.
+"""
+
+import ctypes
+import ctypes.util
+import mmap
+import os
+import re
+import select
+import stat
+import struct
+import threading
+import time
+
+# inotify event masks (linux/inotify.h)
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT = struct.Struct('iIII')
+
+# Files at least this large are streamed from disk instead of cached
+STREAM_MIN_BYTES = 1024 * 1024
+SEND_CHUNK_SIZE = 4 * 1024 * 1024
+
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)\Z')
+
+_libc = None
+
+
+def _inotify_libc():
+  """Return libc when it provides inotify, else None."""
+  global _libc
+  if _libc is None:
+    try:
+      libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+      libc.inotify_init1
+      libc.inotify_add_watch
+      _libc = libc
+    except (OSError, AttributeError, TypeError):
+      _libc = False
+  return _libc or None
+
+
+class InputFileError(Exception):
+  """Input file lookup failure carrying the HTTP status to answer with."""
+
+  def __init__(self, status, message):
+    super().__init__(message)
+    self.status = status
+
+
+class RangeNotSatisfiable(Exception):
+  """Raised by parse_range for ranges outside the file."""
+
+
+def parse_range(header, size):
+  """
+  Parse a Range header against a file of the given size.
+  Returns (start, end) with end exclusive, or None to send the whole file
+  (no header, multiple ranges or another unit). Raises RangeNotSatisfiable.
+  """
+  if not header:
+    return None
+  match = _RANGE.match(header.strip())
+  if not match or match.group(1) == match.group(2) == '':
+    return None
+  first, last = match.groups()
+  if first == '':
+    # Suffix range: the last n bytes
+    start, end = max(0, size - int(last)), size
+  else:
+    start = int(first)
+    end = size if last == '' else min(int(last) + 1, size)
+  if start >= size or start >= end:
+    raise RangeNotSatisfiable(f'Range {header} not satisfiable for {size} bytes')
+  return start, end
+
+
+def utf8_prefix(data):
+  """Drop an incomplete UTF-8 sequence at the end of data."""
+  for back in range(1, min(4, len(data)) + 1):
+    byte = data[-back]
+    if byte & 0xC0 != 0x80:
+      length = 1 if byte < 0x80 else 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+      return data[:-back] if length > back else data
+  return data
+
+
+def send_file(out, path, start, end):
+  """
+  Write bytes [start, end) of path to out, a file object over a socket.
+  Uses os.sendfile so the data never enters Python, and falls back to
+  writing slices of an mmap when out has no usable file descriptor.
+  Stops early if the file was truncated meanwhile. Returns the bytes sent.
+  """
+  sent = 0
+  with open(path, 'rb') as f:
+    try:
+      out_fd = out.fileno()
+    except (AttributeError, OSError, ValueError):
+      out_fd = None
+    if out_fd is not None and hasattr(os, 'sendfile'):
+      try:
+        while start + sent < end:
+          count = os.sendfile(out_fd, f.fileno(), start + sent, min(SEND_CHUNK_SIZE, end - start - sent))
+          if count == 0:
+            break
+          sent += count
+        return sent
+      except OSError:
+        # Nothing was written yet when sendfile is not supported for these descriptors
+        if sent:
+          raise
+    size = os.fstat(f.fileno()).st_size
+    if min(end, size) <= start:
+      return 0
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+      view = memoryview(mapped)
+      try:
+        for offset in range(start, min(end, size), SEND_CHUNK_SIZE):
+          chunk = view[offset:min(offset + SEND_CHUNK_SIZE, end, size)]
+          out.write(chunk)
+          sent += len(chunk)
+          chunk.release()
+      finally:
+        view.release()
+  return sent
+
+
+class InputFile:
+  """A file of the catalog as of its last stat."""
+
+  __slots__ = ('name', 'path', 'size', 'mtime_ns')
+
+  def __init__(self, name, path, size, mtime_ns):
+    self.name = name
+    self.path = path
+    self.size = size
+    self.mtime_ns = mtime_ns
+
+  @property
+  def key(self):
+    """Identifies this version of the file's content."""
+    return (self.path, self.mtime_ns, self.size)
+
+
+class DirectoryWatcher:
+  """
+  Background inotify watch on one directory. dirty is set whenever an
+  entry is created, deleted, renamed or rewritten, or when events were lost.
+  """
+
+  def __init__(self, directory, libc):
+    self.dirty = threading.Event()
+    self._stopped = threading.Event()
+    self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if self._fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    if libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK) < 0:
+      errno = ctypes.get_errno()
+      os.close(self._fd)
+      raise OSError(errno, f'inotify_add_watch failed for {directory}')
+    self._thread = threading.Thread(target=self._run, name='input-files-watch', daemon=True)
+    self._thread.start()
+
+  @property
+  def alive(self):
+    return not self._stopped.is_set()
+
+  def stop(self):
+    self._stopped.set()
+
+  def _run(self):
+    try:
+      while not self._stopped.is_set():
+        ready, _, _ = select.select([self._fd], [], [], 1.0)
+        if not ready:
+          continue
+        try:
+          data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+          continue
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+          _, mask, _, name_len = _EVENT.unpack_from(data, offset)
+          offset += _EVENT.size + name_len
+          self.dirty.set()
+          # The directory itself went away, the catalog falls back to scanning
+          if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+            self._stopped.set()
+    finally:
+      self._stopped.set()
+      self.dirty.set()
+      os.close(self._fd)
+
+
+class InputCatalog:
+  """
+  Cached listing and contents of an input files directory.
+  watch is 'auto' (inotify when available) or 'poll' (stat the directory
+  at most every poll_interval seconds). cache is an optional object with
+  get(key) and put(key, value, size) holding file contents.
+  """
+
+  def __init__(self, watch='auto', poll_interval=2.0, cache=None):
+    self.watch = watch
+    self.poll_interval = poll_interval
+    self.cache = cache
+    self._lock = threading.Lock()
+    self._directory = None
+    self._files = {}
+    self._names = []
+    self._stamp = None
+    self._checked = None
+    self._watcher = None
+
+  def _scan(self, directory):
+    """List regular files of directory that resolve inside it."""
+    files = {}
+    real_dir = os.path.realpath(directory)
+    with os.scandir(directory) as entries:
+      for entry in entries:
+        try:
+          if not entry.is_file():
+            continue
+          path = entry.path
+          if entry.is_symlink():
+            # Same rule as before: the resolved path must stay inside the directory
+            path = os.path.realpath(path)
+            if not path.startswith(real_dir + os.sep):
+              continue
+          st = entry.stat()
+        except OSError:
+          continue
+        files[entry.name] = InputFile(entry.name, path, st.st_size, st.st_mtime_ns)
+    return files
+
+  def _stop_watch(self):
+    if self._watcher is not None:
+      self._watcher.stop()
+      self._watcher = None
+
+  def _start_watch(self, directory):
+    self._stop_watch()
+    libc = _inotify_libc() if self.watch == 'auto' else None
+    if libc is None:
+      return
+    try:
+      self._watcher = DirectoryWatcher(directory, libc)
+    except OSError as e:
+      print(f"WARNING: Cannot watch input directory '{directory}' ({e}), polling instead")
+
+  def _refresh(self, directory):
+    """Rescan directory when it is new or changed. Called with the lock held."""
+    now = time.monotonic()
+    if directory != self._directory:
+      self._directory = directory
+      self._stamp = None
+      self._checked = None
+      self._stop_watch()
+    elif self._watcher is not None and self._watcher.alive:
+      if not self._watcher.dirty.is_set():
+        return
+    elif self._checked is not None and now - self._checked < self.poll_interval:
+      return
+    self._checked = now
+
+    try:
+      st = os.stat(directory)
+      stamp = (st.st_ino, st.st_mtime_ns)
+    except OSError:
+      stamp = None
+    if self._watcher is not None and not self._watcher.alive:
+      self._watcher = None
+    if stamp is None:
+      self._stop_watch()
+    elif stamp != self._stamp and self._watcher is None:
+      # Watch before scanning so no change between the two is missed
+      self._start_watch(directory)
+    elif stamp == self._stamp and self._watcher is None:
+      return
+    if self._watcher is not None:
+      self._watcher.dirty.clear()
+
+    try:
+      files = self._scan(directory) if stamp is not None else {}
+    except OSError:
+      files = {}
+    self._stamp = stamp
+    self._files = files
+    self._names = sorted(files)
+
+  def files(self, directory):
+    """Sorted names of the files in directory."""
+    with self._lock:
+      self._refresh(directory)
+      return self._names
+
+  def lookup(self, directory, filename):
+    """
+    Return the InputFile for filename, re-checked with a stat. Its path is
+    resolved again, so a file replaced by a symlink leading out of the
+    directory since the last scan is refused.
+    Raises InputFileError for unsafe names and missing files.
+    """
+    # Only plain names of files directly inside the directory are served
+    if not filename or os.path.basename(filename) != filename or any(c in filename for c in ('..', '/', '\\')):
+      raise InputFileError(403, 'Access denied - invalid filename')
+    with self._lock:
+      self._refresh(directory)
+      entry = self._files.get(filename)
+    if entry is None:
+      raise InputFileError(404, 'File not found')
+    try:
+      path = os.path.realpath(entry.path)
+      real_dir = os.path.realpath(directory)
+    except (OSError, ValueError):
+      raise InputFileError(403, 'Access denied - path resolution error')
+    if not path.startswith(real_dir + os.sep):
+      raise InputFileError(403, 'Access denied - path traversal detected')
+    try:
+      st = os.stat(path)
+    except OSError:
+      raise InputFileError(404, 'File not found')
+    if not stat.S_ISREG(st.st_mode):
+      raise InputFileError(404, 'File not found')
+    if (path, st.st_mtime_ns, st.st_size) != (entry.path, entry.mtime_ns, entry.size):
+      entry = InputFile(entry.name, path, st.st_size, st.st_mtime_ns)
+    return entry
+
+  def read_range(self, entry, start, end):
+    """Return bytes [start, end) of an InputFile, reading only that part of large files."""
+    if entry.size < STREAM_MIN_BYTES:
+      return self.read(entry)[start:end]
+    with open(entry.path, 'rb') as f:
+      return os.pread(f.fileno(), end - start, start)
+
+  def read(self, entry):
+    """
+    Return the content of an InputFile as bytes, from the cache when unchanged.
+    Files of STREAM_MIN_BYTES and more are always read from disk.
+    """
+    cacheable = self.cache is not None and entry.size < STREAM_MIN_BYTES
+    if cacheable:
+      data = self.cache.get(entry.key)
+      if data is not None:
+        return data
+    with open(entry.path, 'rb') as f:
+      data = f.read()
+    if cacheable:
+      self.cache.put(entry.key, data, len(data))
+    return data
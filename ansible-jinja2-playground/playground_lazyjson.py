@@ -0,0 +1,112 @@
+"""
+Lazy access to large JSON object inputs.
+
+index_object() scans a JSON document once and records where the value of
+each top-level key starts and ends. Each value is decoded by the C parser
+to find its end and dropped right away, so indexing costs about one
+json.loads but never holds the whole tree in memory. LazyObject is a
+read-only mapping over that index which decodes a value with json.loads
+the first time it is looked up: once the index is cached, a template that
+reads ansible_hostname from a 100 MB facts dump only decodes that string
+instead of unpickling a copy of the whole document on every render.
+"""
+
+import collections.abc
+import json
+import re
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class LazyJSONError(ValueError):
+  """The document is not a JSON object, or its top level is malformed."""
+
+
+def index_object(text):
+  """
+  Index the top-level keys of a JSON object document.
+  Returns {key: (start, end)} with the offsets of each value in text.
+  Raises LazyJSONError when text is not a well-formed JSON object at the top level.
+  """
+  index = {}
+  pos = _WHITESPACE.match(text, 0).end()
+  if text[pos:pos + 1] != '{':
+    raise LazyJSONError('Not a JSON object')
+  pos = _WHITESPACE.match(text, pos + 1).end()
+  if text[pos:pos + 1] == '}':
+    pos += 1
+  else:
+    while True:
+      if text[pos:pos + 1] != '"':
+        raise LazyJSONError(f'Expected a key at offset {pos}')
+      try:
+        key, pos = json.decoder.scanstring(text, pos + 1)
+      except ValueError as e:
+        raise LazyJSONError(str(e))
+      pos = _WHITESPACE.match(text, pos).end()
+      if text[pos:pos + 1] != ':':
+        raise LazyJSONError(f"Expected ':' at offset {pos}")
+      start = _WHITESPACE.match(text, pos + 1).end()
+      try:
+        # Decoded only to find where it ends, the value is dropped right away
+        _, end = _decoder.raw_decode(text, start)
+      except ValueError as e:
+        raise LazyJSONError(str(e))
+      index[key] = (start, end)
+      pos = _WHITESPACE.match(text, end).end()
+      separator = text[pos:pos + 1]
+      pos = _WHITESPACE.match(text, pos + 1).end()
+      if separator == '}':
+        break
+      if separator != ',':
+        raise LazyJSONError(f"Expected ',' or '}}' at offset {pos}")
+  if _WHITESPACE.match(text, pos).end() != len(text):
+    raise LazyJSONError(f'Extra data at offset {pos}')
+  return index
+
+
+class LazyIndex:
+  """An indexed document. Cheap to share; view() gives each render its own LazyObject."""
+
+  __slots__ = ('text', 'offsets')
+
+  def __init__(self, text):
+    self.text = text
+    self.offsets = index_object(text)
+
+  def view(self):
+    return LazyObject(self)
+
+
+class LazyObject(collections.abc.Mapping):
+  """
+  Read-only mapping of the top-level keys of an indexed document. Values
+  are decoded on first access and kept for the lifetime of the mapping.
+  Attributes are underscored: templates never see them in place of a key.
+  """
+
+  def __init__(self, index):
+    self._index = index
+    self._values = {}
+
+  def __getitem__(self, key):
+    try:
+      return self._values[key]
+    except KeyError:
+      pass
+    start, end = self._index.offsets[key]
+    value = self._values[key] = json.loads(self._index.text[start:end])
+    return value
+
+  def __contains__(self, key):
+    return key in self._index.offsets
+
+  def __iter__(self):
+    return iter(self._index.offsets)
+
+  def __len__(self):
+    return len(self._index.offsets)
+
+  def __repr__(self):
+    return f'<LazyObject {len(self)} keys, {len(self._values)} decoded>'
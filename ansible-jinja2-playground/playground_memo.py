@@ -0,0 +1,144 @@
+"""
+Memoization of pure Ansible filters.
+
+Loop simulations call filters such as hash, regex_replace or from_yaml
+again and again with the same arguments. FilterMemo wraps the filters
+listed in PURE_FILTERS so repeated calls return the stored result: either
+per render (the memo lives as long as one render_template call) or
+globally in a bounded LRU shared by every render.
+
+Arguments are frozen into a key made of their types and values, so 1,
+1.0 and True never share an entry; lists and dicts are frozen
+recursively in order up to MAX_KEY_ITEMS values. Calls with anything
+else (Undefined, objects, larger structures) run normally. Mutable
+results are deep-copied on every hit so a template can never change a
+stored value.
+"""
+
+import contextlib
+import contextvars
+import copy
+import functools
+
+from playground_renders import UNSEEDED_FILTERS
+
+# Filters whose result only depends on their arguments
+PURE_FILTERS = {
+    'hash', 'md5', 'sha1', 'checksum', 'to_uuid', 'b64encode', 'b64decode',
+    'regex_search', 'regex_replace', 'regex_findall', 'regex_escape',
+    'from_yaml', 'from_yaml_all', 'to_yaml', 'to_nice_yaml', 'from_json', 'to_json', 'to_nice_json',
+    'password_hash',
+}
+MODES = ('off', 'render', 'global')
+# Largest number of values frozen into a key
+MAX_KEY_ITEMS = 1000
+
+_SCALARS = (str, bytes, int, float, bool, type(None))
+_scope = contextvars.ContextVar('filter_memo_scope', default=None)
+
+
+class _Unmemoizable(Exception):
+  pass
+
+
+def freeze(value, budget):
+  """
+  Hashable key for value, tagged with types. budget is a one-item list
+  counting down the values that may still be frozen.
+  """
+  budget[0] -= 1
+  if budget[0] < 0:
+    raise _Unmemoizable()
+  kind = type(value)
+  if kind in _SCALARS:
+    return kind, value
+  if kind is list or kind is tuple:
+    return kind, tuple(freeze(v, budget) for v in value)
+  if kind is dict:
+    return kind, tuple((freeze(k, budget), freeze(v, budget)) for k, v in value.items())
+  raise _Unmemoizable()
+
+
+class FilterMemo:
+  """
+  Memoizes pure filters per render or globally. cache is an LRU with
+  get/put used in global mode; stats(filter, result) is called with
+  result 'hit', 'miss' or 'skip' (arguments that cannot be keyed).
+  """
+
+  def __init__(self, mode, cache, max_entries, stats=None):
+    if mode not in MODES:
+      print(f"WARNING: Unknown filter memo mode '{mode}', filters are not memoized")
+      mode = 'off'
+    self.mode = mode
+    self.cache = cache
+    self.max_entries = max_entries
+    self.stats = stats or (lambda name, result: None)
+    self._originals = {}
+
+  def install(self, filters):
+    """Replace the pure filters of an environment's filters dict by memoizing wrappers."""
+    if self.mode == 'off' or self.max_entries <= 0:
+      return
+    for name in PURE_FILTERS & filters.keys():
+      self._originals[name] = filters[name]
+      filters[name] = self.wrap(name, filters[name])
+
+  def disable(self, filters):
+    """Put back the filters replaced by install, as if the mode was 'off'."""
+    self.mode = 'off'
+    filters.update(self._originals)
+    self._originals = {}
+
+  @contextlib.contextmanager
+  def render_scope(self):
+    """Run a render with its own memo when memoizing per render."""
+    if self.mode != 'render':
+      yield
+      return
+    token = _scope.set({})
+    try:
+      yield
+    finally:
+      _scope.reset(token)
+
+  def _lookup(self, key):
+    if self.mode == 'global':
+      return self.cache.get(key)
+    memo = _scope.get()
+    return memo.get(key) if memo is not None else None
+
+  def _store(self, key, result):
+    if self.mode == 'global':
+      self.cache.put(key, result)
+      return
+    memo = _scope.get()
+    if memo is not None and len(memo) < self.max_entries:
+      memo[key] = result
+
+  def wrap(self, name, func):
+    # A filter that is only deterministic when this argument is given
+    seed = UNSEEDED_FILTERS.get(name)
+
+    @functools.wraps(func)
+    def memoized(value, *args, **kwargs):
+      if (seed and len(args) <= seed[0] and seed[1] not in kwargs) or (self.mode == 'render' and _scope.get() is None):
+        return func(value, *args, **kwargs)
+      try:
+        budget = [MAX_KEY_ITEMS]
+        key = (name, freeze(value, budget), freeze(args, budget),
+               tuple(sorted((k, freeze(v, budget)) for k, v in kwargs.items())))
+      except _Unmemoizable:
+        self.stats(name, 'skip')
+        return func(value, *args, **kwargs)
+      # Results are stored in a 1-tuple so a None result is a hit too
+      stored = self._lookup(key)
+      if stored is not None:
+        self.stats(name, 'hit')
+        result = stored[0]
+        return result if type(result) in _SCALARS else copy.deepcopy(result)
+      self.stats(name, 'miss')
+      result = func(value, *args, **kwargs)
+      self._store(key, (result if type(result) in _SCALARS else copy.deepcopy(result),))
+      return result
+    return memoized
@@ -0,0 +1,167 @@
+"""
+Lightweight in-process metrics for ansible_jinja2_playground.
+
+Counters, gauges and histograms are kept in plain dictionaries keyed by
+label values and rendered on demand in the Prometheus text exposition
+format (version 0.0.4). Updating a metric costs one lock acquisition and
+a dictionary lookup, so instrumentation stays off the render hot path.
+"""
+
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Request latency buckets in seconds, from 1 ms up to 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+  """Escape a label value for the text exposition format."""
+  return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+  if value == math.inf:
+    return '+Inf'
+  if isinstance(value, float) and value.is_integer():
+    return str(int(value))
+  return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+  """Base class holding the metric name, help text and label names."""
+
+  kind = 'untyped'
+
+  def __init__(self, name, documentation, labelnames=()):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._lock = threading.Lock()
+    self._values = {}
+
+  def _labels(self, labelvalues, extra=None):
+    pairs = list(zip(self.labelnames, labelvalues))
+    if extra:
+      pairs.append(extra)
+    if not pairs:
+      return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+  def samples(self):
+    """Return a list of (suffix, label string, value) tuples."""
+    with self._lock:
+      return [('', self._labels(key), value) for key, value in sorted(self._values.items())]
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+    for suffix, labels, value in self.samples():
+      lines.append(f'{self.name}{suffix}{labels} {_format_value(value)}')
+    return '\n'.join(lines)
+
+
+class Counter(Metric):
+  """Monotonically increasing counter."""
+
+  kind = 'counter'
+
+  def inc(self, *labelvalues, amount=1):
+    with self._lock:
+      self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+  def get(self, *labelvalues):
+    with self._lock:
+      return self._values.get(labelvalues, 0)
+
+
+class Gauge(Metric):
+  """
+  Value that can go up and down.
+  If collect is given it is called at scrape time and its result is exported
+  for an unlabelled gauge instead of the stored value.
+  """
+
+  kind = 'gauge'
+
+  def __init__(self, name, documentation, labelnames=(), collect=None):
+    super().__init__(name, documentation, labelnames)
+    self._collect = collect
+
+  def set(self, value, *labelvalues):
+    with self._lock:
+      self._values[labelvalues] = value
+
+  def inc(self, *labelvalues, amount=1):
+    with self._lock:
+      self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+  def get(self, *labelvalues):
+    with self._lock:
+      return self._values.get(labelvalues, 0)
+
+  def samples(self):
+    if self._collect is not None:
+      try:
+        return [('', '', self._collect())]
+      except Exception:
+        return []
+    return super().samples()
+
+
+class Histogram(Metric):
+  """Cumulative histogram with fixed upper bounds."""
+
+  kind = 'histogram'
+
+  def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    super().__init__(name, documentation, labelnames)
+    self.buckets = tuple(sorted(buckets))
+
+  def observe(self, value, *labelvalues):
+    index = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      state = self._values.get(labelvalues)
+      if state is None:
+        state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+      state[0][index] += 1
+      state[1] += value
+      state[2] += 1
+
+  def samples(self):
+    with self._lock:
+      items = [(key, list(state[0]), state[1], state[2]) for key, state in sorted(self._values.items())]
+    result = []
+    for key, counts, total, count in items:
+      cumulative = 0
+      for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+        cumulative += bucket_count
+        result.append(('_bucket', self._labels(key, ('le', _format_value(float(bound)))), cumulative))
+      result.append(('_sum', self._labels(key), total))
+      result.append(('_count', self._labels(key), count))
+    return result
+
+
+class MetricsRegistry:
+  """Collection of metrics rendered together by the /metrics endpoint."""
+
+  def __init__(self):
+    self._metrics = []
+
+  def register(self, metric):
+    self._metrics.append(metric)
+    return metric
+
+  def counter(self, name, documentation, labelnames=()):
+    return self.register(Counter(name, documentation, labelnames))
+
+  def gauge(self, name, documentation, labelnames=(), collect=None):
+    return self.register(Gauge(name, documentation, labelnames, collect))
+
+  def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return self.register(Histogram(name, documentation, labelnames, buckets))
+
+  def render(self):
+    """Render all metrics in the Prometheus text exposition format."""
+    return '\n'.join(metric.render() for metric in self._metrics) + '\n'
@@ -0,0 +1,182 @@
+"""
+Profiling helpers for ansible_jinja2_playground.
+
+profile_call() runs a single render under cProfile while a StackSampler
+attributes samples to Jinja2 template lines, so a slow expression can be
+traced back to the template line and the filter it calls. StackSampler on
+its own samples every server thread for /debug/profile.
+"""
+
+import collections
+import cProfile
+import pstats
+import sys
+import threading
+import time
+
+# Filename Jinja2 gives to code compiled by Environment.from_string
+TEMPLATE_FILENAME = '<template>'
+
+
+def _function_label(key):
+  filename, firstlineno, name = key
+  return {'function': name, 'file': filename, 'line': firstlineno}
+
+
+class StackSampler:
+  """
+  Periodically samples Python stacks of the selected threads.
+  thread_ids=None samples every thread except the sampler and its creator.
+  template_sources maps compiled Template objects to their source text.
+  """
+
+  def __init__(self, thread_ids=None, interval=0.005, template_sources=None):
+    self.thread_ids = thread_ids
+    self.interval = interval
+    self.template_sources = template_sources if template_sources is not None else {}
+    self.samples = 0
+    self.self_counts = collections.Counter()
+    self.total_counts = collections.Counter()
+    self.template_counts = collections.Counter()
+    self.template_callees = collections.defaultdict(collections.Counter)
+    # When sampling the whole process, skip the thread that asked for it
+    self._excluded = {threading.get_ident()} if thread_ids is None else set()
+    self._stop = threading.Event()
+    self._thread = None
+
+  def start(self):
+    self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+    if self._thread:
+      self._thread.join()
+
+  def _run(self):
+    self._excluded.add(threading.get_ident())
+    while not self._stop.wait(self.interval):
+      self.sample()
+
+  def sample(self):
+    for thread_id, frame in sys._current_frames().items():
+      if thread_id in self._excluded:
+        continue
+      if self.thread_ids is not None and thread_id not in self.thread_ids:
+        continue
+      self._record(frame)
+
+  def _record(self, frame):
+    self.samples += 1
+    seen = set()
+    callee = None
+    template_hit = None
+    leaf = True
+    while frame is not None:
+      code = frame.f_code
+      key = (code.co_filename, code.co_firstlineno, code.co_name)
+      if leaf:
+        self.self_counts[key] += 1
+        leaf = False
+      if key not in seen:
+        seen.add(key)
+        self.total_counts[key] += 1
+      # Innermost template frame: the line being rendered and what it called
+      if template_hit is None and code.co_filename == TEMPLATE_FILENAME:
+        template = frame.f_globals.get('__jinja_template__')
+        line = template.get_corresponding_lineno(frame.f_lineno) if template else frame.f_lineno
+        template_hit = (template, line)
+        if callee:
+          self.template_callees[template_hit][callee] += 1
+      callee = key
+      frame = frame.f_back
+    if template_hit:
+      self.template_counts[template_hit] += 1
+
+  def report(self, top=25):
+    """Return the hottest functions and template lines as JSON-serializable data."""
+    total = self.samples or 1
+
+    def functions(counter):
+      return [dict(_function_label(key), samples=count, percent=round(count * 100.0 / total, 2))
+              for key, count in counter.most_common(top)]
+
+    lines = []
+    for (template, line), count in self.template_counts.most_common(top):
+      source = self.template_sources.get(template) if template is not None else None
+      source_lines = source.splitlines() if source else []
+      callees = self.template_callees.get((template, line), collections.Counter())
+      lines.append({
+          'template': getattr(template, 'name', None) or TEMPLATE_FILENAME,
+          'line': line,
+          'source': source_lines[line - 1].strip() if 0 < line <= len(source_lines) else '',
+          'samples': count,
+          'percent': round(count * 100.0 / total, 2),
+          'calls': [dict(_function_label(key), samples=n) for key, n in callees.most_common(5)]
+      })
+
+    return {
+        'samples': self.samples,
+        'interval_ms': self.interval * 1000,
+        'self_time': functions(self.self_counts),
+        'total_time': functions(self.total_counts),
+        'template_lines': lines
+    }
+
+
+def cprofile_top(profiler, top=25, sort='cumulative'):
+  """Return the top functions recorded by a cProfile.Profile."""
+  stats = pstats.Stats(profiler)
+  rows = []
+  for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+    rows.append({
+        'function': name,
+        'file': filename,
+        'line': line,
+        'calls': calls,
+        'total_ms': round(tottime * 1000, 3),
+        'cumulative_ms': round(cumtime * 1000, 3)
+    })
+  key = 'total_ms' if sort == 'tottime' else 'cumulative_ms'
+  rows.sort(key=lambda row: row[key], reverse=True)
+  return rows[:top]
+
+
+def profile_call(func, template_sources=None, top=25, sort='cumulative', interval=0.001):
+  """
+  Call func() under cProfile and a stack sampler bound to the current thread.
+  Returns (result, report).
+  """
+  profiler = cProfile.Profile()
+  sampler = StackSampler({threading.get_ident()}, interval, template_sources)
+  start = time.perf_counter()
+  sampler.start()
+  profiler.enable()
+  try:
+    result = func()
+  finally:
+    profiler.disable()
+    sampler.stop()
+  duration = time.perf_counter() - start
+
+  sampled = sampler.report(top)
+  return result, {
+      'duration_ms': round(duration * 1000, 3),
+      'top_functions': cprofile_top(profiler, top, sort),
+      'samples': sampled['samples'],
+      'template_lines': sampled['template_lines']
+  }
+
+
+def sample_server(seconds, interval=0.005, template_sources=None, top=25):
+  """Sample every other thread of the process for the given number of seconds."""
+  sampler = StackSampler(None, interval, template_sources)
+  start = time.perf_counter()
+  sampler.start()
+  try:
+    time.sleep(seconds)
+  finally:
+    sampler.stop()
+  report = sampler.report(top)
+  report['duration_s'] = round(time.perf_counter() - start, 3)
+  return report
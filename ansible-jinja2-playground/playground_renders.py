@@ -0,0 +1,180 @@
+"""
+Scheduling of interactive renders.
+
+The editor renders on every keystroke, so one browser tab sends a stream
+of renders of which only the latest matters. RenderSlots keeps one slot
+per client: claiming it with a newer sequence number supersedes the
+render holding it, which then stops at its next checkpoint (before it
+starts, between loop iterations and between output chunks) instead of
+finishing output nobody will see.
+
+RenderFlights coalesces identical renders running at the same time: the
+first computes, the others wait for and share its result. A shared
+render is only abandoned once every request waiting for it was
+superseded.
+
+is_deterministic() tells whether a template always renders the same
+output for the same input, which is what makes its results cacheable.
+"""
+
+import threading
+
+from jinja2 import nodes
+
+# Filters, tests and functions whose result changes from one call to the next or with the file system
+VOLATILE_FILTERS = {'random', 'shuffle', 'fileglob', 'realpath', 'expanduser'}
+VOLATILE_TESTS = {'exists', 'file', 'directory', 'link', 'link_exists', 'abs', 'mount', 'same_file',
+                  'is_file', 'is_dir', 'is_link', 'is_abs', 'is_mount', 'is_same_file'}
+VOLATILE_FUNCTIONS = {'lipsum'}
+# Filters applying a test or filter given by name: name -> (index of the name argument, kind)
+NAMED_CALL_FILTERS = {'select': (0, 'test'), 'reject': (0, 'test'), 'selectattr': (1, 'test'),
+                      'rejectattr': (1, 'test'), 'map': (0, 'filter')}
+# Filters that are random or time dependent without this argument: name -> (index after the value, keyword)
+UNSEEDED_FILTERS = {'password_hash': (1, 'salt'), 'vault': (1, 'salt'), 'strftime': (0, 'second')}
+
+
+class RenderSuperseded(Exception):
+  """Raised at a checkpoint of a render no request is waiting for anymore."""
+
+
+class RenderTicket:
+  """A request's claim on its client's render slot."""
+
+  __slots__ = ('client_id', 'seq', 'superseded')
+
+  def __init__(self, client_id, seq):
+    self.client_id = client_id
+    self.seq = seq
+    self.superseded = threading.Event()
+
+  def check(self):
+    if self.superseded.is_set():
+      raise RenderSuperseded('Render superseded by a newer request')
+
+
+class RenderSlots:
+  """Latest render per client. Requests without a client id are never superseded."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._slots = {}
+
+  def claim(self, client_id, seq=0):
+    """
+    Take client_id's slot for render number seq and supersede the render
+    holding it. A render older than the holder is superseded right away.
+    """
+    ticket = RenderTicket(client_id, seq)
+    if not client_id:
+      return ticket
+    with self._lock:
+      current = self._slots.get(client_id)
+      if current is not None and current.seq > seq:
+        ticket.superseded.set()
+        return ticket
+      if current is not None:
+        current.superseded.set()
+      self._slots[client_id] = ticket
+    return ticket
+
+  def release(self, ticket):
+    """Free the slot once the render finished, unless a newer one took it."""
+    with self._lock:
+      if self._slots.get(ticket.client_id) is ticket:
+        del self._slots[ticket.client_id]
+
+  def __len__(self):
+    return len(self._slots)
+
+
+class _Flight:
+  __slots__ = ('tickets', 'done', 'result', 'error')
+
+  def __init__(self, ticket):
+    self.tickets = [ticket]
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+  def check(self):
+    if all(t.superseded.is_set() for t in self.tickets):
+      raise RenderSuperseded('Render superseded by a newer request')
+
+
+class RenderFlights:
+  """Runs one computation per key at a time and shares its result with concurrent callers."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._flights = {}
+
+  def run(self, key, ticket, compute):
+    """
+    Return compute(check), or the result of the identical computation
+    already running under key. check() raises RenderSuperseded once no
+    caller still wants the result. Returns (result, shared).
+    """
+    while True:
+      with self._lock:
+        flight = self._flights.get(key)
+        if flight is None:
+          flight = self._flights[key] = _Flight(ticket)
+          break
+        flight.tickets.append(ticket)
+      flight.done.wait()
+      ticket.check()
+      if isinstance(flight.error, RenderSuperseded):
+        # Joined just as the others were superseded, compute it again
+        continue
+      if flight.error is not None:
+        raise flight.error
+      return flight.result, True
+
+    try:
+      flight.result = compute(flight.check)
+    except BaseException as e:
+      flight.error = e
+      raise
+    finally:
+      with self._lock:
+        del self._flights[key]
+      flight.done.set()
+    ticket.check()
+    return flight.result, False
+
+
+def _has_argument(node, index, keyword):
+  return len(node.args) > index or any(kw.key == keyword for kw in node.kwargs) or bool(node.dyn_args or node.dyn_kwargs)
+
+
+def _applies_volatile(node):
+  """Whether a select/reject/map style filter applies a volatile test or filter by name."""
+  index, kind = NAMED_CALL_FILTERS[node.name]
+  if len(node.args) <= index:
+    # map(attribute=...) and selectattr('x') apply no test or filter
+    return False
+  name = node.args[index]
+  if not isinstance(name, nodes.Const):
+    return True
+  return name.value in (VOLATILE_TESTS if kind == 'test' else VOLATILE_FILTERS)
+
+
+def is_deterministic(ast):
+  """
+  Check a parsed template (Environment.parse) for filters, tests and
+  functions with random, time or file system dependent output.
+  """
+  for node in ast.find_all((nodes.Filter, nodes.Test, nodes.Call)):
+    if isinstance(node, nodes.Test):
+      if node.name in VOLATILE_TESTS:
+        return False
+    elif isinstance(node, nodes.Filter):
+      if node.name in VOLATILE_FILTERS:
+        return False
+      if node.name in UNSEEDED_FILTERS and not _has_argument(node, *UNSEEDED_FILTERS[node.name]):
+        return False
+      if node.name in NAMED_CALL_FILTERS and _applies_volatile(node):
+        return False
+    elif isinstance(node.node, nodes.Name) and node.node.name in VOLATILE_FUNCTIONS:
+      return False
+  return True
@@ -0,0 +1,118 @@
+"""
+Crash-safe persistence for the history and configuration files.
+
+atomic_write() writes a complete new copy of a file next to it, flushes it
+to disk and renames it over the original, so readers see either the old
+or the new content and never a truncated file. FileLock serializes
+read-modify-write cycles between the threads of one process and between
+processes sharing the same conf directory (fcntl advisory lock on a
+separate .lock file, thread-only where fcntl is not available).
+"""
+
+import os
+import shutil
+import threading
+import uuid
+
+try:
+  import fcntl
+except ImportError:  # not available on Windows
+  fcntl = None
+
+_TEMP_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+
+
+def fsync_directory(directory):
+  """Flush a directory entry change (e.g. a rename) to disk where supported."""
+  try:
+    fd = os.open(directory, os.O_RDONLY)
+  except OSError:
+    return
+  try:
+    os.fsync(fd)
+  except OSError:
+    pass
+  finally:
+    os.close(fd)
+
+
+def create_temp_file(directory, prefix):
+  """
+  Create a new file with a unique name in directory and return (fd, path).
+  Unlike tempfile.mkstemp the file gets the permissions open() would give
+  it (0o666 less the umask), without changing the process umask.
+  """
+  while True:
+    tmp_path = os.path.join(directory, prefix + uuid.uuid4().hex[:12])
+    try:
+      return os.open(tmp_path, _TEMP_FLAGS, 0o666), tmp_path
+    except FileExistsError:
+      continue
+
+
+def atomic_write(path, write, encoding='utf-8'):
+  """
+  Replace path with the text produced by write(file).
+  The permissions of an existing file are kept. On error the original
+  file is left untouched and the temporary file is removed.
+  """
+  directory = os.path.dirname(os.path.abspath(path))
+  os.makedirs(directory, exist_ok=True)
+  fd, tmp_path = create_temp_file(directory, '.' + os.path.basename(path) + '.')
+  try:
+    with os.fdopen(fd, 'w', encoding=encoding) as tmp:
+      write(tmp)
+      tmp.flush()
+      os.fsync(tmp.fileno())
+    if os.path.exists(path):
+      shutil.copymode(path, tmp_path)
+    os.replace(tmp_path, path)
+  except BaseException:
+    if os.path.exists(tmp_path):
+      os.unlink(tmp_path)
+    raise
+  fsync_directory(directory)
+
+
+class FileLock:
+  """
+  Re-entrant exclusive lock shared by threads and processes.
+  The first acquisition in a thread takes the advisory lock on lock_path,
+  nested acquisitions only increase a counter.
+  """
+
+  def __init__(self, lock_path):
+    self.lock_path = lock_path
+    self._thread_lock = threading.RLock()
+    self._depth = 0
+    self._fd = None
+
+  def acquire(self):
+    self._thread_lock.acquire()
+    if self._depth == 0 and fcntl is not None:
+      try:
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+      except BaseException:
+        if self._fd is not None:
+          os.close(self._fd)
+          self._fd = None
+        self._thread_lock.release()
+        raise
+    self._depth += 1
+
+  def release(self):
+    self._depth -= 1
+    if self._depth == 0 and self._fd is not None:
+      fcntl.flock(self._fd, fcntl.LOCK_UN)
+      os.close(self._fd)
+      self._fd = None
+    self._thread_lock.release()
+
+  def __enter__(self):
+    self.acquire()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.release()
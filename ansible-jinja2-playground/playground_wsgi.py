@@ -0,0 +1,135 @@
+"""
+WSGI entry point for BaseHTTPRequestHandler subclasses.
+
+WSGIApplication runs the unchanged handler class for every request, so
+the endpoints behave exactly as under http.server, and lets production
+servers (gunicorn, uWSGI, mod_wsgi) provide the processes: several
+prefork workers can share one preloaded Ansible import and use every core.
+
+The handler reads the body from wsgi.input and writes its usual raw HTTP
+response; ResponseWriter parses the status line and headers from it,
+hands them to start_response and passes the body on as it is written,
+so large responses are streamed instead of buffered.
+"""
+
+import http.client
+import io
+import sys
+import wsgiref.util
+from urllib.parse import quote
+
+# Headers the WSGI server sets itself
+SERVER_HEADERS = ('server', 'date')
+
+
+def bind_handler(handler_class, server, client_address, rfile, wfile, command, path, version, headers):
+  """
+  Create a handler_class instance ready to run one request, without the
+  socket setup and request line parsing BaseHTTPRequestHandler does itself.
+  """
+  handler = handler_class.__new__(handler_class)
+  handler.server = server
+  handler.request = None
+  handler.client_address = client_address
+  handler.rfile = rfile
+  handler.wfile = wfile
+  handler.requestline = f'{command} {path} {version}'
+  handler.raw_requestline = handler.requestline.encode('latin-1') + b'\r\n'
+  handler.command = command
+  handler.path = path
+  handler.request_version = version
+  handler.headers = headers
+  handler.close_connection = True
+  return handler
+
+
+def run_handler(handler):
+  """Call the do_<command> method of a bound handler, answering 501 when there is none."""
+  method = getattr(handler, 'do_' + handler.command, None)
+  if method is None:
+    handler.send_error(501, f'Unsupported method ({handler.command!r})')
+  else:
+    method()
+  handler.wfile.flush()
+
+
+class ResponseWriter(io.RawIOBase):
+  """
+  Writable file receiving a raw HTTP response. The head is parsed and
+  given to start_response; body bytes go to the write callable it returns.
+  """
+
+  def __init__(self, start_response):
+    self._start_response = start_response
+    self._head = bytearray()
+    self._write = None
+
+  @property
+  def started(self):
+    return self._write is not None
+
+  def writable(self):
+    return True
+
+  def write(self, data):
+    data = bytes(data)
+    if self._write is None:
+      self._head += data
+      end = self._head.find(b'\r\n\r\n')
+      if end < 0:
+        return len(data)
+      body = bytes(self._head[end + 4:])
+      self._start(bytes(self._head[:end]))
+      if body:
+        self._write(body)
+    elif data:
+      self._write(data)
+    return len(data)
+
+  def _start(self, head):
+    status_line, _, header_block = head.partition(b'\r\n')
+    status = status_line.decode('latin-1').split(' ', 1)[1]
+    message = http.client.parse_headers(io.BytesIO(header_block + b'\r\n\r\n'))
+    headers = [(key, value) for key, value in message.items()
+               if key.lower() not in SERVER_HEADERS and not wsgiref.util.is_hop_by_hop(key)]
+    self._write = self._start_response(status, headers)
+
+
+class WSGIApplication:
+  """WSGI callable serving every request with handler_class."""
+
+  def __init__(self, handler_class):
+    self.handler_class = handler_class
+
+  def __call__(self, environ, start_response):
+    headers = http.client.HTTPMessage()
+    for key, value in environ.items():
+      if key.startswith('HTTP_'):
+        headers[key[5:].replace('_', '-').title()] = value
+    for key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+      if environ.get(key):
+        headers[key.replace('_', '-').title()] = environ[key]
+
+    # PATH_INFO holds the decoded path bytes as latin-1 (PEP 3333), the handler expects the request target
+    path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '/')
+    path = quote(path.encode('latin-1'), safe="/;=,@:!$&'()*+~")
+    if environ.get('QUERY_STRING'):
+      path += '?' + environ['QUERY_STRING']
+    client_address = (environ.get('REMOTE_ADDR', ''), int(environ.get('REMOTE_PORT') or 0))
+
+    writer = ResponseWriter(start_response)
+    handler = bind_handler(self.handler_class, self, client_address, environ['wsgi.input'], writer,
+                           environ['REQUEST_METHOD'], path, environ.get('SERVER_PROTOCOL', 'HTTP/1.0'), headers)
+    try:
+      run_handler(handler)
+    except Exception:
+      if writer.started:
+        raise
+      print(f"Error handling {handler.command} {handler.path}:", file=sys.stderr)
+      sys.excepthook(*sys.exc_info())
+      start_response('500 Internal Server Error', [('Content-Type', 'text/plain')], sys.exc_info())
+      return [b'Internal Server Error\n']
+    if not writer.started:
+      start_response('500 Internal Server Error', [('Content-Type', 'text/plain')])
+      return [b'Incomplete response\n']
+    return []
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Replay history entries to catch behaviour changes after an ansible-core upgrade.
+
+This script:
+1. Reads the playground history (or the file given with --history-file)
+2. Re-renders every entry, or the subset selected with --match, --since and
+   --limit, in parallel worker processes with the same Jinja2 environment and
+   Ansible filters as the server
+3. Compares each output with a baseline: the outputs saved earlier with
+   --save-baseline, or the output recorded in history when the entry was
+   rendered ([history] record_outputs, off by default)
+4. Reports changed outputs as unified diffs, new and fixed errors and the
+   slowest entries; templates with random or time dependent output are
+   reported as not comparable instead of changed
+
+The history file and blob store are only read. Save a baseline with the
+current ansible-core before upgrading and compare against it afterwards:
+
+Usage:
+  python ansible-jinja2-playground/replay_history.py --save-baseline before.json
+  pip install -U ansible-core
+  python ansible-jinja2-playground/replay_history.py --baseline before.json --jobs 8
+"""
+
+import argparse
+import concurrent.futures
+import difflib
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+import ansible_jinja2_playground as playground  # noqa: E402
+
+try:
+  from ansible import __version__ as ANSIBLE_VERSION
+except ImportError:
+  ANSIBLE_VERSION = 'unknown'
+
+BASELINE_FORMAT = 1
+
+
+def init_worker(history_path: str, blob_dir: str):
+  """Point a worker process at the history being replayed."""
+  playground.JSON_HISTORY_PATH = history_path
+  playground.BLOB_STORE.directory = blob_dir
+
+
+def entry_input(entry: Dict[str, Any]) -> str:
+  """Input text of a history entry, read from the blob store when stored there."""
+  if entry.get('input_blob'):
+    return playground.BLOB_STORE.get_text(entry['input_blob'])
+  return entry.get('input', '')
+
+
+def recorded_output(entry: Dict[str, Any]) -> Optional[str]:
+  """Output recorded in history for an entry, None for entries recorded without one."""
+  if entry.get('output_blob'):
+    try:
+      return playground.BLOB_STORE.get_text(entry['output_blob'])
+    except Exception:
+      return None
+  return entry.get('output')
+
+
+def replay_entry(item: Tuple[int, Dict[str, Any]]) -> Dict[str, Any]:
+  """Render one history entry. Runs in a worker process."""
+  index, entry = item
+  timer = playground.RequestTimer()
+  result = {'index': index, 'signature': playground.entry_signature(entry), 'expr': entry.get('expr', ''),
+            'deterministic': True}
+  enable_loop = entry.get('enable_loop', False)
+  if isinstance(enable_loop, str):
+    enable_loop = enable_loop.lower() == 'true'
+  loop_variable = entry.get('loop_variable', '')
+  try:
+    result['deterministic'] = playground.render_variables(entry['expr'], enable_loop, loop_variable)[0]
+  except Exception:
+    # Syntax errors are reported by the render below
+    pass
+  try:
+    data, input_format = playground.parse_input(entry_input(entry), timer)
+    output, _ = playground.render_template(entry['expr'], data, input_format, enable_loop, loop_variable, timer)
+    result.update(status='ok', output=output)
+  except Exception as e:
+    result.update(status='error', error=f'{type(e).__name__}: {e}')
+  result['ms'] = timer.total() * 1000
+  result['recorded'] = recorded_output(entry)
+  return result
+
+
+def select_entries(history: List[Dict[str, Any]], match: str = '', since: str = '',
+                   limit: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+  """Entries with an expression, optionally filtered by an expression regex and minimum datetime."""
+  pattern = re.compile(match) if match else None
+  selected = []
+  for index, entry in enumerate(history):
+    if not isinstance(entry, dict) or not entry.get('expr'):
+      # Listener pushes only carry variables
+      continue
+    if pattern and not pattern.search(entry['expr']):
+      continue
+    if since and entry.get('datetime', '') < since:
+      continue
+    selected.append((index, entry))
+  return selected[-limit:] if limit else selected
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Any]]:
+  """Load the outputs saved with --save-baseline, keyed by entry signature."""
+  with open(path, 'r', encoding='utf-8') as f:
+    baseline = json.load(f)
+  if baseline.get('format') != BASELINE_FORMAT:
+    raise ValueError(f'Unsupported baseline format: {baseline.get("format")}')
+  print(f"📋 Baseline from ansible-core {baseline.get('ansible_core', 'unknown')}, "
+        f"{len(baseline['outputs'])} entries")
+  return baseline['outputs']
+
+
+def save_baseline(path: str, results: List[Dict[str, Any]]):
+  """Save the outputs (and errors) of this replay as a baseline file."""
+  outputs = {}
+  for r in results:
+    key = 'output' if r['status'] == 'ok' else 'error'
+    outputs[r['signature']] = {'status': r['status'], key: r.get(key)}
+  with open(path, 'w', encoding='utf-8') as f:
+    json.dump({'format': BASELINE_FORMAT, 'ansible_core': ANSIBLE_VERSION, 'outputs': outputs}, f, indent=2)
+
+
+def compare(result: Dict[str, Any], baseline: Optional[Dict[str, Dict[str, Any]]]) -> str:
+  """
+  Classify a replayed entry against its baseline: 'same', 'changed',
+  'broken' (now fails), 'fixed' (failed before), 'error' (fails in both),
+  'volatile' (random or time dependent output) or 'no_baseline'.
+  """
+  if not result['deterministic']:
+    return 'volatile'
+  if baseline is not None:
+    expected = baseline.get(result['signature'])
+  elif result['recorded'] is not None:
+    expected = {'status': 'ok', 'output': result['recorded']}
+  else:
+    expected = None
+  if expected is None:
+    return 'no_baseline'
+  result['expected'] = expected.get('output', expected.get('error'))
+  if expected['status'] != 'ok':
+    return 'error' if result['status'] != 'ok' else 'fixed'
+  if result['status'] != 'ok':
+    return 'broken'
+  return 'same' if result['output'] == expected['output'] else 'changed'
+
+
+def print_diff(result: Dict[str, Any], max_lines: int):
+  """Print the unified diff between the expected and the new output of an entry."""
+  new = result.get('output', result.get('error', ''))
+  diff = list(difflib.unified_diff(result['expected'].splitlines(), new.splitlines(),
+                                   'baseline', ANSIBLE_VERSION, lineterm=''))
+  print(f"\n🔀 Entry {result['index']} ({result['outcome']}): {result['expr'][:100]!r}")
+  for line in diff[:max_lines]:
+    print(f"   {line}")
+  if len(diff) > max_lines:
+    print(f"   ... {len(diff) - max_lines} more lines")
+
+
+def positive_int(value: str) -> int:
+  """argparse type for options that take a count of at least 1."""
+  number = int(value)
+  if number < 1:
+    raise argparse.ArgumentTypeError(f'must be at least 1, got {number}')
+  return number
+
+
+def main():
+  """Main function of the script."""
+  parser = argparse.ArgumentParser(description='Re-render history entries and compare with their baseline outputs')
+  parser.add_argument('--history-file', default=playground.JSON_HISTORY_PATH,
+                      help=f'History file to replay (default: {playground.JSON_HISTORY_PATH})')
+  parser.add_argument('--blob-dir', default='',
+                      help='Blob store of the history file (default: the server blob store, or '
+                           '<history file>_blobs next to another history file)')
+  parser.add_argument('--jobs', type=positive_int, default=os.cpu_count() or 1,
+                      help='Worker processes (default: number of CPUs)')
+  parser.add_argument('--match', default='',
+                      help='Only replay entries whose expression matches this regular expression')
+  parser.add_argument('--since', default='',
+                      help='Only replay entries recorded at or after this ISO datetime')
+  parser.add_argument('--limit', type=positive_int, default=0,
+                      help='Only replay the latest N selected entries')
+  parser.add_argument('--baseline', default='',
+                      help='Compare with a baseline file instead of the outputs recorded in history')
+  parser.add_argument('--save-baseline', default='',
+                      help='Save the outputs of this replay as a baseline file')
+  parser.add_argument('--diff-lines', type=int, default=20,
+                      help='Lines of diff shown per changed entry (default: 20)')
+  parser.add_argument('--max-diffs', type=int, default=20,
+                      help='Changed entries shown with a diff (default: 20)')
+  parser.add_argument('--slowest', type=int, default=10,
+                      help='Slowest entries listed (default: 10)')
+  parser.add_argument('--output', default='',
+                      help='Save the full per-entry report as JSON to this file')
+  parser.add_argument('--fail-on-diff', action='store_true',
+                      help='Exit with status 1 when any output changed or broke')
+  args = parser.parse_args()
+
+  history_path = os.path.abspath(args.history_file)
+  blob_dir = args.blob_dir
+  if not blob_dir:
+    if history_path == os.path.abspath(playground.JSON_HISTORY_PATH):
+      blob_dir = playground.BLOB_STORE.directory
+    else:
+      base = os.path.splitext(history_path)[0]
+      if base.endswith('_history'):
+        base = base[:-len('_history')]
+      blob_dir = base + '_blobs'
+  init_worker(history_path, blob_dir)
+
+  print(f"📂 History file: {history_path}")
+  print(f"🐍 ansible-core {ANSIBLE_VERSION}")
+  try:
+    # Legacy files are upgraded in memory only, without writing blobs
+    history, _ = playground.read_history_file(store_blobs=False)
+    baseline = load_baseline(args.baseline) if args.baseline else None
+  except (OSError, ValueError, KeyError) as e:
+    print(f"❌ Error: {e}")
+    return 1
+  selected = select_entries(history, args.match, args.since, args.limit)
+  if not selected:
+    print("⚠️  No history entries to replay")
+    return 0
+
+  print(f"🔁 Replaying {len(selected)} of {len(history)} entries with {args.jobs} workers...")
+  start = time.perf_counter()
+  with concurrent.futures.ProcessPoolExecutor(args.jobs, initializer=init_worker,
+                                              initargs=(history_path, blob_dir)) as pool:
+    results = list(pool.map(replay_entry, selected, chunksize=max(1, len(selected) // (args.jobs * 8))))
+  elapsed = time.perf_counter() - start
+
+  outcomes: Dict[str, int] = {}
+  for r in results:
+    r['outcome'] = compare(r, baseline)
+    outcomes[r['outcome']] = outcomes.get(r['outcome'], 0) + 1
+
+  print(f"\n⏱️  {len(results)} entries in {elapsed:.2f}s ({len(results) / elapsed:.0f} entries/s)")
+  labels = [('same', '✅ Same'), ('changed', '🔀 Changed'), ('broken', '💥 Now failing'),
+            ('fixed', '🩹 Now working'), ('error', '❌ Failing before and now'),
+            ('volatile', '🎲 Not comparable (random or time dependent)'), ('no_baseline', '❔ No baseline')]
+  for key, label in labels:
+    if outcomes.get(key):
+      print(f"   {label}: {outcomes[key]}")
+
+  differing = [r for r in results if r['outcome'] in ('changed', 'broken', 'fixed')]
+  for r in differing[:args.max_diffs]:
+    print_diff(r, args.diff_lines)
+  if len(differing) > args.max_diffs:
+    print(f"\n... {len(differing) - args.max_diffs} more entries differ (see --output)")
+
+  if args.slowest:
+    print("\n🐢 Slowest entries:")
+    for r in sorted(results, key=lambda r: -r['ms'])[:args.slowest]:
+      print(f"   {r['ms']:>9.1f} ms  entry {r['index']:<6} {r['expr'][:70]!r}")
+
+  if args.save_baseline:
+    save_baseline(args.save_baseline, results)
+    print(f"\n💾 Baseline saved to: {args.save_baseline}")
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      json.dump({'ansible_core': ANSIBLE_VERSION, 'elapsed_seconds': elapsed, 'outcomes': outcomes,
+                 'entries': results}, f, indent=2)
+    print(f"💾 Report saved to: {args.output}")
+
+  if args.fail_on_diff and outcomes.get('changed', 0) + outcomes.get('broken', 0):
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
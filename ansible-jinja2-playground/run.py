@@ -16,7 +16,6 @@ Note: Activate the virtual environment before running.
 
 import os
 import sys
-from http.server import HTTPServer
 
 # Set up paths - we're already in the ansible-jinja2-playground directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -24,9 +23,12 @@ sys.path.insert(0, current_dir)
 
 try:
   # Import and run the main application
-  from ansible_jinja2_playground import JinjaHandler, CONF_PATH, HOST, PORT
+  from ansible_jinja2_playground import CONF_PATH, HOST, PORT, collect_orphan_blobs, serve
 
   if __name__ == '__main__':
+    removed = collect_orphan_blobs()
+    if removed:
+      print(f"Removed {removed} unreferenced history blobs")
     print(f"Server started at http://{HOST}:{PORT}")
     print(f"Application directory: {current_dir}")
     print(f"Configuration: {CONF_PATH}")
@@ -35,7 +37,7 @@ try:
     print(f"   Edit the 'port' value in the [server] section of: {CONF_PATH}")
     print("   Example: port = 8080")
     print("")
-    HTTPServer((HOST, PORT), JinjaHandler).serve_forever()
+    serve()
 
 except Exception as e:
   print(f"Error starting server: {e}")
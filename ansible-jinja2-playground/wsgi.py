@@ -0,0 +1,22 @@
+"""
+Ansible Jinja2 Playground - WSGI Entry Point
+Exposes the application to WSGI servers such as gunicorn or uWSGI.
+
+Usage:
+  gunicorn --chdir ansible-jinja2-playground --preload --workers 4 --bind 127.0.0.1:8000 wsgi:application
+
+With --preload the Ansible plugins are imported once in the master
+process and shared by the forked workers. History and configuration
+writes are serialized between workers by their lock files, and each
+worker reloads the configuration file when it changed; timings and
+metrics are kept per worker. The host and port of the [server] section
+are not used, the WSGI server binds the address.
+"""
+
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+from ansible_jinja2_playground import application  # noqa: E402,F401
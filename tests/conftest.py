@@ -0,0 +1,75 @@
+"""
+Shared pytest setup: the playground modules live in ansible-jinja2-playground/,
+which is not a package, so it is put on sys.path like run.py does.
+"""
+
+import http.client
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ansible-jinja2-playground')
+sys.path.insert(0, APP_DIR)
+
+import ansible_jinja2_playground as playground  # noqa: E402
+from playground_blobs import BlobStore  # noqa: E402
+from playground_storage import FileLock  # noqa: E402
+
+
+class PlaygroundServer:
+  """A playground server running in a background thread."""
+
+  def __init__(self, address):
+    self.address = address
+
+  def request(self, method, path, body=None, headers=None):
+    """Send one request. Returns (status, headers, body bytes)."""
+    connection = http.client.HTTPConnection(*self.address, timeout=10)
+    try:
+      connection.request(method, path, body, headers or {})
+      response = connection.getresponse()
+      return response.status, dict(response.getheaders()), response.read()
+    finally:
+      connection.close()
+
+
+@pytest.fixture
+def settings():
+  """Set playground configuration options for one test. Returns set(section, option, value)."""
+  saved = []
+
+  def set_option(section, option, value):
+    saved.append((section, option, playground.config.get(section, option, fallback=None)))
+    playground.config.set(section, option, value)
+
+  yield set_option
+  for section, option, value in reversed(saved):
+    if value is None:
+      playground.config.remove_option(section, option)
+    else:
+      playground.config.set(section, option, value)
+
+
+@pytest.fixture
+def isolated(tmp_path, monkeypatch):
+  """Keep the history and blobs of the playground under tmp_path."""
+  path = str(tmp_path / 'history.json')
+  monkeypatch.setattr(playground, 'JSON_HISTORY_PATH', path)
+  monkeypatch.setattr(playground, 'HISTORY_LOCK', FileLock(path + '.lock'))
+  monkeypatch.setattr(playground, 'HISTORY_INDEX', playground.HistoryIndex())
+  monkeypatch.setattr(playground, 'BLOB_STORE', BlobStore(str(tmp_path / 'blobs')))
+  return tmp_path
+
+
+@pytest.fixture
+def server(isolated):
+  """A playground server on a free port of 127.0.0.1, with an isolated history."""
+  httpd = ThreadingHTTPServer(('127.0.0.1', 0), playground.JinjaHandler)
+  thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+  thread.start()
+  yield PlaygroundServer(httpd.server_address)
+  httpd.shutdown()
+  httpd.server_close()
@@ -0,0 +1,131 @@
+"""playground_async.py: the asyncio server core and server-sent events."""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+import ansible_jinja2_playground as playground
+from conftest import PlaygroundServer
+from playground_async import AsyncHTTPServer, Broadcaster, event_stream
+
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+
+class Source:
+  """A value polled by a Broadcaster."""
+
+  def __init__(self):
+    self.value = 0
+
+  def __call__(self):
+    return self.value
+
+
+@pytest.fixture
+def source():
+  return Source()
+
+
+async def cancel_tasks():
+  """Cancel the server and its open connections."""
+  tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+  for task in tasks:
+    task.cancel()
+  await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.fixture
+def async_server(isolated, source):
+  """An AsyncHTTPServer running JinjaHandler, with /events streaming source changes."""
+  broadcaster = Broadcaster(source, 0.02)
+  httpd = AsyncHTTPServer(playground.JinjaHandler, '127.0.0.1', free_port(), 2,
+                          streams={'/events': lambda: event_stream(broadcaster, 'change', heartbeat=0.1)})
+  loop = asyncio.new_event_loop()
+  thread = threading.Thread(target=loop.run_forever, daemon=True)
+  thread.start()
+  asyncio.run_coroutine_threadsafe(httpd.serve(), loop)
+  deadline = time.monotonic() + 5
+  while True:
+    try:
+      socket.create_connection(httpd.server_address, timeout=1).close()
+      break
+    except ConnectionRefusedError:
+      assert time.monotonic() < deadline, 'server did not start'
+      time.sleep(0.01)
+  yield PlaygroundServer(httpd.server_address)
+  asyncio.run_coroutine_threadsafe(cancel_tasks(), loop).result(5)
+  loop.call_soon_threadsafe(loop.stop)
+  thread.join(5)
+  loop.close()
+  httpd.executor.shutdown()
+
+
+def raw_request(address, data, until=None, timeout=5):
+  """Send raw bytes and read the response until the connection closes or until appears."""
+  received = b''
+  with socket.create_connection(address, timeout=timeout) as sock:
+    sock.sendall(data)
+    while until is None or until not in received:
+      chunk = sock.recv(65536)
+      if not chunk:
+        break
+      received += chunk
+  return received
+
+
+def test_requests_run_the_handler(async_server):
+  form = {'Content-Type': 'application/x-www-form-urlencoded'}
+  status, headers, body = async_server.request('POST', '/render', urlencode({'json': '{"a": 2}', 'expr': '{{ a * 21 }}'}),
+                                               form)
+  assert (status, body) == (200, b'42')
+  assert 'Server-Timing' in headers
+  status, _, body = async_server.request('GET', '/history')
+  assert status == 200
+  assert [e['expr'] for e in json.loads(body)] == ['{{ a * 21 }}']
+
+
+def test_malformed_and_oversized_heads(async_server):
+  assert raw_request(async_server.address, b'NONSENSE\r\n\r\n').startswith(b'HTTP/1.0 400 Bad Request')
+  head = b'GET / HTTP/1.1\r\nX-Filler: ' + b'x' * (70 * 1024) + b'\r\n\r\n'
+  assert raw_request(async_server.address, head).startswith(b'HTTP/1.0 431 ')
+
+
+def test_events_are_streamed_on_change(async_server, source):
+  with socket.create_connection(async_server.address, timeout=5) as sock:
+    sock.sendall(b'GET /events HTTP/1.1\r\nHost: test\r\n\r\n')
+    received = b''
+    while b'data: 0\n\n' not in received:
+      received += sock.recv(4096)
+    assert received.startswith(b'HTTP/1.0 200 OK\r\nContent-Type: text/event-stream\r\n')
+    assert b'retry: 5000\n\n' in received
+    source.value = 1
+    while b'event: change\ndata: 1\n\n' not in received:
+      received += sock.recv(4096)
+
+
+def test_broadcaster_wait_and_heartbeat(source):
+  async def scenario():
+    broadcaster = Broadcaster(source, 0.01)
+    assert not await broadcaster.wait(broadcaster.version, 0.05)
+    stream = event_stream(broadcaster, 'change', heartbeat=0.05)
+    chunks = [await stream.__anext__() for _ in range(3)]
+    source.value = 5
+    chunks.append(await stream.__anext__())
+    while chunks[-1] == b': ping\n\n':
+      chunks.append(await stream.__anext__())
+    await stream.aclose()
+    broadcaster._task.cancel()
+    return chunks
+
+  chunks = asyncio.run(scenario())
+  assert chunks[:3] == [b'retry: 5000\n\n', b'event: change\ndata: 0\n\n', b': ping\n\n']
+  assert chunks[-1] == b'event: change\ndata: 5\n\n'
@@ -0,0 +1,41 @@
+"""benchmark_ansible_filters.py: workloads and run comparison."""
+
+from benchmark_ansible_filters import AnsibleFilterBenchmark, build_inputs, compare_results, percentile
+from ansible_jinja2_playground import env
+
+
+def bench():
+  # Skips the filter scan done by __init__
+  benchmark = AnsibleFilterBenchmark.__new__(AnsibleFilterBenchmark)
+  benchmark.iterations, benchmark.max_time = 3, 0.1
+  benchmark.inputs = build_inputs([10])
+  benchmark.context = env.from_string('').new_context()
+  return benchmark
+
+
+def run(p50):
+  return {'filters': {'unique': {'workloads': {'list_10': {'status': 'ok', 'p50_us': p50}}}}}
+
+
+def test_percentile_is_nearest_rank():
+  assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 3.0
+  assert percentile([], 50) == 0.0
+
+
+def test_test_case_is_timed_as_compile_and_render():
+  result = bench().benchmark_one('unique', 'filter', "{{ ['b', 'a', 'b'] | unique | list }}")
+  assert result['registered']
+  assert set(result['workloads']) == {'case_compile', 'str_small', 'str_10', 'list_10', 'dict_10'}
+  assert result['workloads']['case_compile']['status'] == 'ok'
+  assert result['workloads']['case_compile']['samples'] == 3
+
+
+def test_unregistered_filter():
+  assert bench().benchmark_one('no_such_filter', 'filter', None) == {'registered': False, 'workloads': {}}
+
+
+def test_compare_results():
+  assert [r['name'] for r in compare_results(run(10.0), run(20.0), 25.0)['regressions']] == ['unique']
+  assert [r['name'] for r in compare_results(run(20.0), run(10.0), 25.0)['improvements']] == ['unique']
+  assert compare_results(run(10.0), {}, 25.0)['missing'] == [{'name': 'unique', 'type': 'filter',
+                                                            'workload': 'list_10'}]
@@ -0,0 +1,123 @@
+"""playground_blobs.py: content-addressed storage and garbage collection."""
+
+import hashlib
+import os
+import time
+
+import pytest
+
+from playground_blobs import TEMP_PREFIX, BlobStore, zstandard
+
+TEXT = '{"a": "é"}\n'
+DIGEST = hashlib.sha256(TEXT.encode('utf-8')).hexdigest()
+
+
+def age(store, digest, seconds=3600):
+  """Move the mtime of a blob back by seconds."""
+  path, _ = store.find(digest)
+  past = time.time() - seconds
+  os.utime(path, (past, past))
+
+
+class DictCache(dict):
+  def put(self, key, value, size):
+    self[key] = value
+
+
+@pytest.mark.parametrize('codec', ['none', 'zlib', pytest.param('zstd', marks=pytest.mark.skipif(
+    zstandard is None, reason='zstandard is not installed'))])
+def test_round_trip(tmp_path, codec):
+  store = BlobStore(str(tmp_path), codec)
+  assert store.put_text(TEXT) == DIGEST
+  assert store.put_text(TEXT) == DIGEST
+  path, found = store.find(DIGEST)
+  assert found == codec and os.path.basename(path).startswith(DIGEST)
+  assert os.listdir(tmp_path) == [os.path.basename(path)]
+  assert store.get_text(DIGEST) == TEXT
+
+
+def test_blobs_written_with_another_codec_are_found(tmp_path):
+  BlobStore(str(tmp_path), 'none').put_text(TEXT)
+  assert BlobStore(str(tmp_path), 'zlib').get_text(DIGEST) == TEXT
+
+
+def test_unknown_compression_falls_back_to_zlib(tmp_path):
+  assert BlobStore(str(tmp_path), 'lzma').compression == 'zlib'
+
+
+def test_missing_and_invalid_digests(tmp_path):
+  store = BlobStore(str(tmp_path))
+  with pytest.raises(FileNotFoundError):
+    store.get_text('0' * 64)
+  with pytest.raises(ValueError):
+    store.find('../history')
+
+
+def test_reads_go_through_the_cache(tmp_path):
+  cache = DictCache()
+  store = BlobStore(str(tmp_path), cache=cache)
+  store.put_text(TEXT)
+  assert store.get_text(DIGEST) == TEXT
+  assert cache == {DIGEST: TEXT}
+  cache[DIGEST] = 'cached'
+  assert store.get_text(DIGEST) == 'cached'
+
+
+def test_released_blob_is_kept_for_the_grace_period(tmp_path):
+  store = BlobStore(str(tmp_path), grace_seconds=60)
+  store.put_text(TEXT)
+  assert store.track({DIGEST: 1}) == 0
+  assert store.track({}) == 0
+  assert store.exists(DIGEST)
+  # Retried on the next call once the grace period is over
+  age(store, DIGEST)
+  assert store.track({}) == 1
+  assert not store.exists(DIGEST)
+
+
+def test_referenced_again_within_the_grace_period(tmp_path):
+  store = BlobStore(str(tmp_path), grace_seconds=60)
+  store.put_text(TEXT)
+  store.track({DIGEST: 1})
+  store.track({})
+  store.track({DIGEST: 1})
+  age(store, DIGEST)
+  assert store.track({DIGEST: 1}) == 0
+  assert store.exists(DIGEST)
+
+
+def test_storing_again_restarts_the_grace_period(tmp_path):
+  store = BlobStore(str(tmp_path), grace_seconds=60)
+  store.put_text(TEXT)
+  store.track({DIGEST: 1})
+  age(store, DIGEST)
+  store.put_text(TEXT)
+  assert store.track({}) == 0
+  assert store.exists(DIGEST)
+
+
+def test_sweep_spares_recent_files(tmp_path):
+  store = BlobStore(str(tmp_path), grace_seconds=60)
+  kept = store.put_text('kept')
+  old = store.put_text('old')
+  young = store.put_text('young')
+  fd, stale_tmp = store.temp_file()
+  os.close(fd)
+  fd, fresh_tmp = store.temp_file()
+  os.close(fd)
+  for digest in (kept, old):
+    age(store, digest)
+  past = time.time() - 3600
+  os.utime(stale_tmp, (past, past))
+
+  assert store.sweep({kept: 1}) == 2
+  assert [store.exists(d) for d in (kept, old, young)] == [True, False, True]
+  assert sorted(name for name in os.listdir(tmp_path) if name.startswith(TEMP_PREFIX)) == \
+      [os.path.basename(fresh_tmp)]
+
+
+def test_disk_usage(tmp_path):
+  store = BlobStore(str(tmp_path / 'blobs'))
+  assert store.disk_usage() == 0
+  store.put_text(TEXT)
+  assert store.disk_usage() == os.path.getsize(store.find(DIGEST)[0])
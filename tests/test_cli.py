@@ -0,0 +1,64 @@
+"""cli.py: rendering files, stdin and NDJSON records without the server."""
+
+import io
+import json
+import sys
+
+import pytest
+
+import cli
+
+
+@pytest.fixture
+def run(monkeypatch, capsys):
+  """Run cli.main() with arguments and stdin. Returns (status, stdout, stderr)."""
+  def run_cli(*args, stdin=''):
+    monkeypatch.setattr(sys, 'argv', ['cli.py'] + [str(arg) for arg in args])
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(stdin))
+    status = cli.main()
+    out, err = capsys.readouterr()
+    return status, out, err
+  return run_cli
+
+
+def test_render_files(run, tmp_path):
+  (tmp_path / 'a.json').write_text('{"name": "web01"}')
+  (tmp_path / 'b.yml').write_text('name: db01\n')
+  assert run('{{ name | upper }}', tmp_path / 'a.json', tmp_path / 'b.yml') == (0, 'WEB01\nDB01\n', '')
+
+
+def test_template_file_and_loop(run, tmp_path):
+  (tmp_path / 'users.j2').write_text('{{ item.name }}={{ item.uid }}')
+  status, out, _ = run('-t', tmp_path / 'users.j2', '--loop', 'users',
+                       stdin='users:\n  - {name: a, uid: 1}\n  - {name: b, uid: 2}\n')
+  assert status == 0
+  assert json.loads(out) == ['a=1', 'b=2']
+
+
+def test_ndjson_records(run):
+  records = '{"n": 1}\n\n{"n": 2}\n[1]\n{"n": 3}\n'
+  status, out, err = run('--ndjson', '{{ {"double": n * 2} | to_json }}', stdin=records)
+  assert status == 1
+  assert [json.loads(line) for line in out.splitlines()] == [{'double': 2}, {'double': 4}, {'double': 6}]
+  assert err == '❌ stdin:4: ValueError: Record must be a JSON object, got list\n'
+
+
+def test_fail_fast(run):
+  status, out, err = run('--ndjson', '--fail-fast', '--batch-size', '1', '{{ n }}', stdin='{"n": 1}\n{}\n{"n": 3}\n')
+  assert (status, out) == (1, '1\n')
+  assert err.startswith('❌ stdin:2: ')
+
+
+def test_jobs_keep_record_order(run, tmp_path):
+  records = ''.join(json.dumps({'n': n}) + '\n' for n in range(50))
+  output = tmp_path / 'out.ndjson'
+  assert run('--ndjson', '--jobs', 2, '--batch-size', 3, '-o', output, '{{ n }}', stdin=records)[0] == 0
+  assert output.read_text().splitlines() == [str(n) for n in range(50)]
+
+
+def test_template_errors(run):
+  assert run('{{ n', stdin='{}') == (1, '', "❌ Template error: unexpected end of template, expected 'end of print "
+                                         "statement'.\n")
+  with pytest.raises(SystemExit) as exc:
+    run()
+  assert exc.value.code == 2
@@ -0,0 +1,180 @@
+"""deduplicate_history.py: signatures and the streaming history reader."""
+
+import base64
+import fcntl
+import hashlib
+import json
+import sys
+
+import pytest
+
+import ansible_jinja2_playground as playground
+import deduplicate_history
+from deduplicate_history import (HistoryStreamReader, confirm, create_entry_signature, scan_history_stream,
+                                 stream_kept_entries, write_history_file)
+from playground_storage import FileLock
+
+TEXT = '{"a": 1}\n'
+
+
+def inline(expr='{{ a }}', text=TEXT, **fields):
+  return dict({'input': text, 'expr': expr, 'enable_loop': False, 'loop_variable': ''}, **fields)
+
+
+def as_blob(entry):
+  entry = dict(entry)
+  entry['input_blob'] = hashlib.sha256(entry.pop('input').encode('utf-8')).hexdigest()
+  return entry
+
+
+def test_inline_and_blob_inputs_are_duplicates():
+  assert create_entry_signature(inline(), encoded=False) == create_entry_signature(as_blob(inline()), encoded=False)
+
+
+def test_legacy_entries_are_decoded():
+  legacy = {key: base64.b64encode(inline()[key].encode()).decode() for key in ('input', 'expr')}
+  assert create_entry_signature(legacy) == create_entry_signature({'input': TEXT, 'expr': '{{ a }}'}, encoded=False)
+
+
+def test_signatures_agree_with_the_server():
+  entries = [
+      inline(), as_blob(inline()), inline(text=TEXT.strip()), inline(expr=' {{ a }}'),
+      inline(enable_loop=True, loop_variable='users'), inline(enable_loop=True, loop_variable='users '),
+      as_blob(inline(enable_loop=True, loop_variable='users')),
+  ]
+  for first in entries:
+    for second in entries:
+      script = create_entry_signature(first, encoded=False) == create_entry_signature(second, encoded=False)
+      assert script == (playground.entry_signature(first) == playground.entry_signature(second))
+
+
+ENTRIES = [
+    {'id': 'a', 'input': '{"é": "☃ 𝄞"}', 'expr': '{{ x }}', 'datetime': '2024-01-01T00:00:00Z'},
+    {'id': 'b', 'input_blob': 'f' * 64, 'expr': '{{ "[]{}\\"" }}', 'size': 1234567890},
+    {'id': 'c', 'input': '', 'expr': '', 'enable_loop': True, 'loop_variable': 'users', 'n': -1.5e-7},
+]
+
+
+def layouts():
+  """The same entries in each layout the reader accepts, pretty printed or compact."""
+  return {
+      'list': json.dumps(ENTRIES, indent=2, ensure_ascii=False),
+      'compact': json.dumps(ENTRIES, ensure_ascii=False, separators=(',', ':')),
+      'wrapper': json.dumps({'format': 2, 'revision': 'r', 'entries': ENTRIES}),
+      'wrapper_entries_first': json.dumps({'entries': ENTRIES, 'other': [{'x': 1}], 'format': 2}),
+      'jsonl': '\n'.join(json.dumps(e, ensure_ascii=False) for e in ENTRIES) + '\n\n',
+  }
+
+
+def read(tmp_path, text, chunk_size):
+  path = tmp_path / 'history.json'
+  path.write_bytes(text.encode('utf-8'))
+  reader = HistoryStreamReader(str(path), chunk_size)
+  return reader, list(reader)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 16, 1 << 20])
+@pytest.mark.parametrize('name', sorted(layouts()))
+def test_reader_layouts(tmp_path, name, chunk_size):
+  reader, entries = read(tmp_path, layouts()[name], chunk_size)
+  assert entries == ENTRIES
+  assert reader.layout == {'compact': 'list', 'wrapper_entries_first': 'wrapper'}.get(name, name)
+  assert reader.history_format == (2 if reader.layout == 'wrapper' else None)
+  assert reader.entries_read == 3
+
+
+@pytest.mark.parametrize('text', ['[]', ' [ ] ', '{"format": 2, "entries": []}'])
+def test_reader_empty_history(tmp_path, text):
+  assert read(tmp_path, text, 4)[1] == []
+
+
+@pytest.mark.parametrize('text', [
+    '[{"a": 1}] x',
+    '[{"a": 1}, ]',
+    '[{"a": 1} {"b": 2}]',
+    '[{"a": 1}',
+    '{"format": 2, "entries": [{"a": 1}]',
+    '{"format": 2 "entries": []}',
+    '{"a": 1}\n{"b": ',
+    '"text"',
+    '42',
+    '',
+])
+def test_reader_rejects_malformed(tmp_path, text):
+  with pytest.raises(ValueError):
+    read(tmp_path, text, 3)
+
+
+@pytest.mark.parametrize('layout', ['list', 'wrapper', 'jsonl'])
+def test_write_then_read_round_trip(tmp_path, layout):
+  path = str(tmp_path / 'history.json')
+  assert write_history_file(path, iter(ENTRIES), layout, 2) == 3
+  reader = HistoryStreamReader(path, 7)
+  assert list(reader) == ENTRIES and reader.layout == layout
+
+
+def test_streaming_passes_keep_newest_duplicate(tmp_path):
+  entries = [
+      {'id': '1', 'input': 'x', 'expr': 'e', 'datetime': '2024-01-01T00:00:00Z'},
+      {'id': '2', 'input': 'y', 'expr': 'e', 'datetime': '2024-01-02T00:00:00Z'},
+      {'id': '3', 'input_blob': hashlib.sha256(b'x').hexdigest(), 'expr': 'e', 'datetime': '2024-01-03T00:00:00Z'},
+  ]
+  path = str(tmp_path / 'history.json')
+  write_history_file(path, entries, 'wrapper', 2)
+  reader, keep, duplicates, _ = scan_history_stream(path, 'newest', chunk_size=8)
+  assert duplicates == 1 and reader.layout == 'wrapper'
+  assert [e['id'] for e in stream_kept_entries(path, keep, chunk_size=8)] == ['2', '3']
+
+
+def revision(path):
+  with open(path, 'rb') as f:
+    return playground.HISTORY_REVISION.search(f.read(128)).group(1)
+
+
+def test_rewrite_gets_new_revision(tmp_path):
+  path = str(tmp_path / 'history.json')
+  write_history_file(path, ENTRIES, 'wrapper', 2)
+  first = revision(path)
+  write_history_file(path, ENTRIES, 'wrapper', 2)
+  assert revision(path) != first
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_rewrite_holds_the_server_lock(isolated, monkeypatch, stream):
+  for expr in ('{{ a }}', '{{ b }}', '{{ a }}'):
+    playground.record_render_history('{"a": 1}', expr, False, '')
+  path = playground.JSON_HISTORY_PATH
+  write = deduplicate_history.write_history_file
+  held = []
+
+  def checking_write(*args, **kwargs):
+    with open(path + '.lock', 'a') as other:
+      try:
+        fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        held.append(False)
+      except BlockingIOError:
+        held.append(True)
+    return write(*args, **kwargs)
+
+  monkeypatch.setattr(deduplicate_history, 'write_history_file', checking_write)
+  monkeypatch.setattr(sys, 'argv', ['deduplicate_history.py', path, '--no-backup'] + (['--stream'] if stream else []))
+  assert deduplicate_history.main() == 0
+  assert held == [True]
+  # The server notices the rewrite and sees the remaining entries
+  assert sorted(e['expr'] for e in playground.load_history()) == ['{{ a }}', '{{ b }}']
+
+
+def test_confirm_refuses_when_file_changed(tmp_path, monkeypatch):
+  path = str(tmp_path / 'history.json')
+  write_history_file(path, ENTRIES, 'wrapper', 2)
+  lock = FileLock(path + '.lock')
+
+  def answer(question):
+    write_history_file(path, ENTRIES[:1], 'wrapper', 2)
+    return 'y'
+
+  with lock:
+    monkeypatch.setattr('builtins.input', lambda question: 'y')
+    assert confirm(lock, path, '?')
+    monkeypatch.setattr('builtins.input', answer)
+    assert not confirm(lock, path, '?')
@@ -0,0 +1,63 @@
+"""Result cache keys built from the input variables a template reads."""
+
+from urllib.parse import urlencode
+
+import pytest
+
+import ansible_jinja2_playground as playground
+from ansible_jinja2_playground import render_dependencies, render_variables
+
+
+@pytest.fixture
+def cache(monkeypatch):
+  monkeypatch.setattr(playground, 'RESULT_CACHE', playground.LRUCache('render_result', 64, 1 << 20))
+  monkeypatch.setattr(playground, 'VARIABLE_DIGESTS', playground.LRUCache('variable_digest', 64))
+
+
+@pytest.mark.parametrize('expr, enable_loop, loop_variable, expected', [
+    ('{{ a }} {{ b | default(c) }}', False, '', {'a', 'b', 'c'}),
+    ('{% set x = a %}{{ x }}', False, '', {'a'}),
+    ('{{ item.name }} {{ domain }}', True, 'servers', {'servers', 'domain'}),
+    ('{{ item }}', True, 'data.groups.web', {'groups'}),
+    ('{{ item }}', True, 'hosts | select("match", prefix) | list', {'hosts', 'prefix'}),
+    # Without loop mode the loop variable is not read
+    ('{{ item }}', False, 'servers', {'item'}),
+])
+def test_render_variables(expr, enable_loop, loop_variable, expected):
+  assert render_variables(expr, enable_loop, loop_variable) == (True, frozenset(expected))
+
+
+@pytest.mark.parametrize('expr, expected', [
+    ('{{ a }}', (True, frozenset({'a'}))),
+    ('{{ data.a }}', (True, None)),
+    ('{{ [a, b] | random }}', (False, None)),
+    ('{{ a', (False, None)),
+])
+def test_render_dependencies(expr, expected):
+  assert render_dependencies(expr, False, '') == expected
+
+
+def dependency_key(expr, variables, input_key='k'):
+  """Variable digests are cached by input_key, so each distinct input needs its own."""
+  return playground.render_dependency_key(expr, input_key, variables, 'json', False, '')
+
+
+def test_dependency_key_only_depends_on_read_variables(cache):
+  assert dependency_key('{{ a }}', {'a': [1], 'b': 1}, 'k1') == dependency_key('{{ a }}', {'a': [1], 'b': 2}, 'k2')
+  assert dependency_key('{{ a }}', {'a': [1]}, 'k3') != dependency_key('{{ a }}', {'a': [2]}, 'k4')
+  # An undefined variable is not the same as one set to null
+  assert dependency_key('{{ a }}', {}, 'k5') != dependency_key('{{ a }}', {'a': None}, 'k6')
+  assert dependency_key('{{ data }}', {'a': 1}) is None
+  assert dependency_key('{{ a }}', [1, 2]) is None
+
+
+def test_loop_renders_share_results_across_inputs(server, cache):
+  form = {'Content-Type': 'application/x-www-form-urlencoded'}
+  headers = []
+  for other in (1, 2):
+    body = urlencode({'expr': '{{ item }}', 'input': f'{{"servers": ["a", "b"], "other": {other}}}',
+                      'enable_loop': 'true', 'loop_variable': 'servers'})
+    status, response_headers, output = server.request('POST', '/render', body, form)
+    assert status == 200
+    headers.append(response_headers.get('X-Render-Cache'))
+  assert headers == [None, 'hit']
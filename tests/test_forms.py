@@ -0,0 +1,115 @@
+"""Request body parsing of the form style endpoints."""
+
+import io
+import json
+from urllib.parse import parse_qs, urlencode
+
+import pytest
+
+from playground_forms import FormError, MultipartParser, read_form
+
+BOUNDARY = 'XyZ-boundary'
+FIELDS = [
+    ('expr', '{{ a | to_json }}'),
+    # A value holding most of a delimiter must not end the part
+    ('json', '{"a": "\\r\\n--XyZ-boundar"}\r\n--XyZ'),
+    ('enable_loop', ''),
+    ('host_file', 'a.json'),
+    ('host_file', 'b.json'),
+    ('unicode', 'café ☃'),
+]
+EXPECTED = parse_qs(urlencode(FIELDS), keep_blank_values=True)
+
+
+def multipart(fields=FIELDS, boundary=BOUNDARY, preamble=b'', epilogue=b''):
+  body = bytearray(preamble)
+  for name, value in fields:
+    body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n'
+             'Content-Type: text/plain; charset=utf-8\r\n\r\n').encode() + value.encode() + b'\r\n'
+  return bytes(body + f'--{boundary}--\r\n'.encode() + epilogue)
+
+
+def form(body, content_type, max_bytes=0, length=None):
+  headers = {'Content-Type': content_type, 'Content-Length': str(len(body) if length is None else length)}
+  return read_form(io.BytesIO(body), headers, max_bytes)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 16, 17, 100, 1 << 16])
+def test_multipart_split_anywhere(chunk_size):
+  body = multipart(preamble=b'ignored preamble\r\n', epilogue=b'ignored epilogue')
+  parser = MultipartParser(BOUNDARY.encode())
+  for start in range(0, len(body), chunk_size):
+    parser.feed(body[start:start + chunk_size])
+  parser.close()
+  assert parser.fields == EXPECTED
+
+
+@pytest.mark.parametrize('content_type', [
+    f'multipart/form-data; boundary={BOUNDARY}',
+    f'multipart/form-data; boundary="{BOUNDARY}"',
+    f'Multipart/Form-Data; charset=utf-8; boundary={BOUNDARY}',
+])
+def test_multipart_boundary_parameter(content_type):
+  assert form(multipart(), content_type) == EXPECTED
+
+
+def test_multipart_part_charset_and_unnamed_parts():
+  body = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="expr"\r\n'
+          'Content-Type: text/plain; charset=latin-1\r\n\r\n').encode() + 'é'.encode('latin-1')
+  body += f'\r\n--{BOUNDARY}\r\nContent-Type: text/plain\r\n\r\nno name\r\n--{BOUNDARY}--'.encode()
+  assert form(body, f'multipart/form-data; boundary={BOUNDARY}') == {'expr': ['é']}
+
+
+@pytest.mark.parametrize('body, content_type, status', [
+    (multipart()[:-10], f'multipart/form-data; boundary={BOUNDARY}', 400),
+    (multipart(boundary='other'), f'multipart/form-data; boundary={BOUNDARY}', 400),
+    (multipart(), 'multipart/form-data', 400),
+    (b'[1, 2]', 'application/json', 400),
+    (b'{"expr": ', 'application/json', 400),
+    (b'expr=x', 'text/plain', 415),
+])
+def test_malformed_bodies(body, content_type, status):
+  with pytest.raises(FormError) as error:
+    form(body, content_type)
+  assert error.value.status == status
+
+
+def test_truncated_body():
+  body = multipart()
+  with pytest.raises(FormError) as error:
+    form(body, f'multipart/form-data; boundary={BOUNDARY}', length=len(body) + 10)
+  assert error.value.status == 400
+
+
+@pytest.mark.parametrize('content_type', [f'multipart/form-data; boundary={BOUNDARY}', 'application/json', ''])
+def test_max_body_bytes(content_type):
+  body = multipart()
+  stream = io.BytesIO(body)
+  with pytest.raises(FormError) as error:
+    read_form(stream, {'Content-Type': content_type, 'Content-Length': str(len(body))}, len(body) - 1)
+  assert error.value.status == 413
+  # Refused before anything is read
+  assert stream.tell() == 0
+  assert form(body, f'multipart/form-data; boundary={BOUNDARY}', max_bytes=len(body)) == EXPECTED
+
+
+def test_all_encodings_give_the_same_fields():
+  urlencoded = urlencode(FIELDS).encode()
+  assert form(urlencoded, 'application/x-www-form-urlencoded') == parse_qs(urlencoded.decode())
+  as_json = json.dumps({name: values if len(values) > 1 else values[0] for name, values in EXPECTED.items()})
+  assert form(as_json.encode(), 'application/json') == EXPECTED
+  assert form(multipart(), f'multipart/form-data; boundary={BOUNDARY}') == EXPECTED
+
+
+def test_lenient_reads_other_types_as_urlencoded():
+  body = b'count=2&x=%C3%A9'
+  headers = {'Content-Type': 'text/plain; charset=utf-8', 'Content-Length': str(len(body))}
+  assert read_form(io.BytesIO(body), headers, lenient=True) == {'count': ['2'], 'x': ['é']}
+
+
+def test_only_render_refuses_unknown_content_types(server):
+  headers = {'Content-Type': 'text/plain'}
+  status, _, body = server.request('POST', '/render', b'expr=x&input={}', headers)
+  assert status == 415 and b'text/plain' in body
+  status, _, body = server.request('POST', '/history/clear', b'count=0', headers)
+  assert status == 200 and json.loads(body) == {'cleared': 0, 'size': 0}
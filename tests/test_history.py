@@ -0,0 +1,105 @@
+"""History recording: duplicate policies and the incremental signature index."""
+
+import base64
+import json
+import os
+
+import pytest
+
+import ansible_jinja2_playground as playground
+from playground_blobs import BlobStore
+from playground_storage import FileLock
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+  """Point the history at an empty file under tmp_path and count signature computations."""
+  path = str(tmp_path / 'history.json')
+  monkeypatch.setattr(playground, 'JSON_HISTORY_PATH', path)
+  monkeypatch.setattr(playground, 'HISTORY_LOCK', FileLock(path + '.lock'))
+  monkeypatch.setattr(playground, 'HISTORY_INDEX', playground.HistoryIndex())
+  monkeypatch.setattr(playground, 'BLOB_STORE', BlobStore(str(tmp_path / 'blobs')))
+  calls = {'signature': 0, 'read': 0}
+  entry_signature, read_history_file = playground.entry_signature, playground.read_history_file
+
+  def counting_signature(entry):
+    calls['signature'] += 1
+    return entry_signature(entry)
+
+  def counting_read(*args, **kwargs):
+    calls['read'] += 1
+    return read_history_file(*args, **kwargs)
+
+  monkeypatch.setattr(playground, 'entry_signature', counting_signature)
+  monkeypatch.setattr(playground, 'read_history_file', counting_read)
+  policy = playground.config.get('history', 'duplicates')
+  yield calls
+  playground.config.set('history', 'duplicates', policy)
+
+
+def record(expr, text='{"a": 1}'):
+  playground.record_render_history(text, expr, False, '')
+
+
+def exprs():
+  return [e['expr'] for e in playground.read_history_file()[0]]
+
+
+def test_recording_hashes_and_parses_once_per_entry(history):
+  for i in range(20):
+    record(f'{{{{ a + {i} }}}}')
+  # Each new entry is hashed when recorded and when indexed, the (missing) file is only looked up once
+  assert history['signature'] == 40
+  assert history['read'] == 1
+  assert len(playground.load_history()) == 20
+
+
+@pytest.mark.parametrize('policy, expected', [
+    ('consecutive', ['{{ a }}', '{{ b }}', '{{ a }}']),
+    ('skip', ['{{ a }}', '{{ b }}']),
+    ('move_to_top', ['{{ b }}', '{{ a }}']),
+])
+def test_duplicate_policies(history, policy, expected):
+  playground.config.set('history', 'duplicates', policy)
+  for expr in ('{{ a }}', '{{ a }}', '{{ b }}', '{{ a }}'):
+    record(expr)
+  assert exprs() == expected
+
+
+def test_trimmed_entries_leave_the_index(history, monkeypatch):
+  monkeypatch.setattr(playground, 'MAX_ENTRIES', 2)
+  playground.config.set('history', 'duplicates', 'skip')
+  for expr in ('{{ a }}', '{{ b }}', '{{ c }}', '{{ a }}'):
+    record(expr)
+  assert exprs() == ['{{ c }}', '{{ a }}']
+
+
+def test_rewrite_with_same_inode_size_and_mtime_is_detected(history):
+  playground.config.set('history', 'duplicates', 'skip')
+  record('{{ a }}')
+  path = playground.JSON_HISTORY_PATH
+  before = playground.history_stamp()
+  stat = os.stat(path)
+  with open(path, 'r', encoding='utf-8') as hf:
+    text = hf.read()
+  # Another process changes the entry, the file keeps its inode, size and mtime
+  with open(path, 'r+', encoding='utf-8') as hf:
+    hf.write(text.replace('{{ a }}', '{{ b }}').replace(before[3].decode(), 'f' * len(before[3])))
+  os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+  after = playground.history_stamp()
+  assert after[:3] == before[:3] and after != before
+  record('{{ a }}')
+  assert exprs() == ['{{ b }}', '{{ a }}']
+
+
+def test_legacy_file_read_without_storing_blobs(history, tmp_path):
+  text = json.dumps({'a': 'x' * playground.BLOB_MIN_BYTES})
+  legacy = [{'input': base64.b64encode(text.encode()).decode(), 'expr': base64.b64encode(b'{{ a }}').decode()}]
+  with open(playground.JSON_HISTORY_PATH, 'w', encoding='utf-8') as hf:
+    json.dump(legacy, hf)
+  entries, is_legacy = playground.read_history_file(store_blobs=False)
+  assert is_legacy
+  assert entries == [{'input': text, 'expr': '{{ a }}'}]
+  assert not os.path.exists(tmp_path / 'blobs')
+  entries, _ = playground.read_history_file()
+  assert 'input_blob' in entries[0] and os.path.exists(tmp_path / 'blobs')
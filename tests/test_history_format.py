@@ -0,0 +1,68 @@
+"""History file format 2: compact plain-text JSON and the upgrade of legacy files."""
+
+import base64
+import json
+
+import pytest
+
+import ansible_jinja2_playground as playground
+
+
+def b64(text):
+  return base64.b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def read_raw():
+  with open(playground.JSON_HISTORY_PATH, 'r', encoding='utf-8') as hf:
+    return hf.read()
+
+
+def write_raw(data):
+  with open(playground.JSON_HISTORY_PATH, 'w', encoding='utf-8') as hf:
+    json.dump(data, hf)
+
+
+def test_history_is_written_as_compact_plain_text(isolated):
+  playground.save_history([{'input': '{"name": "é"}', 'expr': '{{ name }}'}])
+  raw = read_raw()
+  assert raw.startswith('{"format":2,')
+  assert '"expr":"{{ name }}"' in raw and 'é' in raw
+  document = json.loads(raw)
+  assert document['entries'] == [{'input': '{"name": "é"}', 'expr': '{{ name }}'}]
+  assert playground.read_history_file() == (document['entries'], False)
+
+
+def test_legacy_file_is_upgraded_on_load(isolated):
+  large = json.dumps({'a': 'x' * playground.BLOB_MIN_BYTES})
+  write_raw([{'input': b64('{"a": 1}'), 'expr': b64('{{ a }}'), 'enable_loop': 'false'},
+             {'input': b64(large), 'expr': b64('{{ a | length }}')}])
+  hist = playground.load_history()
+  document = json.loads(read_raw())
+  assert document['format'] == playground.HISTORY_FORMAT
+  assert document['entries'] == hist
+  assert hist[0] == {'input': '{"a": 1}', 'expr': '{{ a }}', 'enable_loop': 'false'}
+  assert 'input' not in hist[1]
+  assert playground.BLOB_STORE.get_text(hist[1]['input_blob']) == large
+
+
+def test_unsupported_format(isolated):
+  write_raw({'format': 99, 'entries': []})
+  with pytest.raises(ValueError, match='Unsupported history format: 99'):
+    playground.read_history_file()
+  assert playground.load_history() == []
+  with pytest.raises(ValueError):
+    playground.load_history(for_update=True)
+
+
+def test_history_endpoint_resolves_blobs(server):
+  large = json.dumps({'a': 'x' * playground.BLOB_MIN_BYTES})
+  playground.save_history([
+      {'input': '{"a": 1}', 'expr': '{{ a }}', 'enable_loop': 'true', 'loop_variable': 'a', 'output': '1'},
+      {'input_blob': playground.BLOB_STORE.put_text(large), 'expr': '{{ a }}'},
+  ])
+  status, _, body = server.request('GET', '/history')
+  assert status == 200
+  assert json.loads(body) == [
+      {'input': '{"a": 1}', 'expr': '{{ a }}', 'enable_loop': True, 'loop_variable': 'a'},
+      {'input': large, 'expr': '{{ a }}'},
+  ]
@@ -0,0 +1,120 @@
+"""Streaming ingestion of /load_ansible_vars pushes."""
+
+import base64
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+import ansible_jinja2_playground as playground
+from playground_blobs import BlobStore
+from playground_ingest import ingest_ansible_vars
+
+VARIABLES = {
+    'ansible_hostname': 'web-01',
+    'escaped': 'quote " backslash \\ slash / tab \t',
+    'unicode': 'café ☃ 𝄞',
+    'numbers': [0, -1, 12345678901234567890, 1.5e-3, 2E+10],
+    'nested': {'a': {'b': [True, False, None, {}, []]}},
+    'large': 'x' * 5000,
+    'last': 42,
+}
+
+
+def push_body(variables=VARIABLES, text=None, escape_slashes=False):
+  if text is None:
+    text = json.dumps(variables, ensure_ascii=False)
+  encoded = base64.b64encode(text.encode('utf-8')).decode()
+  body = json.dumps({'summary': {'hosts': 1}, 'variables_b64': encoded})
+  return (body.replace('/', '\\/') if escape_slashes else body).encode('utf-8')
+
+
+def old_ingest(body):
+  """What the handler did before streaming: parse everything in memory."""
+  data = json.loads(body.decode('utf-8'))
+  decoded = base64.b64decode(data['variables_b64'])
+  variables = json.loads(decoded.decode('utf-8'))
+  return dict(data, variables_b64=''), hashlib.sha256(decoded).hexdigest(), len(decoded), len(variables)
+
+
+@pytest.fixture
+def store(tmp_path):
+  return BlobStore(str(tmp_path / 'blobs'))
+
+
+def ingest(body, store, chunk_size=64 * 1024, length=None):
+  length = len(body) if length is None else length
+  return ingest_ansible_vars(io.BytesIO(body), length, store, chunk_size=chunk_size)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 13, 64, 1000, 64 * 1024])
+@pytest.mark.parametrize('escape_slashes', [False, True])
+def test_values_split_across_chunks_match_old_path(store, chunk_size, escape_slashes):
+  body = push_body(escape_slashes=escape_slashes)
+  result = ingest(body, store, chunk_size)
+  assert result == old_ingest(body)
+  assert json.loads(store.get_text(result[1])) == VARIABLES
+
+
+@pytest.mark.parametrize('text', ['{}', ' { "a" : 1 } ', '{"n": 10}', '{"s": "\\u00e9\\"x"}'])
+def test_small_documents_match_old_path(store, text):
+  for chunk_size in (1, 4, 100):
+    body = push_body(text=text)
+    assert ingest(body, store, chunk_size) == old_ingest(body)
+
+
+@pytest.mark.parametrize('body', [
+    b'not json',
+    b'{"summary": {}}',
+    b'{"variables_b64": "e30=", ',
+    b'{"variables_b64": "e30="} trailing',
+    b'["variables_b64"]',
+    b'{"variables_b64": "e30"}',
+    push_body(text='[1, 2]'),
+    push_body(text='{"a": 1'),
+    push_body(text='{"a": 1,}'),
+    push_body(text='{"a": tru}'),
+    b'{"variables_b64": "' + base64.b64encode(b'{"a": "\xff"}') + b'"}',
+])
+def test_malformed_input_is_rejected(store, body):
+  with pytest.raises(ValueError):
+    ingest(body, store, 3)
+  # Nothing is left behind in the blob store
+  assert not os.path.isdir(store.directory) or not os.listdir(store.directory)
+
+
+def test_truncated_body_is_rejected(store):
+  body = push_body()
+  with pytest.raises(ValueError, match='truncated'):
+    ingest(body[:-10], store, length=len(body))
+
+
+@pytest.fixture
+def listener(server, settings):
+  """A server with the listener enabled and a small body limit."""
+  settings('user', 'api-listener-enabled', 'true')
+  settings('listener', 'max_body_bytes', '4096')
+  return server
+
+
+def post(server, body):
+  status, _, response = server.request('POST', '/load_ansible_vars', body, {'Content-Type': 'application/json'})
+  return status, json.loads(response)
+
+
+def test_oversized_body_is_refused_with_413(listener):
+  body = push_body(text=json.dumps({'a': 'x' * 4096}))
+  status, response = post(listener, body)
+  assert status == 413
+  assert str(len(body)) in response['message']
+  assert not os.path.exists(playground.JSON_HISTORY_PATH)
+
+
+def test_push_within_limit_is_stored(listener):
+  body = push_body(text='{"a": 1, "b": [2]}')
+  status, response = post(listener, body)
+  assert status == 200 and response['variables_count'] == 2
+  entry = playground.read_history_file()[0][-1]
+  assert entry['input_blob'] == old_ingest(body)[1]
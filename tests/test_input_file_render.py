@@ -0,0 +1,63 @@
+"""/render against a file of the input files directory (input_file=<name>)."""
+
+import json
+import os
+from urllib.parse import urlencode
+
+import pytest
+
+import ansible_jinja2_playground as playground
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+@pytest.fixture
+def inputs(server, settings, tmp_path):
+  directory = tmp_path / 'inputs'
+  directory.mkdir()
+  settings('input_files', 'directory', str(directory))
+  return directory
+
+
+def render(server, **fields):
+  status, _, body = server.request('POST', '/render', urlencode(fields), FORM)
+  return status, body.decode('utf-8')
+
+
+def test_render_by_input_file(server, inputs):
+  (inputs / 'vars.yml').write_text('name: web01\nports: [80, 443]\n')
+  assert render(server, input_file='vars.yml', expr='{{ name }}:{{ ports | join(",") }}') == (200, 'web01:80,443')
+  entry = playground.read_history_file()[0][-1]
+  assert entry['input'] == 'name: web01\nports: [80, 443]\n'
+  assert entry['expr'] == '{{ name }}:{{ ports | join(",") }}'
+
+
+def test_changed_file_is_parsed_again(server, inputs):
+  path = inputs / 'vars.json'
+  path.write_text('{"n": 1}')
+  assert render(server, input_file='vars.json', expr='{{ n }}') == (200, '1')
+  path.write_text('{"n": 22}')
+  stat = os.stat(path)
+  os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+  assert render(server, input_file='vars.json', expr='{{ n }}') == (200, '22')
+
+
+def test_large_file_is_recorded_as_a_blob(server, inputs):
+  text = json.dumps({'a': 'x' * playground.BLOB_MIN_BYTES})
+  (inputs / 'large.json').write_text(text)
+  assert render(server, input_file='large.json', expr='{{ a | length }}') == (200, str(playground.BLOB_MIN_BYTES))
+  entry = playground.read_history_file()[0][-1]
+  assert 'input' not in entry
+  assert playground.BLOB_STORE.get_text(entry['input_blob']) == text
+
+
+@pytest.mark.parametrize('name, status', [('../secret.json', 403), ('missing.json', 404)])
+def test_bad_input_file(server, inputs, name, status):
+  (inputs.parent / 'secret.json').write_text('{"secret": 1}')
+  code, body = render(server, input_file=name, expr='{{ secret }}')
+  assert code == status and body.startswith('Input file error:')
+
+
+def test_input_directory_not_configured(server, settings):
+  settings('input_files', 'directory', '')
+  assert render(server, input_file='vars.json', expr='{{ a }}') == (404, 'Input file error: Input directory not configured')
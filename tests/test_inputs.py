@@ -0,0 +1,127 @@
+"""Input files catalog: listings, lookups and Range headers."""
+
+import os
+import shutil
+import time
+
+import pytest
+
+from playground_inputs import InputCatalog, InputFileError, RangeNotSatisfiable, _inotify_libc, parse_range
+
+
+@pytest.fixture
+def catalog():
+  # Poll every time so each call sees the directory as it is
+  return InputCatalog(watch='poll', poll_interval=0)
+
+
+class DictCache(dict):
+  def put(self, key, value, size):
+    self[key] = value
+
+
+def touch_directory(directory):
+  """Move the directory mtime forward, as a change within one timestamp tick could go unnoticed."""
+  st = os.stat(directory)
+  os.utime(directory, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_polled_listing_is_kept_for_the_poll_interval(tmp_path):
+  catalog = InputCatalog(watch='poll', poll_interval=3600)
+  (tmp_path / 'a.json').write_text('{}')
+  assert catalog.files(str(tmp_path)) == ['a.json']
+  (tmp_path / 'b.json').write_text('{}')
+  touch_directory(tmp_path)
+  assert catalog.files(str(tmp_path)) == ['a.json']
+  catalog.poll_interval = 0
+  assert catalog.files(str(tmp_path)) == ['a.json', 'b.json']
+  shutil.rmtree(tmp_path)
+  assert catalog.files(str(tmp_path)) == []
+
+
+@pytest.mark.skipif(_inotify_libc() is None, reason='inotify is not available')
+def test_watched_listing_follows_changes(tmp_path):
+  catalog = InputCatalog(watch='auto', poll_interval=3600)
+  assert catalog.files(str(tmp_path)) == []
+  (tmp_path / 'a.json').write_text('{}')
+  deadline = time.monotonic() + 5
+  while catalog.files(str(tmp_path)) != ['a.json']:
+    assert time.monotonic() < deadline, 'change not noticed'
+    time.sleep(0.01)
+  catalog._stop_watch()
+
+
+def test_contents_are_cached_per_file_version(tmp_path, catalog):
+  catalog.cache = DictCache()
+  path = tmp_path / 'a.json'
+  path.write_text('{"v": 1}')
+  entry = catalog.lookup(str(tmp_path), 'a.json')
+  assert catalog.read(entry) == b'{"v": 1}'
+  assert catalog.cache == {entry.key: b'{"v": 1}'}
+  path.write_text('{"v": 22}')
+  touch_directory(tmp_path)
+  assert catalog.read(catalog.lookup(str(tmp_path), 'a.json')) == b'{"v": 22}'
+
+
+def test_lookup_refuses_file_swapped_for_outside_symlink(tmp_path, catalog):
+  directory, outside = tmp_path / 'inputs', tmp_path / 'secret.json'
+  directory.mkdir()
+  outside.write_text('{"secret": 1}')
+  (directory / 'a.json').write_text('{"a": 1}')
+  assert catalog.lookup(str(directory), 'a.json').size == 8
+  # Swapped after the scan, before the catalog notices the directory changed
+  catalog.poll_interval = 3600
+  os.remove(directory / 'a.json')
+  os.symlink(outside, directory / 'a.json')
+  with pytest.raises(InputFileError) as error:
+    catalog.lookup(str(directory), 'a.json')
+  assert error.value.status == 403
+
+
+def test_lookup_resolves_inside_symlink(tmp_path, catalog):
+  (tmp_path / 'a.json').write_text('{"a": 1}')
+  os.symlink(tmp_path / 'a.json', tmp_path / 'b.json')
+  entry = catalog.lookup(str(tmp_path), 'b.json')
+  assert entry.path == os.path.realpath(tmp_path / 'a.json')
+  assert catalog.read(entry) == b'{"a": 1}'
+
+
+@pytest.mark.parametrize('filename', ['', '../a.json', 'sub/a.json', '..'])
+def test_lookup_refuses_unsafe_names(tmp_path, catalog, filename):
+  with pytest.raises(InputFileError) as error:
+    catalog.lookup(str(tmp_path), filename)
+  assert error.value.status == 403
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-9', (0, 10)),
+    ('bytes=10-10', (10, 11)),
+    ('bytes=50-500', (50, 100)),
+    ('bytes=90-', (90, 100)),
+    ('bytes=0-', (0, 100)),
+    ('bytes=-10', (90, 100)),
+    ('bytes=-500', (0, 100)),
+    (' bytes=1-2 ', (1, 3)),
+    # The whole file is sent for no header, several ranges or other units
+    (None, None),
+    ('', None),
+    ('bytes=-', None),
+    ('bytes=0-1,5-6', None),
+    ('items=0-9', None),
+    ('bytes=a-b', None),
+])
+def test_parse_range(header, expected):
+  assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize('header, size', [
+    ('bytes=100-', 100),
+    ('bytes=200-300', 100),
+    ('bytes=5-2', 100),
+    ('bytes=-0', 100),
+    ('bytes=0-', 0),
+    ('bytes=-10', 0),
+])
+def test_parse_range_unsatisfiable(header, size):
+  with pytest.raises(RangeNotSatisfiable):
+    parse_range(header, size)
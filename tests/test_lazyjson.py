@@ -0,0 +1,94 @@
+"""Lazily parsed JSON inputs must render exactly like fully parsed ones."""
+
+import json
+
+import pytest
+
+import ansible_jinja2_playground as playground
+from playground_lazyjson import LazyIndex, LazyJSONError, LazyObject, index_object
+
+INPUT = {
+    'a': {'b': [1, 2, {'c': 'd'}]},
+    'decoded': 'input key, not a wrapper attribute',
+    'users': [{'name': 'alice'}, {'name': 'bob'}],
+    'text': 'café "quoted" \\ slash',
+    'n': None,
+}
+
+TEMPLATES = [
+    "{{ data | combine({'z': 1}) }}",
+    '{{ data | to_nice_yaml }}',
+    '{{ data | to_json }}',
+    '{{ data.decoded }}',
+    "{{ data['a'].b[2].c }}",
+    '{{ data | dict2items | map(attribute="key") | list }}',
+    '{{ data.keys() | list }}',
+    '{{ a.b | length }} {{ decoded }} {{ text }}',
+    '{{ users | map(attribute="name") | join(",") }}',
+    '{% for k, v in data.items() %}{{ k }}={{ v is none }};{% endfor %}',
+]
+
+
+@pytest.fixture
+def parse(monkeypatch):
+  """Parse text either fully or lazily, whatever its size."""
+  def parse(text, lazy):
+    monkeypatch.setattr(playground, 'LAZY_JSON_MIN_BYTES', 1 if lazy else len(text) + 1)
+    # Distinct keys so the input cache never hands one mode the other's result
+    return playground.parse_input(text, playground.RequestTimer(), key=('test', lazy, text))
+  return parse
+
+
+@pytest.mark.parametrize('template', TEMPLATES)
+def test_lazy_input_renders_like_small_input(parse, template):
+  text = json.dumps(INPUT)
+  data, _ = parse(text, lazy=False)
+  lazy, _ = parse(text, lazy=True)
+  assert isinstance(data, dict)
+  assert isinstance(lazy, LazyObject)
+  assert playground.render_template(template, lazy, 'JSON') == playground.render_template(template, data, 'JSON')
+
+
+@pytest.mark.parametrize('loop_variable', ['users', 'data.users', 'data.users | reverse | list'])
+def test_lazy_input_loops_like_small_input(parse, loop_variable):
+  text = json.dumps(INPUT)
+  data, _ = parse(text, lazy=False)
+  lazy, _ = parse(text, lazy=True)
+  template = '{{ item.name }} {{ data | length }}'
+  expected = playground.render_template(template, data, 'JSON', True, loop_variable)
+  assert playground.render_template(template, lazy, 'JSON', True, loop_variable) == expected
+
+
+def test_lazy_input_stays_lazy_without_data(parse):
+  lazy, _ = parse(json.dumps(INPUT), lazy=True)
+  output, _ = playground.render_template('{{ users[0].name }}', lazy, 'JSON')
+  assert output == 'alice'
+  assert len(lazy._values) == 1
+
+
+def test_index_object_offsets():
+  text = ' {"a": [1, {"b": "}"}], "c" : "x\\"y" , "d": {}} '
+  offsets = index_object(text)
+  assert {key: json.loads(text[start:end]) for key, (start, end) in offsets.items()} == json.loads(text)
+
+
+def test_lazy_object_is_read_only_mapping():
+  lazy = LazyIndex('{"x": 1, "y": [2]}').view()
+  assert dict(lazy) == {'x': 1, 'y': [2]}
+  assert 'x' in lazy and 'z' not in lazy
+  with pytest.raises(TypeError):
+    lazy['x'] = 2
+
+
+@pytest.mark.parametrize('text', ['[1, 2]', '{"a": 1', '{"a" 1}', '{"a": 1} x', '{"a": 1,}', ''])
+def test_index_object_rejects_malformed(text):
+  with pytest.raises(LazyJSONError):
+    index_object(text)
+
+
+@pytest.mark.parametrize('text', ['[1, 2]', '"text"', '42', '- a\n- b'])
+@pytest.mark.parametrize('template', ['static', '{{ data }}', '{{ a }}'])
+def test_non_mapping_input_is_rejected(parse, text, template):
+  data, input_format = parse(text, lazy=True)
+  with pytest.raises(ValueError, match='Input must be an object/mapping, got (list|str|int)'):
+    playground.render_template(template, data, input_format)
@@ -0,0 +1,41 @@
+"""load_test.py: request bodies, the scenario mix and a short run against the server."""
+
+import json
+from urllib.parse import parse_qs
+
+import pytest
+
+from load_test import LoadTester, build_scenarios, parse_mix, percentile, render_body
+
+
+def test_render_body_carries_the_request_number():
+  body = render_body({'a': 1}, '{{ a }} {{ request }}', 'items')
+  form = {key: values[0] for key, values in parse_qs(body(42).decode()).items()}
+  assert json.loads(form['json']) == {'a': 1, 'request': 42}
+  assert form['expr'] == '{{ a }} {{ request }}'
+  assert (form['enable_loop'], form['loop_variable']) == ('true', 'items')
+  assert body(1) != body(2)
+
+
+def test_parse_mix():
+  assert parse_mix('render_small=3, history_poll,') == [('render_small', 3), ('history_poll', 1)]
+
+
+def test_percentile():
+  assert percentile([0.1, 0.2, 0.3], 99) == 0.3
+  assert percentile([], 50) == 0.0
+
+
+def test_unknown_scenarios_are_rejected():
+  with pytest.raises(ValueError, match='Unknown scenarios in mix: nope'):
+    LoadTester('http://127.0.0.1:1', build_scenarios(4), [('nope', 1)])
+
+
+def test_run_against_the_server(server):
+  base_url = 'http://%s:%d' % server.address
+  mix = [('render_small', 3), ('render_loop', 1), ('history_poll', 1)]
+  tester = LoadTester(base_url, build_scenarios(4), mix, concurrency=2)
+  report = tester.run(max_requests=12)
+  assert report['overall']['requests'] == 12
+  assert report['overall']['errors'] == 0, report['error_messages']
+  assert sum(s['requests'] for s in report['scenarios'].values()) == 12
@@ -0,0 +1,35 @@
+"""Memoization of pure filters."""
+
+import ansible_jinja2_playground as playground
+from playground_memo import FilterMemo
+
+
+class Cache(dict):
+  def put(self, key, value):
+    self[key] = value
+
+
+def test_disable_restores_original_filters():
+  calls = []
+
+  def upper(value):
+    calls.append(value)
+    return value.upper()
+
+  filters = {'to_json': upper, 'lower': str.lower}
+  memo = FilterMemo('global', Cache(), 16)
+  memo.install(filters)
+  assert filters['to_json']('a') == filters['to_json']('a') == 'A' and calls == ['a']
+  memo.disable(filters)
+  assert filters == {'to_json': upper, 'lower': str.lower} and memo.mode == 'off'
+
+
+def test_global_memo_calls_are_counted_once():
+  memo = FilterMemo('global', playground.FILTER_MEMO.cache, 16, playground.FILTER_MEMO_CALLS.inc)
+  filters = {'md5': lambda value: value * 2}
+  memo.install(filters)
+  before = [playground.CACHE_REQUESTS.get('filter_memo', result) for result in ('hit', 'miss')]
+  calls = [playground.FILTER_MEMO_CALLS.get('md5', result) for result in ('hit', 'miss')]
+  assert filters['md5']('counted once') == filters['md5']('counted once') == 'counted oncecounted once'
+  assert [playground.FILTER_MEMO_CALLS.get('md5', result) for result in ('hit', 'miss')] == [calls[0] + 1, calls[1] + 1]
+  assert [playground.CACHE_REQUESTS.get('filter_memo', result) for result in ('hit', 'miss')] == before
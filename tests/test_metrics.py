@@ -0,0 +1,58 @@
+"""playground_metrics.py and the /metrics endpoint."""
+
+from playground_metrics import CONTENT_TYPE, MetricsRegistry
+
+
+def test_counter_and_gauge_exposition():
+  registry = MetricsRegistry()
+  counter = registry.counter('requests_total', 'Requests.', ('path',))
+  gauge = registry.gauge('entries', 'Entries.')
+  counter.inc('/a')
+  counter.inc('/a', amount=2)
+  counter.inc('say "hi"\n')
+  gauge.set(1.5)
+  assert counter.get('/a') == 3
+  assert registry.render() == (
+      '# HELP requests_total Requests.\n'
+      '# TYPE requests_total counter\n'
+      'requests_total{path="/a"} 3\n'
+      'requests_total{path="say \\"hi\\"\\n"} 1\n'
+      '# HELP entries Entries.\n'
+      '# TYPE entries gauge\n'
+      'entries 1.5\n')
+
+
+def test_collected_gauge():
+  registry = MetricsRegistry()
+  registry.gauge('size', 'Size.', collect=lambda: 42)
+  registry.gauge('broken', 'Broken.', collect=lambda: 1 / 0)
+  lines = registry.render().splitlines()
+  assert 'size 42' in lines
+  assert not [line for line in lines if line.startswith('broken ')]
+
+
+def test_histogram_buckets_are_cumulative():
+  registry = MetricsRegistry()
+  histogram = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+  for value in (0.05, 0.1, 0.5, 2.0):
+    histogram.observe(value)
+  lines = registry.render().splitlines()[2:]
+  assert lines == [
+      'latency_seconds_bucket{le="0.1"} 2',
+      'latency_seconds_bucket{le="1"} 3',
+      'latency_seconds_bucket{le="+Inf"} 4',
+      'latency_seconds_sum 2.65',
+      'latency_seconds_count 4',
+  ]
+
+
+def test_metrics_endpoint(server):
+  server.request('GET', '/history')
+  server.request('GET', '/no-such-page')
+  status, headers, body = server.request('GET', '/metrics')
+  assert status == 200
+  assert headers['Content-type'] == CONTENT_TYPE
+  text = body.decode('utf-8')
+  assert 'playground_http_requests_total{endpoint="/history",method="GET",status="200"}' in text
+  assert 'playground_http_requests_total{endpoint="other",method="GET",status="404"}' in text
+  assert '# TYPE playground_http_request_duration_seconds histogram' in text
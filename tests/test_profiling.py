@@ -0,0 +1,46 @@
+"""Admin-gated profiling."""
+
+import json
+from urllib.parse import urlencode
+
+import pytest
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+@pytest.fixture
+def admin(server, settings):
+  settings('debug', 'admin_token', 'secret')
+  return server
+
+
+def profile_render(server, headers=None, **extra):
+  body = urlencode(dict({'expr': '{{ a | to_json }}', 'input': '{"a": 1}', 'profile': 'true'}, **extra)).encode()
+  return server.request('POST', '/render', body, dict(FORM, **(headers or {})))
+
+
+def test_profile_with_header_token(admin):
+  status, _, body = profile_render(admin, {'X-Admin-Token': 'secret'})
+  assert status == 200
+  response = json.loads(body)
+  assert response['output'] == '1' and response['profile']
+
+
+@pytest.mark.parametrize('headers, extra', [
+    ({}, {}),
+    ({'X-Admin-Token': 'wrong'}, {}),
+    ({}, {'admin_token': 'secret'}),
+])
+def test_profile_refused_without_header_token(admin, headers, extra):
+  assert profile_render(admin, headers, **extra)[0] == 403
+
+
+def test_sampler_ignores_query_token(admin):
+  assert admin.request('GET', '/debug/profile?seconds=0.01&admin_token=secret')[0] == 403
+  status, _, body = admin.request('GET', '/debug/profile?seconds=0.01', headers={'X-Admin-Token': 'secret'})
+  assert status == 200 and json.loads(body)
+
+
+def test_profiling_disabled_without_configured_token(server, settings):
+  settings('debug', 'admin_token', '')
+  assert profile_render(server, {'X-Admin-Token': ''})[0] == 403
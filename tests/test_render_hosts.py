@@ -0,0 +1,55 @@
+"""/render against many hosts at once (host_entry and host_file)."""
+
+import json
+from urllib.parse import urlencode
+
+import ansible_jinja2_playground as playground
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def render_hosts(server, expr, **selectors):
+  fields = [('expr', expr)] + [(name, value) for name, values in selectors.items() for value in values]
+  status, _, body = server.request('POST', '/render', urlencode(fields), FORM)
+  return status, json.loads(body)
+
+
+def save_hosts(*inputs):
+  playground.save_history([dict(entry, expr='') for entry in inputs])
+
+
+def test_hosts_are_grouped_by_output(server):
+  save_hosts({'id': 'e1', 'input': '{"inventory_hostname": "web01", "role": "web"}'},
+             {'id': 'e2', 'input': '{"inventory_hostname": "web02", "role": "web"}'},
+             {'id': 'e3', 'input': '{"role": "db"}'},
+             {'id': 'e4', 'input': '{"role": '})
+  status, answer = render_hosts(server, '{{ role | upper }}', host_entry=['e1', '1', '-2', 'e4'])
+  assert status == 200
+  assert [(r['host'], r['status']) for r in answer['hosts']] == [
+      ('web01', 'ok'), ('web02', 'ok'), ('history:e3', 'ok'), ('history:e4', 'error')]
+  assert [(group['status'], group['hosts']) for group in answer['groups']] == [
+      ('ok', ['web01', 'web02']), ('ok', ['history:e3']), ('error', ['history:e4'])]
+  assert answer['groups'][0]['output'] == 'WEB'
+  assert answer['groups'][2]['error'].startswith('Input parsing error')
+  assert answer['summary'] == {'hosts': 4, 'distinct_outputs': 2, 'errors': 1}
+
+
+def test_listener_pushes_and_input_files(server, settings, tmp_path):
+  inputs = tmp_path / 'inputs'
+  inputs.mkdir()
+  (inputs / 'a.yml').write_text('n: 1\n')
+  (inputs / 'b.json').write_text('{"n": 2}')
+  settings('input_files', 'directory', str(inputs))
+  save_hosts({'input': '{"n": 0}'}, {'id': 'p1', 'input': '{"n": 3}', 'source': 'listener'})
+  status, answer = render_hosts(server, '{{ n * 10 }}', host_entry=['listener', 'p1'], host_file=['*'])
+  assert status == 200
+  assert {r['host']: r['output'] for r in answer['hosts']} == {'history:p1': '30', 'file:a.yml': '10',
+                                                               'file:b.json': '20'}
+
+
+def test_unknown_hosts_and_limit(server, settings):
+  save_hosts({'input': '{"n": 0}'}, {'input': '{"n": 1}'})
+  assert render_hosts(server, '{{ n }}', host_entry=['nope']) == (404, {'error': 'History entry not found: nope'})
+  assert render_hosts(server, '{{ n }}', host_entry=['2'])[0] == 404
+  settings('render', 'max_hosts', '1')
+  assert render_hosts(server, '{{ n }}', host_entry=['0', '1']) == (413, {'error': '2 hosts exceed the limit of 1'})
@@ -0,0 +1,131 @@
+"""playground_renders.py: superseding renders per client and coalescing identical renders."""
+
+import threading
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+import ansible_jinja2_playground as playground
+from playground_renders import RenderFlights, RenderSlots, RenderSuperseded
+
+
+def test_newer_claim_supersedes_the_holder():
+  slots = RenderSlots()
+  first = slots.claim('tab', 1)
+  second = slots.claim('tab', 2)
+  with pytest.raises(RenderSuperseded):
+    first.check()
+  second.check()
+  # Arrived after a newer render took the slot
+  stale = slots.claim('tab', 1)
+  with pytest.raises(RenderSuperseded):
+    stale.check()
+  slots.release(first)
+  assert len(slots) == 1
+  slots.release(second)
+  assert len(slots) == 0
+
+
+def test_requests_without_client_are_never_superseded():
+  slots = RenderSlots()
+  first, second = slots.claim(''), slots.claim('')
+  first.check()
+  second.check()
+  assert len(slots) == 0
+
+
+def join(flights, key, ticket, compute, results):
+  """Run flights.run in a thread, appending (result, shared) or the error to results."""
+  def target():
+    try:
+      results.append(flights.run(key, ticket, compute))
+    except Exception as e:
+      results.append(e)
+
+  thread = threading.Thread(target=target)
+  thread.start()
+  return thread
+
+
+def wait_for_joiners(flights, key, count):
+  deadline = time.monotonic() + 5
+  while len(flights._flights[key].tickets) < count:
+    assert time.monotonic() < deadline
+    time.sleep(0.001)
+
+
+def test_identical_renders_share_one_computation():
+  flights, slots, release = RenderFlights(), RenderSlots(), threading.Event()
+  calls, results = [], []
+
+  def compute(check):
+    calls.append(1)
+    release.wait(5)
+    return 'out'
+
+  first = join(flights, 'k', slots.claim('a'), compute, results)
+  wait_for_joiners(flights, 'k', 1)
+  second = join(flights, 'k', slots.claim('b'), compute, results)
+  wait_for_joiners(flights, 'k', 2)
+  release.set()
+  first.join()
+  second.join()
+  assert len(calls) == 1
+  assert sorted(results) == [('out', False), ('out', True)]
+  assert flights._flights == {}
+
+
+def test_errors_are_shared():
+  flights, slots, release = RenderFlights(), RenderSlots(), threading.Event()
+  results = []
+
+  def compute(check):
+    release.wait(5)
+    raise ValueError('bad template')
+
+  threads = [join(flights, 'k', slots.claim('a'), compute, results)]
+  wait_for_joiners(flights, 'k', 1)
+  threads.append(join(flights, 'k', slots.claim('b'), compute, results))
+  wait_for_joiners(flights, 'k', 2)
+  release.set()
+  for thread in threads:
+    thread.join()
+  assert [str(e) for e in results] == ['bad template', 'bad template']
+
+
+def test_shared_render_stops_once_every_caller_is_superseded():
+  flights, slots = RenderFlights(), RenderSlots()
+  started, resume = threading.Event(), threading.Event()
+  checks, results = [], []
+
+  def compute(check):
+    started.set()
+    resume.wait(5)
+    checks.append('first')
+    check()
+    slots.claim('b', 2)
+    checks.append('second')
+    check()
+    return 'out'
+
+  first = join(flights, 'k', slots.claim('a', 1), compute, results)
+  started.wait(5)
+  second = join(flights, 'k', slots.claim('b', 1), compute, results)
+  wait_for_joiners(flights, 'k', 2)
+  slots.claim('a', 2)
+  resume.set()
+  first.join()
+  second.join()
+  assert checks == ['first', 'second']
+  assert [type(e) for e in results] == [RenderSuperseded, RenderSuperseded]
+
+
+def test_older_render_of_a_tab_is_refused(server):
+  ticket = playground.RENDER_SLOTS.claim('tab-1', 5)
+  try:
+    body = urlencode({'json': '{}', 'expr': 'x', 'client_id': 'tab-1', 'render_seq': '3'})
+    status, _, text = server.request('POST', '/render', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    assert (status, text) == (409, b'Render superseded by a newer request')
+  finally:
+    playground.RENDER_SLOTS.release(ticket)
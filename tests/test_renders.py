@@ -0,0 +1,47 @@
+"""Which templates may be served from the render result cache."""
+
+import pytest
+from jinja2 import Environment
+
+from playground_renders import is_deterministic
+
+env = Environment()
+
+
+@pytest.mark.parametrize('source', [
+    '{{ x | upper }}',
+    '{{ x | password_hash("sha512", "salt") }}',
+    '{{ "%Y" | strftime(0) }}',
+    '{{ x is string }}',
+    '{{ x | map("upper") | list }}',
+    '{{ x | map(attribute="name") | list }}',
+    '{{ x | selectattr("enabled") | list }}',
+    '{{ x | select("string") | list }}',
+])
+def test_deterministic(source):
+  assert is_deterministic(env.parse(source))
+
+
+@pytest.mark.parametrize('source', [
+    '{{ [1, 2] | random }}',
+    '{{ [1, 2] | shuffle }}',
+    '{{ lipsum() }}',
+    '{{ x | password_hash("sha512") }}',
+    '{{ "%Y" | strftime }}',
+    "{{ '/tmp/*' | fileglob }}",
+    "{{ '/tmp' | realpath }}",
+    "{{ '~' | expanduser }}",
+    "{{ '/tmp/x' is exists }}",
+    "{{ '/tmp' is directory }}",
+    "{% if '/etc/hosts' is file %}{% endif %}",
+    "{{ '/tmp/x' is link }}",
+    "{{ '/' is mount }}",
+    "{{ '/a' is same_file('/b') }}",
+    "{{ paths | select('is_file') | list }}",
+    "{{ paths | reject('exists') | list }}",
+    "{{ items | selectattr('path', 'directory') | list }}",
+    "{{ paths | map('realpath') | list }}",
+    "{{ paths | select(test_name) | list }}",
+])
+def test_volatile(source):
+  assert not is_deterministic(env.parse(source))
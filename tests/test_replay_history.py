@@ -0,0 +1,57 @@
+"""replay_history.py: entry selection, baselines and option validation."""
+
+import json
+import sys
+
+import pytest
+
+import replay_history
+from replay_history import compare, load_baseline, save_baseline, select_entries
+
+HISTORY = [
+  {'expr': '{{ a }}', 'datetime': '2024-01-01T00:00:00'},
+  {'input': '{"a": 1}'},
+  {'expr': '{{ b | upper }}', 'datetime': '2024-02-01T00:00:00'},
+  {'expr': '{{ a + 1 }}', 'datetime': '2024-03-01T00:00:00'},
+]
+
+
+def result(status='ok', signature='s1', **fields):
+  fields.setdefault('output' if status == 'ok' else 'error', 'x')
+  return dict({'index': 0, 'signature': signature, 'expr': '{{ a }}', 'status': status, 'deterministic': True,
+               'recorded': None}, **fields)
+
+
+def test_select_entries_skips_listener_pushes_and_filters():
+  assert [i for i, _ in select_entries(HISTORY)] == [0, 2, 3]
+  assert [i for i, _ in select_entries(HISTORY, match=r'\ba\b')] == [0, 3]
+  assert [i for i, _ in select_entries(HISTORY, since='2024-02-01')] == [2, 3]
+  assert [i for i, _ in select_entries(HISTORY, limit=1)] == [3]
+
+
+@pytest.mark.parametrize('limit', ['0', '-1'])
+def test_limit_must_be_positive(monkeypatch, capsys, limit):
+  monkeypatch.setattr(sys, 'argv', ['replay_history.py', '--limit', limit])
+  with pytest.raises(SystemExit) as exc:
+    replay_history.main()
+  assert exc.value.code == 2
+  assert 'must be at least 1' in capsys.readouterr().err
+
+
+def test_baseline_round_trip(tmp_path):
+  path = str(tmp_path / 'baseline.json')
+  save_baseline(path, [result(output='1'), result('error', 's2', error='TypeError: nope')])
+  assert json.loads(open(path).read())['outputs'] == {'s1': {'status': 'ok', 'output': '1'},
+                                                     's2': {'status': 'error', 'error': 'TypeError: nope'}}
+  baseline = load_baseline(path)
+  assert compare(result(output='1'), baseline) == 'same'
+  assert compare(result(output='2'), baseline) == 'changed'
+  assert compare(result('error'), baseline) == 'broken'
+  assert compare(result(signature='s2', output='1'), baseline) == 'fixed'
+  assert compare(result(signature='s3'), baseline) == 'no_baseline'
+
+
+def test_compare_uses_recorded_output_without_baseline():
+  assert compare(result(output='1', recorded='1'), None) == 'same'
+  assert compare(result(output='1'), None) == 'no_baseline'
+  assert compare(result(deterministic=False, recorded='2'), None) == 'volatile'
@@ -0,0 +1,73 @@
+"""Render result cache: one lookup per render, one stored copy per result."""
+
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+import ansible_jinja2_playground as playground
+
+
+@pytest.fixture
+def cache(monkeypatch):
+  """An empty result cache, returning the lookups counted since the test started."""
+  monkeypatch.setattr(playground, 'RESULT_CACHE', playground.LRUCache('render_result', 64, 1 << 20))
+  before = {result: playground.CACHE_REQUESTS.get('render_result', result) for result in ('hit', 'miss')}
+  return lambda: {result: playground.CACHE_REQUESTS.get('render_result', result) - count
+                  for result, count in before.items()}
+
+
+def render(server, expr, variables):
+  body = urlencode({'expr': expr, 'input': variables}).encode()
+  status, headers, output = server.request('POST', '/render', body,
+                                           {'Content-Type': 'application/x-www-form-urlencoded'})
+  assert status == 200, output
+  return headers, output.decode()
+
+
+def test_each_render_is_one_lookup(server, cache):
+  expr = '{{ a }} is {{ a * 2 }}'
+  renders = [
+      '{"a": 1, "b": 1}',
+      '{"a": 1, "b": 1}',   # same input
+      '{"a": 1, "b": 2}',   # only an unread variable differs
+      '{"a": 2, "b": 1}',
+  ]
+  outputs = [render(server, expr, variables) for variables in renders]
+  assert [output for _, output in outputs] == ['1 is 2', '1 is 2', '1 is 2', '2 is 4']
+  assert [headers.get('X-Render-Cache') for headers, _ in outputs] == [None, 'hit', 'hit', None]
+  assert cache() == {'hit': 2, 'miss': 2}
+
+
+def test_result_is_charged_once(server, cache):
+  render(server, '{{ a }}', '{"a": "' + 'x' * 1000 + '", "b": 1}')
+  render(server, '{{ a }}', '{"a": "' + 'x' * 1000 + '", "b": 2}')
+  # Two exact-input keys and one dependency key share one payload
+  assert playground.RESULT_CACHE._bytes == 1000
+  assert len(playground.RESULT_CACHE._data) == 3
+
+
+def test_alias_follows_its_entry():
+  cache = playground.LRUCache('alias_test', 8, count_requests=False)
+  cache.put('a', 'value', 5)
+  cache.alias('b', 'a')
+  cache.alias('c', 'b')
+  cache.alias('x', 'missing')
+  assert cache.get('b') == cache.get('c') == 'value' and cache.get('x') is None
+  assert cache._bytes == 5
+  # Once the entry is evicted its aliases miss and are dropped
+  del cache._data['a']
+  assert cache.get('b') is None and 'b' not in cache._data
+
+
+def test_cold_compile_is_timed(server, cache, monkeypatch):
+  from_string = playground.env.from_string
+
+  def slow_compile(source):
+    time.sleep(0.05)
+    return from_string(source)
+
+  monkeypatch.setattr(playground.env, 'from_string', slow_compile)
+  headers, _ = render(server, '{{ a }} compiled cold', '{"a": 1}')
+  phases = dict(item.split(';dur=') for item in headers['Server-Timing'].split(', '))
+  assert float(phases['compile']) >= 50
@@ -0,0 +1,48 @@
+"""Atomic writes of the history and configuration files."""
+
+import os
+import stat
+
+import pytest
+
+from playground_storage import atomic_write
+
+
+@pytest.fixture
+def umask():
+  previous = os.umask(0o027)
+  yield 0o027
+  os.umask(previous)
+
+
+def mode(path):
+  return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_new_file_gets_open_permissions(tmp_path, umask):
+  path = tmp_path / 'conf' / 'a.conf'
+  atomic_write(str(path), lambda f: f.write('x'))
+  assert path.read_text() == 'x'
+  assert mode(path) == 0o666 & ~umask
+  assert os.umask(umask) == umask
+
+
+def test_existing_file_keeps_its_permissions(tmp_path, umask):
+  path = tmp_path / 'a.conf'
+  path.write_text('old')
+  os.chmod(path, 0o600)
+  atomic_write(str(path), lambda f: f.write('new'))
+  assert path.read_text() == 'new' and mode(path) == 0o600
+
+
+def test_failed_write_leaves_file_untouched(tmp_path):
+  path = tmp_path / 'a.conf'
+  path.write_text('old')
+
+  def fail(f):
+    f.write('partial')
+    raise RuntimeError('disk full')
+
+  with pytest.raises(RuntimeError):
+    atomic_write(str(path), fail)
+  assert os.listdir(tmp_path) == ['a.conf'] and path.read_text() == 'old'
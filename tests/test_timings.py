@@ -0,0 +1,57 @@
+"""Request phase timers, the Server-Timing header and /timings."""
+
+import json
+import time
+import uuid
+from urllib.parse import urlencode
+
+import pytest
+
+import ansible_jinja2_playground as playground
+
+
+@pytest.fixture
+def stats(monkeypatch):
+  monkeypatch.setattr(playground, 'TIMING_STATS', playground.TimingStats())
+  return playground.TIMING_STATS
+
+
+def server_timing(header):
+  return {name: float(duration) for name, duration in (item.split(';dur=') for item in header.split(', '))}
+
+
+def test_repeated_phases_accumulate():
+  timer = playground.RequestTimer()
+  for _ in range(2):
+    with timer.phase('render'):
+      time.sleep(0.01)
+  with pytest.raises(ValueError), timer.phase('parse'):
+    raise ValueError('timed anyway')
+  phases = server_timing(timer.server_timing())
+  assert list(phases) == ['render', 'parse', 'total']
+  assert phases['render'] >= 20 and phases['total'] >= phases['render'] + phases['parse']
+
+
+def test_stats_aggregate_per_endpoint_and_phase(stats):
+  for duration in (0.001, 0.003):
+    timer = playground.RequestTimer()
+    timer.phases['render'] = duration
+    stats.record('/render', timer)
+  render = stats.snapshot()['/render']['render']
+  assert render == {'count': 2, 'total_ms': 4.0, 'avg_ms': 2.0, 'max_ms': 3.0}
+  stats.reset()
+  assert stats.snapshot() == {}
+
+
+def test_render_reports_its_phases(server, stats):
+  # A new input, so it is not answered from the input or result caches
+  body = urlencode({'json': json.dumps({'a': uuid.uuid4().hex}), 'expr': '{{ a }} timed'})
+  status, headers, _ = server.request('POST', '/render', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+  assert status == 200
+  assert {'read_body', 'parse_json', 'compile', 'render', 'history', 'total'} <= set(server_timing(headers['Server-Timing']))
+  status, _, body = server.request('GET', '/timings')
+  snapshot = json.loads(body)
+  assert snapshot['/render']['total']['count'] == 1
+  assert snapshot['/render']['render']['count'] == 1
+  server.request('GET', '/timings?reset=true')
+  assert list(json.loads(server.request('GET', '/timings')[2])) == ['/timings']
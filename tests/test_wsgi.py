@@ -0,0 +1,97 @@
+"""WSGI entry point: request translation and settings shared between workers."""
+
+import configparser
+import io
+import json
+import wsgiref.util
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import ansible_jinja2_playground as playground
+from playground_wsgi import WSGIApplication
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+  def do_GET(self):
+    body = json.dumps({'path': self.path, 'accept': self.headers.get('Accept')}).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Connection', 'close')
+    self.end_headers()
+    self.wfile.write(body)
+
+
+def call(app, path_info, query='', method='GET', body=b'', **environ):
+  """Run one request through a WSGI application. Returns (status, headers, body)."""
+  env = {'REQUEST_METHOD': method, 'PATH_INFO': path_info, 'QUERY_STRING': query,
+         'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body)}
+  env.update(environ)
+  wsgiref.util.setup_testing_defaults(env)
+  started = {}
+  chunks = []
+
+  def start_response(status, headers, exc_info=None):
+    started.update(status=status, headers=dict(headers))
+    return chunks.append
+
+  chunks.extend(app(env, start_response))
+  return started['status'], started['headers'], b''.join(chunks)
+
+
+def latin1(text):
+  """A path as a WSGI server passes it in PATH_INFO (PEP 3333)."""
+  return text.encode('utf-8').decode('latin-1')
+
+
+@pytest.mark.parametrize('path_info, query, expected', [
+    ('/render', '', '/render'),
+    (latin1('/inputs/é.json'), '', '/inputs/%C3%A9.json'),
+    ('/a b/100%', 'x=%C3%A9&y=1', '/a%20b/100%25?x=%C3%A9&y=1'),
+    ('/what?', '', '/what%3F'),
+])
+def test_path_translation(path_info, query, expected):
+  status, headers, body = call(WSGIApplication(EchoHandler), path_info, query, HTTP_ACCEPT='text/plain')
+  assert status == '200 OK'
+  assert json.loads(body) == {'path': expected, 'accept': 'text/plain'}
+  # Hop-by-hop headers are left to the WSGI server
+  assert 'Connection' not in headers
+
+
+def test_playground_application(isolated):
+  status, headers, body = call(playground.application, '/history/maxsize')
+  assert status == '200 OK' and headers['Content-type'] == 'application/json'
+  assert json.loads(body) == {'max_size': playground.MAX_ENTRIES}
+
+
+@pytest.fixture
+def conf_file(tmp_path, monkeypatch, settings):
+  """Point the playground at a copy of its configuration, restoring the options the test changes."""
+  path = tmp_path / 'playground.conf'
+  monkeypatch.setattr(playground, 'CONF_PATH', str(path))
+  monkeypatch.setattr(playground, 'MAX_ENTRIES', playground.MAX_ENTRIES)
+  monkeypatch.setattr(playground, 'CONFIG_STAMP', playground.CONFIG_STAMP)
+  for section, option in (('history', 'max_entries'), ('user', 'api-listener-enabled')):
+    settings(section, option, playground.config.get(section, option))
+  playground.save_config()
+  return path
+
+
+def test_settings_saved_by_another_worker_apply(conf_file, isolated):
+  # Another worker saves new settings: this one picks them up on its next request
+  other = configparser.ConfigParser()
+  other.read(conf_file)
+  other.set('history', 'max_entries', '7')
+  other.set('user', 'api-listener-enabled', 'false')
+  with open(conf_file, 'w', encoding='utf-8') as f:
+    other.write(f)
+  status, _, body = call(playground.application, '/history/maxsize')
+  assert json.loads(body) == {'max_size': 7}
+  assert playground.config.getboolean('user', 'api-listener-enabled') is False
+
+
+def test_unchanged_file_is_not_read_again(conf_file, isolated, monkeypatch):
+  reads = []
+  monkeypatch.setattr(playground.config, 'read', lambda *args, **kwargs: reads.append(args))
+  call(playground.application, '/history/maxsize')
+  assert reads == []